@@ -0,0 +1,165 @@
+"""
+TubeGrab - Admission control
+Decides whether new work is let in, so overload turns into quick 429 answers
+with a Retry-After instead of timeouts and a host out of memory or disk.
+"""
+
+import math
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class TokenBucket:
+    """Allows `rate` requests per second on average, with bursts of up to `burst`"""
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def take(self, cost, now):
+        """Spend cost tokens. Returns 0 if they were there, else seconds until they will be."""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0
+        return (cost - self.tokens) / self.rate
+
+
+class AdmissionController:
+    """
+    Turns away new work while the system is saturated, and clients going over
+    their own quota. check() returns None to admit, else seconds to Retry-After.
+
+    `load()` must return (queued, running, workers) for the download stage.
+    Downloads are refused while all workers are busy and `max_queued` jobs are
+    already waiting, or while the download folder has less than `min_free_disk`
+    bytes free. Info lookups are refused while `max_info_inflight` extractions
+    run. Retry-After comes from the EWMA of the stage's recent durations.
+
+    Each client also gets a token bucket of `client_rate` requests per second
+    with bursts of `client_burst` (a client_rate of 0 turns this off).
+    """
+
+    # Weight of the newest duration in the running averages
+    EWMA_ALPHA = 0.2
+    # Assumed stage durations until some have been seen
+    DEFAULT_LATENCY = {'info': 5.0, 'download': 60.0}
+    MAX_RETRY_AFTER = 300
+    # Seconds a load/free disk reading is reused
+    LOAD_INTERVAL = 1.0
+
+    def __init__(self, load, disk_path, max_queued=50, min_free_disk=0, max_info_inflight=8,
+                 client_rate=1.0, client_burst=20, max_clients=10000):
+        self.load = load
+        self.disk_path = disk_path
+        self.max_queued = max_queued
+        self.min_free_disk = min_free_disk
+        self.max_info_inflight = max_info_inflight
+        self.client_rate = client_rate
+        self.client_burst = client_burst
+        self.max_clients = max_clients
+        self._lock = threading.Lock()
+        self._clients = OrderedDict()
+        self._latency = {}
+        self._inflight = {}
+        self._snapshot = None
+        self._snapshot_at = 0.0
+        self.rejected = {'overload': 0, 'disk': 0, 'quota': 0}
+
+    def check(self, kind, client, cost=1):
+        """Admit `cost` units of `kind` ('info' or 'download') work from client, or say when to retry"""
+        retry_after, reason = self._system_retry(kind, cost)
+        if retry_after is None and self.client_rate:
+            retry_after, reason = self._client_retry(client, cost), 'quota'
+        if not retry_after:
+            return None
+        with self._lock:
+            self.rejected[reason] += 1
+        return max(1, min(self.MAX_RETRY_AFTER, math.ceil(retry_after)))
+
+    @contextmanager
+    def track(self, stage):
+        """Count a piece of stage work as in flight, and feed its duration into the stage's average"""
+        with self._lock:
+            self._inflight[stage] = self._inflight.get(stage, 0) + 1
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            with self._lock:
+                self._inflight[stage] -= 1
+                previous = self._latency.get(stage)
+                self._latency[stage] = elapsed if previous is None else (
+                    previous + self.EWMA_ALPHA * (elapsed - previous))
+
+    def latency(self, stage):
+        with self._lock:
+            return self._latency.get(stage, self.DEFAULT_LATENCY.get(stage, 1.0))
+
+    def stats(self):
+        queued, running, workers, free_disk = self._readings()
+        with self._lock:
+            return {
+                'queued': queued,
+                'running': running,
+                'workers': workers,
+                'free_disk': free_disk,
+                'inflight': dict(self._inflight),
+                'latency': {stage: round(seconds, 3) for stage, seconds in self._latency.items()},
+                'clients': len(self._clients),
+                'rejected': dict(self.rejected),
+            }
+
+    def _system_retry(self, kind, cost):
+        if kind == 'info':
+            with self._lock:
+                inflight = self._inflight.get('info', 0)
+            if inflight >= self.max_info_inflight:
+                return self.latency('info'), 'overload'
+            return None, None
+
+        queued, running, workers, free_disk = self._readings()
+        if free_disk is not None and free_disk < self.min_free_disk:
+            # Finished files are expired by the janitor, give it a round
+            return 60, 'disk'
+        excess = queued + cost - self.max_queued
+        if running >= workers and excess > 0:
+            # Roughly when enough of the queue ahead will have drained
+            return excess * self.latency('download') / max(1, workers), 'overload'
+        return None, None
+
+    def _client_retry(self, client, cost):
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._clients.pop(client, None)
+            if bucket is None:
+                bucket = TokenBucket(self.client_rate, self.client_burst, now)
+            self._clients[client] = bucket  # Most recently used last
+            while len(self._clients) > self.max_clients:
+                self._clients.popitem(last=False)
+            # A batch bigger than the burst can never fit - let it in on a full bucket
+            return bucket.take(min(cost, self.client_burst), now)
+
+    def _readings(self):
+        # (queued, running, workers, free disk bytes), refreshed at most every LOAD_INTERVAL
+        now = time.monotonic()
+        with self._lock:
+            if self._snapshot is not None and now - self._snapshot_at < self.LOAD_INTERVAL:
+                return self._snapshot
+        queued, running, workers = self.load()
+        try:
+            free_disk = shutil.disk_usage(self.disk_path).free
+        except OSError:
+            free_disk = None
+        with self._lock:
+            self._snapshot = (queued, running, workers, free_disk)
+            self._snapshot_at = now
+            return self._snapshot
@@ -0,0 +1,229 @@
+"""
+TubeGrab - Serverless info core
+Shared by the api/info.py and api/info-simple.py functions. Lookups are tiered:
+YouTube's oEmbed endpoint answers title/channel/thumbnail quickly, and the full
+yt-dlp extraction (imported only when first needed) runs only when the caller
+asks for duration, views or description. Results, the oEmbed keep-alive
+connection and the YoutubeDL instance live at module level, so warm instances
+reuse them across requests.
+"""
+
+import http.client
+import importlib.util
+import json
+import os
+import re
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import quote, urlsplit
+
+# Overridable so benchmarks can point at a local stub
+OEMBED_URL = os.environ.get('TUBEGRAB_OEMBED_URL', 'https://www.youtube.com/oembed')
+HTTP_TIMEOUT = 10
+
+CACHE_TTL = 600
+CACHE_SIZE = 256
+
+BASIC_FIELDS = ('title', 'thumbnail', 'channel')
+# Fields only a full extraction provides
+FULL_FIELDS = ('duration', 'views', 'description')
+ALL_FIELDS = BASIC_FIELDS + FULL_FIELDS
+
+_cache = OrderedDict()     # video ID (or URL) -> (expires, full?, result)
+_cache_lock = threading.Lock()
+_connection = None         # Keep-alive connection to the oEmbed host
+_connection_lock = threading.Lock()
+_ydl = None                # Warm YoutubeDL, built on the first full extraction
+_ydl_lock = threading.Lock()
+
+
+class LookupFailed(Exception):
+    """The video couldn't be looked up; status is the HTTP status to answer with"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def extract_video_id(url):
+    match = re.search(
+        r'(?:youtube\.com\/watch\?v=|youtu\.be\/|youtube\.com\/embed\/|youtube\.com\/v\/|youtube\.com\/shorts\/)([^&\n?#]+)',
+        url
+    )
+    return match.group(1) if match else None
+
+
+def lookup(url, fields=ALL_FIELDS, other_sites=False):
+    """
+    Video info with at least the requested fields. Fields a tier can't provide
+    come back as 0/'' like before, so callers see the same shape either way.
+    URLs other than YouTube's are an error unless other_sites is set, and then
+    need a full extraction.
+    """
+    video_id = extract_video_id(url)
+    key = video_id or url
+    full = bool(set(fields) & set(FULL_FIELDS))
+    if video_id is None:
+        # oEmbed only knows YouTube URLs
+        if not other_sites or importlib.util.find_spec('yt_dlp') is None:
+            raise LookupFailed(400, 'Invalid YouTube URL')
+        full = True
+
+    cached = _cache_get(key, full)
+    if cached is not None:
+        return cached
+
+    result = _extract(url) if full else _oembed(url, video_id)
+    _cache_put(key, full, result)
+    return result
+
+
+def _oembed(url, video_id):
+    status, body = _get(f'{OEMBED_URL}?url={quote(url, safe="")}&format=json')
+    if status != 200:
+        raise LookupFailed(400, f'Failed to fetch video info: {status}')
+    data = json.loads(body)
+    return {
+        'title': data.get('title', 'Unknown'),
+        'thumbnail': f'https://img.youtube.com/vi/{video_id}/maxresdefault.jpg',
+        'duration': 0,  # oEmbed doesn't provide duration
+        'channel': data.get('author_name', 'Unknown'),
+        'views': 0,  # oEmbed doesn't provide views
+        'description': ''  # oEmbed doesn't provide description
+    }
+
+
+def _extract(url):
+    global _ydl
+    with _ydl_lock:
+        if _ydl is None:
+            try:
+                import yt_dlp  # Heavy - only paid for by instances that need a full extraction
+            except ImportError:
+                raise LookupFailed(500, 'yt-dlp not available. Please check dependencies.')
+            _ydl = yt_dlp.YoutubeDL({
+                'quiet': True,
+                'no_warnings': True,
+                'extract_flat': False,
+                'nocheckcertificate': True,
+            })
+        info = _ydl.extract_info(url, download=False)
+    return {
+        'title': info.get('title', 'Unknown'),
+        'thumbnail': info.get('thumbnail', ''),
+        'duration': info.get('duration', 0),
+        'channel': info.get('uploader', 'Unknown'),
+        'views': info.get('view_count', 0),
+        'description': (info.get('description', '')[:200] + '...') if info.get('description') else ''
+    }
+
+
+def _get(url):
+    """GET over the kept-alive connection, reconnecting once if the server dropped it"""
+    global _connection
+    parts = urlsplit(url)
+    path = parts.path + ('?' + parts.query if parts.query else '')
+    connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+    address = (parts.hostname, parts.port or connection_class.default_port)
+    with _connection_lock:
+        for attempt in range(2):
+            if _connection is None or (_connection.host, _connection.port) != address:
+                _connection = connection_class(*address, timeout=HTTP_TIMEOUT)
+            try:
+                _connection.request('GET', path, headers={'Connection': 'keep-alive'})
+                response = _connection.getresponse()
+                return response.status, response.read()
+            except (http.client.HTTPException, OSError):
+                _connection.close()
+                _connection = None
+                if attempt:
+                    raise
+
+
+def _cache_get(key, full):
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is None:
+            return None
+        expires, is_full, result = entry
+        if expires < time.time():
+            del _cache[key]
+            return None
+        if full and not is_full:
+            return None
+        _cache.move_to_end(key)
+        return result
+
+
+def _cache_put(key, full, result):
+    with _cache_lock:
+        _cache[key] = (time.time() + CACHE_TTL, full, result)
+        _cache.move_to_end(key)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+class InfoHandler(BaseHTTPRequestHandler):
+    """
+    POST {"url": ..., "fields": [...]} -> video info. Without "fields" a
+    handler returns its default_fields.
+    """
+    default_fields = BASIC_FIELDS
+    # Put the traceback in 500 responses
+    debug_errors = False
+    # Look up URLs of sites other than YouTube with yt-dlp instead of answering 400
+    other_sites = False
+
+    def log_message(self, format, *args):
+        # Suppress default logging
+        pass
+
+    def do_POST(self):
+        try:
+            content_length = int(self.headers.get('Content-Length', 0))
+            if content_length == 0:
+                return self.send_error_response(400, 'No content provided')
+
+            data = json.loads(self.rfile.read(content_length).decode('utf-8'))
+            url = data.get('url', '')
+            if not url:
+                return self.send_error_response(400, 'No URL provided')
+
+            fields = data.get('fields') or self.default_fields
+            if isinstance(fields, str):
+                fields = [fields]
+            return self.send_success_response(lookup(url, fields, self.other_sites))
+
+        except json.JSONDecodeError as e:
+            return self.send_error_response(400, f'Invalid JSON: {str(e)}')
+        except LookupFailed as e:
+            return self.send_error_response(e.status, str(e))
+        except Exception as e:
+            if self.debug_errors:
+                return self.send_error_response(500, f'{str(e)}\n\nTraceback:\n{traceback.format_exc()}')
+            return self.send_error_response(500, f'Error: {str(e)}')
+
+    def do_OPTIONS(self):
+        self.send_response(200)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Allow-Methods', 'POST, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.end_headers()
+
+    def send_success_response(self, data):
+        self.send_json(200, data)
+
+    def send_error_response(self, status_code, error_message):
+        self.send_json(status_code, {'error': error_message})
+
+    def send_json(self, status_code, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status_code)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(body)
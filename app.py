@@ -4,8 +4,11 @@ A modern web app to download YouTube videos in highest quality
 https://github.com/yourusername/tubegrab
 """
 
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, render_template, request, jsonify
 from flask_cors import CORS
+from werkzeug.datastructures import ContentRange
+from werkzeug.http import is_resource_modified
+from werkzeug.wsgi import wrap_file
 import yt_dlp
 import subprocess
 import shutil
@@ -15,6 +18,26 @@ import threading
 import time
 import re
 import glob
+import json
+import unicodedata
+import zipfile
+from datetime import datetime, timezone
+from urllib.parse import parse_qs, quote, urlparse
+
+from admission import AdmissionController
+from bandwidth import BandwidthController, priority_weight
+from cache import InfoCache
+from cookieresolver import CookieResolver
+from converter import ENCODE, ffmpeg_command, parse_progress, plan_conversion, probe_media
+from diskbudget import DiskBudget, parse_size
+from engine import YtdlpPool
+from jobqueue import QueueScheduler, SQLiteJobQueue
+from jobstore import FINISHED_STATUSES, open_job_store
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, Registry
+from recovery import (StagingLocks, is_intermediate, kill_orphan, owner, partial_bytes, read_manifest,
+                      update_manifest, write_manifest)
+from scheduler import DownloadScheduler, kill_process
+from strategies import StrategyChain
 
 app = Flask(__name__)
 CORS(app)
@@ -26,27 +49,333 @@ DEFAULT_DOWNLOAD_FOLDER = os.path.join(BASE_DIR, 'downloads')
 DOWNLOAD_FOLDER = os.environ.get('TUBEGRAB_DOWNLOAD_FOLDER', DEFAULT_DOWNLOAD_FOLDER)
 os.makedirs(DOWNLOAD_FOLDER, exist_ok=True)
 
+# Per-download working directories; finished files are moved up into DOWNLOAD_FOLDER
+STAGING_FOLDER = os.path.join(DOWNLOAD_FOLDER, '.staging')
+os.makedirs(STAGING_FOLDER, exist_ok=True)
+
+# Running jobs lock their staging directory, so other processes sharing the folder
+# leave them alone; on startup, unlocked ones are resumed or cleaned up (see recovery.py)
+staging_locks = StagingLocks()
+
 # Cookies upload directory (for user-provided cookies.txt)
-COOKIES_FOLDER = os.path.join(BASE_DIR, 'cookies')
+COOKIES_FOLDER = os.environ.get('TUBEGRAB_COOKIES_FOLDER', os.path.join(BASE_DIR, 'cookies'))
 os.makedirs(COOKIES_FOLDER, exist_ok=True)
 
+# Browser whose cookies yt-dlp uses when none were uploaded ('' for none, 'firefox:profile'
+# for a profile). They're exported once and re-exported every TUBEGRAB_COOKIES_REFRESH seconds.
+cookie_resolver = CookieResolver(
+    COOKIES_FOLDER,
+    browser=os.environ.get('TUBEGRAB_COOKIES_BROWSER', 'chrome'),
+    refresh=int(os.environ.get('TUBEGRAB_COOKIES_REFRESH', 1800))
+)
+
+# Hand file transfers to a front proxy instead of serving them from Python:
+# 'x-accel-redirect' (nginx, files exposed at SENDFILE_PREFIX) or 'x-sendfile' (Apache/lighttpd)
+SENDFILE_MODE = os.environ.get('TUBEGRAB_SENDFILE', '').lower()
+SENDFILE_PREFIX = os.environ.get('TUBEGRAB_SENDFILE_PREFIX', '/protected-downloads/')
+
 # Auto-detect ffmpeg location
 FFMPEG_PATH = os.environ.get('FFMPEG_PATH', shutil.which('ffmpeg') or 'ffmpeg')
+FFPROBE_PATH = os.environ.get(
+    'FFPROBE_PATH',
+    shutil.which('ffprobe') or os.path.join(os.path.dirname(FFMPEG_PATH), 'ffprobe')
+)
 
-# Track download progress
-downloads = {}
-cookies_store = {}
+# yt-dlp executable (override to pin a version or point at a stub)
+YTDLP_PATH = os.environ.get('YTDLP_PATH', 'yt-dlp')
 
+# How downloads run: 'pool' drives yt-dlp's Python API in warm worker processes,
+# 'cli' starts the yt-dlp executable for every job (the pool falls back to it on failure)
+DOWNLOAD_ENGINE = os.environ.get('TUBEGRAB_ENGINE', 'pool').lower()
 
-def get_video_info(url, cookies_path=None):
-    """Get video information without downloading"""
+# Concurrency limits - downloads and ffmpeg conversions are limited separately
+MAX_DOWNLOADS = int(os.environ.get('TUBEGRAB_MAX_DOWNLOADS', 3))
+MAX_CONVERSIONS = int(os.environ.get('TUBEGRAB_MAX_CONVERSIONS', 2))
+
+# Most conversions are cheap remuxes; full re-encodes additionally wait for one of
+# MAX_ENCODES slots, and each encode gets an equal share of the cores
+CPU_COUNT = os.cpu_count() or 1
+MAX_ENCODES = int(os.environ.get('TUBEGRAB_MAX_ENCODES', max(1, CPU_COUNT // 4)))
+ENCODE_THREADS = max(1, CPU_COUNT // MAX_ENCODES)
+ENCODE_PRESET = os.environ.get('TUBEGRAB_ENCODE_PRESET', 'veryfast')
+encode_slots = threading.BoundedSemaphore(MAX_ENCODES)
+
+# Where jobs run: 'inline' in this process's worker pools, or 'queue' to leave them on
+# the shared SQLite queue for worker.py processes (which needs the sqlite job store)
+EXECUTION_MODE = os.environ.get('TUBEGRAB_EXECUTION', 'inline')
+
+# Track download progress - in memory by default, or in SQLite shared by all worker processes
+JOB_STORE = os.environ.get('TUBEGRAB_JOB_STORE', 'sqlite' if EXECUTION_MODE == 'queue' else 'memory')
+JOB_DB_PATH = os.environ.get('TUBEGRAB_JOB_DB', os.path.join(DOWNLOAD_FOLDER, '.tubegrab.db'))
+store = open_job_store(JOB_STORE, JOB_DB_PATH)
+
+# Finished downloads are forgotten (and their files deleted) after JOB_TTL seconds,
+# or sooner once more than MAX_FINISHED_JOBS have piled up
+JOB_TTL = int(os.environ.get('TUBEGRAB_JOB_TTL', 3600))
+MAX_FINISHED_JOBS = int(os.environ.get('TUBEGRAB_MAX_FINISHED_JOBS', 1000))
+COOKIES_TTL = 24 * 3600
+BATCH_TTL = 24 * 3600
+
+# Most items a batch (or expanded playlist) may queue
+MAX_BATCH_ITEMS = int(os.environ.get('TUBEGRAB_MAX_BATCH_ITEMS', 200))
+JANITOR_INTERVAL = 60
+# Age before the janitor removes a staging directory no job here knows about
+STAGING_GRACE = 600
+
+# Global download rate cap in bytes/s (e.g. '20M', unset for none), shared fairly
+# between running downloads, weighted by priority. Each process enforces it separately.
+bandwidth = BandwidthController(parse_size(os.environ.get('TUBEGRAB_BANDWIDTH_LIMIT')))
+
+# Byte quota for the download folder (e.g. '20G', unset for none). Over it, the least
+# recently served files are evicted until usage is back under the low-water mark.
+disk_budget = DiskBudget(
+    store,
+    quota=parse_size(os.environ.get('TUBEGRAB_DISK_QUOTA')),
+    low_water=float(os.environ.get('TUBEGRAB_DISK_LOW_WATER', 0.9))
+)
+
+# Server-Sent Events tuning (seconds)
+SSE_HEARTBEAT = 15
+SSE_MIN_INTERVAL = 0.25  # Coalesce bursts of progress updates into one event
+
+if EXECUTION_MODE == 'queue':
+    scheduler = QueueScheduler(SQLiteJobQueue(JOB_DB_PATH))
+else:
+    scheduler = DownloadScheduler({'download': MAX_DOWNLOADS, 'convert': MAX_CONVERSIONS})
+
+# One warm yt-dlp worker process per download slot
+ytdlp_pool = YtdlpPool(MAX_DOWNLOADS) if DOWNLOAD_ENGINE == 'pool' else None
+
+# Back-pressure: new downloads are turned away with 429 while every download worker is
+# busy and TUBEGRAB_MAX_QUEUED jobs already wait, or disk runs short; info lookups while
+# TUBEGRAB_MAX_INFO_INFLIGHT extractions run. Each client may also make TUBEGRAB_CLIENT_RATE
+# requests per minute (bursts of TUBEGRAB_CLIENT_BURST), keyed by X-Forwarded-For
+# when TUBEGRAB_TRUST_PROXY is set (only behind a proxy that sets it), else the peer address.
+admission = AdmissionController(
+    lambda: download_load(),
+    DOWNLOAD_FOLDER,
+    max_queued=int(os.environ.get('TUBEGRAB_MAX_QUEUED', 50)),
+    min_free_disk=parse_size(os.environ.get('TUBEGRAB_MIN_FREE_DISK', '500M')),
+    max_info_inflight=int(os.environ.get('TUBEGRAB_MAX_INFO_INFLIGHT', 8)),
+    client_rate=float(os.environ.get('TUBEGRAB_CLIENT_RATE', 60)) / 60,
+    client_burst=int(os.environ.get('TUBEGRAB_CLIENT_BURST', 20))
+)
+TRUST_PROXY = os.environ.get('TUBEGRAB_TRUST_PROXY', '').lower() in ('1', 'true', 'yes')
+
+# Prometheus metrics at /metrics (per process - each queue worker keeps its own)
+metrics = Registry()
+STAGE_SECONDS = metrics.histogram(
+    'tubegrab_stage_seconds', 'Time spent in each job stage', ['stage']
+)
+DOWNLOAD_RATE = metrics.histogram(
+    'tubegrab_download_bytes_per_second', 'Average rate of finished downloads', [],
+    buckets=tuple(2 ** n * 1024 for n in range(6, 18, 1))  # 64 KB/s to 128 MB/s
+)
+DOWNLOADED_BYTES = metrics.counter('tubegrab_downloaded_bytes_total', 'Bytes fetched by finished downloads')
+JOBS_FINISHED = metrics.counter('tubegrab_jobs_finished_total', 'Jobs by final status', ['status'])
+FILES_SERVED = metrics.counter('tubegrab_files_served_total', 'File responses by HTTP status', ['code'])
+SERVED_BYTES = metrics.counter('tubegrab_served_bytes_total', 'Bytes handed out as file responses')
+metrics.callback(
+    'tubegrab_jobs', 'Queued and running jobs per stage',
+    lambda: [({'stage': stage, 'state': state}, counts.get(state) or 0)
+             for stage, counts in scheduler.stats().items() for state in ('queued', 'running')]
+)
+metrics.callback(
+    'tubegrab_child_processes', 'Child processes: running jobs and idle warm engine workers',
+    lambda: [({'kind': 'job'}, scheduler.process_count())] +
+            ([({'kind': 'engine_idle'}, ytdlp_pool.stats()['idle'])] if ytdlp_pool else [])
+)
+metrics.callback(
+    'tubegrab_info_cache_lookups_total', 'Info cache lookups by result',
+    lambda: [({'result': 'hit'}, info_cache.stats()['hits']), ({'result': 'miss'}, info_cache.stats()['misses'])],
+    kind='counter'
+)
+
+# Info extraction strategies, tried in order of what has been working
+extraction_strategies = StrategyChain()
+
+# How long /api/info results may be reused by the download that follows,
+# and how much life their format URLs must have left
+INFO_REUSE_MAX_AGE = int(os.environ.get('TUBEGRAB_INFO_REUSE_MAX_AGE', 300))
+INFO_REUSE_MARGIN = 600
+
+# Video metadata cache, keyed by video ID and the uploaded cookies it was extracted with
+info_cache = InfoCache(
+    ttl=int(os.environ.get('TUBEGRAB_INFO_CACHE_TTL', 600)),
+    max_entries=int(os.environ.get('TUBEGRAB_INFO_CACHE_SIZE', 256)),
+    max_bytes=int(os.environ.get('TUBEGRAB_INFO_CACHE_MB', 64)) * 1024 * 1024
+)
+
+
+def update_download(download_id, **fields):
+    """Update a download record, ignoring removed or cancelled downloads"""
+    if fields.get('status') in FINISHED_STATUSES:
+        if 'timeline' not in fields:
+            # The job is over - close its timeline
+            timeline = advance_timeline(store.get(download_id), None)
+            if timeline is not None:
+                fields['timeline'] = timeline
+        # A progressive download's stream_file is in its staging directory, which goes now;
+        # the finished file is served from /api/file, and clients don't get to see the path
+        fields.setdefault('progressive', None)
+        fields.setdefault('stream_file', None)
+    if store.update(download_id, **fields):
+        if fields.get('status') in FINISHED_STATUSES:
+            JOBS_FINISHED.inc(status=fields['status'])
+        return True
+    # Cancelled or cleaned up, possibly from another worker process - stop any work running here
+    scheduler.cancel(download_id)
+    return False
+
+
+def mark_stage(download_id, stage):
+    """
+    Move a job on to the next stage of its timeline (None just ends the current one),
+    recording how long the previous stage took. The timeline shows in /api/progress.
+    """
+    timeline = advance_timeline(store.get(download_id), stage)
+    if timeline is not None:
+        update_download(download_id, timeline=timeline)
+
+
+def advance_timeline(download, stage):
+    """A download's timeline with the open stage ended and `stage` begun, or None if unchanged"""
+    if download is None:
+        return None
+    timeline = download.get('timeline') or []
+    current = timeline[-1] if timeline and timeline[-1]['end'] is None else None
+    if (current['stage'] if current is not None else None) == stage:
+        return None
+    now = time.time()
+    if current is not None:
+        current['end'] = round(now, 3)
+        STAGE_SECONDS.observe(now - current['start'], stage=current['stage'])
+    if stage is not None:
+        timeline.append({'stage': stage, 'start': round(now, 3), 'end': None})
+    return timeline
+
+
+def progress_snapshot(download_id):
+    """Return (version, public progress dict) for a download, or (None, None) if unknown"""
+    version, download = store.snapshot(download_id)
+    if download is None:
+        return None, None
+    
+    # Position in the download (or conversion) queue, None once the job is running
+    queue_id = download_id
+    
+    # Downloads waiting for another download of the same media show that one's progress
+    leader_id = download.get('attached_to')
+    if leader_id and download['status'] not in FINISHED_STATUSES:
+        leader = store.get(leader_id)
+        if leader is not None and leader['status'] not in FINISHED_STATUSES:
+            download.update({field: leader[field] for field in ATTACHED_FIELDS if field in leader})
+            queue_id = leader_id
+    
+    _, download['queue_position'] = scheduler.queue_position(queue_id)
+    
+    return version, download
+
+
+# Progress fields a download attached to another one's fetch takes over from it
+ATTACHED_FIELDS = (
+    'status', 'progress', 'speed', 'eta', 'downloaded_bytes', 'total_bytes', 'title',
+    'progressive', 'stream_file',
+)
+
+
+# Record fields for the server only - a path into the download's staging directory
+SERVER_FIELDS = ('stream_file',)
+
+
+def client_view(download):
+    """A download record as /api/progress and its stream show it"""
+    return {key: value for key, value in download.items() if key not in SERVER_FIELDS}
+
+
+def is_cancelled(download_id):
+    """True if the download was cancelled or cleaned up while running"""
+    download = store.get(download_id)
+    return download is None or download['status'] == 'cancelled'
+
+
+def register_process(download_id, process):
+    """Track a job's child process for cancellation, and in its manifest for crash recovery"""
+    scheduler.register_process(download_id, process)
+    update_manifest(staging_dir(download_id), pid=process.pid)
+
+
+def run_process(cmd, download_id, timeout, on_line=None):
+    """
+    Run a child process that is killed when its download gets cancelled.
+    Each line it prints on stdout is passed to on_line() as it arrives.
+    """
+    process = subprocess.Popen(
+        cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+        start_new_session=True
+    )
+    register_process(download_id, process)
+    
+    timed_out = threading.Event()
+    def expire():
+        # Killing it also ends the read loop below
+        timed_out.set()
+        kill_process(process)
+    timer = threading.Timer(timeout, expire)
+    timer.start()
+    try:
+        for line in process.stdout:
+            if on_line is not None:
+                on_line(line.strip())
+        process.wait()
+    finally:
+        timer.cancel()
+        scheduler.unregister_process(download_id)
+    if timed_out.is_set():
+        raise subprocess.TimeoutExpired(cmd, timeout)
+    return process.returncode
+
+
+def extract_video_id(url):
+    """Extract the YouTube video ID so watch, youtu.be and shorts links share a cache entry"""
+    patterns = [
+        r'(?:youtube\.com\/watch\?v=|youtu\.be\/|youtube\.com\/embed\/|youtube\.com\/v\/|youtube\.com\/shorts\/)([^&\n?#]+)',
+    ]
+    for pattern in patterns:
+        match = re.search(pattern, url)
+        if match:
+            return match.group(1)
+    return None
+
+
+def video_key(url):
+    """The video ID of a URL when we can find one, else the URL itself"""
+    return extract_video_id(url) or url
+
+
+def cookies_identity(cookies_path):
+    """Whose uploaded cookies a lookup runs with - the file's name, its content hash - or None"""
+    return os.path.splitext(os.path.basename(cookies_path))[0] if cookies_path else None
+
+
+def info_cache_key(url, cookies_path=None):
+    """
+    Cache key for a URL looked up with some uploaded cookies. An account can see
+    what others can't, so each set of cookies gets its own entries.
+    """
+    return video_key(url), cookies_identity(cookies_path)
+
+
+def extract_video_info(url, cookies_path=None):
+    """Run a full yt-dlp extraction and return the raw (JSON-safe) info dict"""
     ydl_opts = {
         'quiet': True,
         'no_warnings': True,
         'extract_flat': False,
         'nocheckcertificate': True,
-        # Use browser cookies to bypass bot detection
-        'cookiesfrombrowser': ('chrome',),  # Try Chrome first, falls back to others
         # Additional options to avoid bot detection
         'extractor_args': {
             'youtube': {
@@ -54,47 +383,97 @@ def get_video_info(url, cookies_path=None):
             }
         },
     }
+    # If cookies fail, try without browser cookies but with different user agent
+    ydl_opts_fallback = {
+        'quiet': True,
+        'no_warnings': True,
+        'extract_flat': False,
+        'nocheckcertificate': True,
+        'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    }
     
-    if cookies_path:
-        # Use user-provided cookies to satisfy login/age checks
-        ydl_opts['cookiefile'] = cookies_path
+    def extract(opts, cookies_path, browser):
+        with cookie_resolver.for_job(cookies_path, browser=browser) as cookies_file:
+            if cookies_file:
+                opts = dict(opts, cookiefile=cookies_file)
+            with yt_dlp.YoutubeDL(opts) as ydl:
+                info = ydl.extract_info(url, download=False)
+                return ydl.sanitize_info(info)
     
-    try:
+    # User-provided cookies satisfy login/age checks; browser cookies help against bot
+    # detection. The chain starts with whichever strategy worked last. The two kinds of
+    # cookies fail for different reasons (one user's expired upload, a logged-out
+    # browser), so each has its own breaker.
+    attempts = []
+    if cookies_path:
+        attempts.append(('uploaded_cookies', lambda: extract(ydl_opts, cookies_path, False)))
+    elif cookie_resolver.browser_cookies():
+        attempts.append(('browser_cookies', lambda: extract(ydl_opts, None, True)))
+    if not cookies_path:
+        attempts.append(('no_cookies', lambda: extract(ydl_opts, None, False)))
+    attempts.append(('desktop_ua', lambda: extract(ydl_opts_fallback, cookies_path, False)))
+    return extraction_strategies.run(attempts)
+
+
+def expand_playlist(url, cookies_path=None):
+    """
+    Return the video URLs of a playlist (or channel) URL using flat extraction,
+    which lists the entries without extracting each video. A plain video URL
+    comes back on its own.
+    """
+    ydl_opts = {
+        'quiet': True,
+        'no_warnings': True,
+        'extract_flat': 'in_playlist',
+        'nocheckcertificate': True,
+        'playlistend': MAX_BATCH_ITEMS,
+    }
+    with cookie_resolver.for_job(cookies_path) as cookies_file:
+        if cookies_file:
+            ydl_opts['cookiefile'] = cookies_file
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
             info = ydl.extract_info(url, download=False)
-            return {
-                'title': info.get('title', 'Unknown'),
-                'thumbnail': info.get('thumbnail', ''),
-                'duration': info.get('duration', 0),
-                'channel': info.get('uploader', 'Unknown'),
-                'views': info.get('view_count', 0),
-                'description': info.get('description', '')[:200] + '...' if info.get('description') else ''
-            }
-    except Exception as e:
-        # If cookies fail, try without cookies but with different user agent
-        ydl_opts_fallback = {
-            'quiet': True,
-            'no_warnings': True,
-            'extract_flat': False,
-            'nocheckcertificate': True,
-            'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-        }
-        if cookies_path:
-            ydl_opts_fallback['cookiefile'] = cookies_path
-        with yt_dlp.YoutubeDL(ydl_opts_fallback) as ydl:
-            info = ydl.extract_info(url, download=False)
-            return {
-                'title': info.get('title', 'Unknown'),
-                'thumbnail': info.get('thumbnail', ''),
-                'duration': info.get('duration', 0),
-                'channel': info.get('uploader', 'Unknown'),
-                'views': info.get('view_count', 0),
-                'description': info.get('description', '')[:200] + '...' if info.get('description') else ''
-            }
+    
+    if info.get('_type') not in ('playlist', 'multi_video'):
+        return [url]
+    urls = []
+    for entry in info.get('entries') or []:
+        if not entry:
+            continue
+        entry_url = entry.get('url') or entry.get('webpage_url')
+        if entry_url and not entry_url.startswith(('http://', 'https://')) and entry.get('id'):
+            entry_url = f"https://www.youtube.com/watch?v={entry['id']}"
+        if entry_url:
+            urls.append(entry_url)
+    return urls
+
+
+def get_video_info(url, cookies_path=None):
+    """Get video information without downloading"""
+    def load():
+        started = time.monotonic()
+        with admission.track('info'):
+            info = extract_video_info(url, cookies_path=cookies_path)
+        STAGE_SECONDS.observe(time.monotonic() - started, stage='info')
+        return info
+    
+    # Cached per video ID and cookies; concurrent requests for the same ones share one extraction
+    info = info_cache.get_or_load(info_cache_key(url, cookies_path), load)
+    return {
+        'title': info.get('title', 'Unknown'),
+        'thumbnail': info.get('thumbnail', ''),
+        'duration': info.get('duration', 0),
+        'channel': info.get('uploader', 'Unknown'),
+        'views': info.get('view_count', 0),
+        'description': info.get('description', '')[:200] + '...' if info.get('description') else ''
+    }
 
 
 def convert_to_mp4(input_file, download_id):
-    """Convert video to MP4 format using FFmpeg"""
+    """
+    Convert video to MP4 format using FFmpeg, taking the cheapest path its streams allow.
+    Progress is reported to the download record while ffmpeg runs.
+    """
     if input_file.endswith('.mp4'):
         return input_file  # Already MP4
     
@@ -110,104 +489,303 @@ def convert_to_mp4(input_file, download_id):
             counter += 1
     
     try:
-        # Use FFmpeg to convert/remux to MP4
-        # -c copy tries to copy streams without re-encoding (fast)
-        # If that fails, we'll re-encode
-        cmd = [
-            FFMPEG_PATH,
-            '-i', input_file,
-            '-c', 'copy',  # Try to copy streams without re-encoding
-            '-y',  # Overwrite output file (safe now since we checked for duplicates)
-            output_file
-        ]
+        # Look at the streams first: most downloads only need a remux or an audio
+        # re-encode, and a full re-encode is the fallback if the cheap path fails
+        media = probe_media(FFPROBE_PATH, input_file)
+        plan = plan_conversion(media)
+        plans = [plan] if plan == ENCODE else [plan, ENCODE]
         
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=600)
-        
-        if result.returncode == 0 and os.path.exists(output_file):
-            # Remove original file
-            os.remove(input_file)
-            return output_file
-        else:
-            # If copy failed, try re-encoding
-            cmd = [
-                FFMPEG_PATH,
-                '-i', input_file,
-                '-c:v', 'libx264',
-                '-c:a', 'aac',
-                '-y',
-                output_file
-            ]
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=1800)
-            
-            if result.returncode == 0 and os.path.exists(output_file):
+        for plan in plans:
+            if is_cancelled(download_id):
+                break
+            update_download(download_id, progress=0, speed=None, eta=None)
+            if run_conversion(input_file, output_file, plan, media, download_id):
+                # Remove original file
                 os.remove(input_file)
                 return output_file
     except Exception:
         pass
     
+    # Don't leave a half-written output behind (e.g. ffmpeg killed by a cancel)
+    if os.path.exists(output_file):
+        try:
+            os.remove(output_file)
+        except OSError:
+            pass
+    
     return input_file  # Return original if conversion failed
 
 
-def download_video(url, download_id, cookies_path=None):
-    """Download video using yt-dlp command line (works better for JS challenges)"""
+def run_conversion(input_file, output_file, plan, media, download_id):
+    """Run one ffmpeg conversion plan. Returns True if it produced output_file."""
+    duration = media['duration'] if media else None
+    block = {}
+    
+    def on_line(line):
+        # -progress prints blocks of key=value lines, each ended by a progress= line
+        key, _, value = line.partition('=')
+        block[key] = value
+        if key == 'progress':
+            percent, eta = parse_progress(block, duration)
+            if percent is not None:
+                update_download(download_id, progress=percent, eta=eta)
+            block.clear()
+    
+    cmd = ffmpeg_command(
+        FFMPEG_PATH, input_file, output_file, plan, media,
+        threads=ENCODE_THREADS, preset=ENCODE_PRESET
+    )
+    if plan == ENCODE:
+        # CPU-bound - wait for an encode slot so encodes don't starve each other
+        with encode_slots:
+            if is_cancelled(download_id):
+                return False
+            returncode = run_process(cmd, download_id, timeout=1800, on_line=on_line)
+    else:
+        returncode = run_process(cmd, download_id, timeout=600, on_line=on_line)
+    
+    return returncode == 0 and os.path.exists(output_file)
+
+
+def estimate_filesize(info, options=None):
+    """
+    Expected download size in bytes from extracted info, or 0 if it doesn't say.
+    With download options, it is the size of the formats they select, cut down to the clip.
+    """
+    if not info:
+        return 0
+    duration = info.get('duration')
+    size = 0
+    for fmt in selected_formats(info, options):
+        filesize = fmt.get('filesize') or fmt.get('filesize_approx')
+        if not filesize and fmt.get('tbr') and duration:
+            filesize = fmt['tbr'] * 125 * duration  # kbit/s over the whole video
+        size += int(filesize or 0)
+    
+    clip = clip_duration(info, options)
+    if clip is not None and duration and clip < duration:
+        size = int(size * clip / duration)
+    return size
+
+
+def selected_formats(info, options=None):
+    """The formats a download with these options fetches, going by extracted info"""
+    options = options or {}
+    if not (options.get('audio_only') or options.get('max_height')):
+        return info.get('requested_formats') or [info]
+    
+    # Roughly what format_selector() has yt-dlp pick
+    formats = info.get('formats') or []
+    audio = [fmt for fmt in formats if fmt.get('vcodec') == 'none' and fmt.get('acodec') not in (None, 'none')]
+    best_audio = max(audio, key=lambda fmt: fmt.get('abr') or fmt.get('tbr') or 0, default=None)
+    if options.get('audio_only'):
+        return [best_audio] if best_audio else []
+    
+    video = [fmt for fmt in formats if fmt.get('vcodec') not in (None, 'none')
+             and (fmt.get('height') or 0) <= options['max_height']]
+    best_video = max(video, key=lambda fmt: (fmt.get('height') or 0, fmt.get('tbr') or 0), default=None)
+    if best_video is None or best_video.get('acodec') not in (None, 'none'):
+        return [best_video] if best_video else []
+    return [fmt for fmt in (best_video, best_audio) if fmt]
+
+
+def clip_duration(info, options=None):
+    """Seconds of media a download with these options fetches, or None if unknown"""
+    options = options or {}
+    duration = (info or {}).get('duration')
+    start = options.get('start') or 0
+    end = options.get('end')
+    if duration:
+        end = min(end, duration) if end is not None else duration
+    if end is None:
+        return None
+    return max(0, end - start)
+
+
+def reusable_info(url, cookies_path=None):
+    """
+    Return recently extracted info for url if it is safe to download from,
+    i.e. it was extracted with the same uploaded cookies, is fresh enough and
+    its format URLs are not about to expire.
+    """
+    info = info_cache.get(info_cache_key(url, cookies_path), max_age=INFO_REUSE_MAX_AGE)
+    if not info or not info.get('formats'):
+        return None
+    
+    # googlevideo URLs carry their expiry time as a unix timestamp
+    deadline = time.time() + INFO_REUSE_MARGIN
+    for fmt in info.get('requested_formats') or info['formats']:
+        expire = parse_qs(urlparse(fmt.get('url') or '').query).get('expire')
+        try:
+            if expire and int(expire[0]) < deadline:
+                return None
+        except ValueError:
+            return None
+    return info
+
+
+def without_cookies(info):
+    """
+    Extracted info without the session cookies yt-dlp records in it and in each
+    format - loading the info back would put them in the downloader's cookie jar
+    """
+    info = {key: value for key, value in info.items() if key != 'cookies'}
+    for field in ('formats', 'requested_formats'):
+        if info.get(field):
+            info[field] = [{key: value for key, value in fmt.items() if key != 'cookies'} for fmt in info[field]]
+    return info
+
+
+# yt-dlp's default format selection (best video + best audio, else best single file)
+DEFAULT_FORMAT = 'bv*+ba/b'
+
+
+def parse_timestamp(value):
+    """Seconds from a number or an "[[HH:]MM:]SS[.fff]" string. Raises ValueError."""
+    if isinstance(value, bool):
+        raise ValueError(value)
+    if isinstance(value, (int, float)):
+        seconds = float(value)
+    else:
+        seconds = 0.0
+        for part in str(value).strip().split(':'):
+            seconds = seconds * 60 + float(part)
+    if not seconds >= 0 or seconds == float('inf'):
+        raise ValueError(value)
+    return seconds
+
+
+def parse_download_options(data):
+    """
+    The optional clip and format options of a download request: start/end of the
+    wanted time range, audio_only and max_height. Only given options are kept.
+    Raises ValueError with a message for the client.
+    """
+    options = {}
+    for name in ('start', 'end'):
+        if data.get(name) not in (None, ''):
+            try:
+                options[name] = parse_timestamp(data[name])
+            except ValueError:
+                raise ValueError(f'Invalid {name} time')
+    if options.get('start') == 0:
+        del options['start']
+    if 'end' in options and options['end'] <= options.get('start', 0):
+        raise ValueError('end must be after start')
+    
+    if data.get('audio_only'):
+        options['audio_only'] = True
+    elif data.get('max_height') not in (None, ''):
+        try:
+            options['max_height'] = int(data['max_height'])
+        except (TypeError, ValueError):
+            raise ValueError('Invalid max_height')
+        if options['max_height'] <= 0:
+            raise ValueError('Invalid max_height')
+    return options
+
+
+def format_selector(options=None):
+    """yt-dlp format selection for a download's options"""
+    options = options or {}
+    if options.get('audio_only'):
+        return 'ba[ext=m4a]/ba/b'
+    if options.get('max_height'):
+        height = options['max_height']
+        # Nothing that small - the smallest there is
+        return f'bv*[height<={height}]+ba/b[height<={height}]/wv*+ba/w'
+    return DEFAULT_FORMAT
+
+
+def download_sections(options=None):
+    """[(start, end)] time range to fetch (end None for the end of the video), or None for all of it"""
+    options = options or {}
+    if 'start' not in options and 'end' not in options:
+        return None
+    return [(options.get('start', 0), options.get('end'))]
+
+
+def format_seconds(seconds):
+    """
+    A clip bound for yt-dlp and file names: "90", "3600.125". Unlike :g, which
+    keeps six significant digits, it doesn't round long clips' bounds.
+    """
+    return f'{seconds:.6f}'.rstrip('0').rstrip('.')
+
+
+def clip_label(options):
+    """Filename suffix for a clip, e.g. "90-150" or "90-end" """
+    sections = download_sections(options)
+    if not sections:
+        return ''
+    start, end = sections[0]
+    return f'{format_seconds(start)}-{"end" if end is None else format_seconds(end)}'
+
+DOWNLOAD_USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+
+
+def build_ytdlp_command(url, output_template, filepath_record, cookies_path=None, info_path=None,
+                        ratelimit=None, fragments=1, options=None):
+    """Build the yt-dlp command line for a download"""
+    # Use yt-dlp command line - works better for solving YouTube's JS challenges
+    cmd = [
+        YTDLP_PATH,
+        '--no-check-certificate',
+        '-o', output_template,
+        '--newline',  # Print progress on new lines for parsing
+        '--remote-components', 'ejs:github',  # Enable JS challenge solver
+        '--user-agent', DOWNLOAD_USER_AGENT,
+        '--no-overwrites',  # Don't overwrite existing files
+        '--restrict-filenames',  # Ensure safe filenames
+        '--print-to-file', 'after_move:filepath', filepath_record,  # Report the final path
+    ]
+    
+    # Uploaded cookies.txt, or the exported browser cookies that help against bot detection
+    if cookies_path:
+        cmd[2:2] = ['--cookies', cookies_path]
+    
+    # Add ffmpeg location if available
+    ffmpeg_dir = os.path.dirname(FFMPEG_PATH) if FFMPEG_PATH else ''
+    if ffmpeg_dir:
+        # Insert after --no-check-certificate
+        cmd[2:2] = ['--ffmpeg-location', ffmpeg_dir]
+    
+    if ratelimit:
+        # This job's part of the bandwidth cap; fixed for the life of the process
+        cmd += ['--limit-rate', str(ratelimit), '--concurrent-fragments', str(fragments)]
+    
+    if options:
+        cmd += ['-f', format_selector(options)]
+        for start, end in download_sections(options) or []:
+            # Only the fragments (or byte ranges) covering the clip are fetched
+            cmd += ['--download-sections', f'*{format_seconds(start)}-{"inf" if end is None else format_seconds(end)}']
+    
+    if info_path:
+        # Download straight from already extracted info instead of the URL
+        cmd += ['--load-info-json', info_path]
+    else:
+        cmd.append(url)
+    return cmd
+
+
+def run_ytdlp(cmd, download_id, output_dir, streamable=True):
+    """
+    Run yt-dlp, reporting its progress to the download record. Returns (returncode, title).
+    streamable=False keeps the file from being offered for streaming while it downloads.
+    """
+    process = subprocess.Popen(
+        cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        bufsize=1,
+        start_new_session=True  # Own process group so cancel can kill the merger too
+    )
+    register_process(download_id, process)
+    
+    title = 'video'
+    
     try:
-        downloads[download_id]['status'] = 'downloading'
-        
-        # Output template - use YouTube title only, no download_id prefix
-        # Add number suffix if file already exists to prevent overwriting
-        output_template = os.path.join(DOWNLOAD_FOLDER, '%(title)s.%(ext)s')
-        
-        # Check if we need to add a number suffix to avoid overwriting
-        # We'll let yt-dlp handle this with its built-in duplicate handling
-        # But we'll add --no-overwrites to be safe (though yt-dlp handles duplicates by default)
-        
-        # Use yt-dlp command line - works better for solving YouTube's JS challenges
-        ffmpeg_dir = os.path.dirname(FFMPEG_PATH) if FFMPEG_PATH else ''
-        cmd = [
-            'yt-dlp',
-            '--no-check-certificate',
-            '--cookies-from-browser', 'chrome',  # Use Chrome cookies to bypass bot detection
-            '-o', output_template,
-            '--newline',  # Print progress on new lines for parsing
-            '--remote-components', 'ejs:github',  # Enable JS challenge solver
-            '--user-agent', 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            '--no-overwrites',  # Don't overwrite existing files
-            '--restrict-filenames',  # Ensure safe filenames
-            url
-        ]
-
-        # If user supplied cookies.txt, prefer it over cookies-from-browser
-        if cookies_path:
-            cmd = [
-                'yt-dlp',
-                '--no-check-certificate',
-                '--cookies', cookies_path,
-                '-o', output_template,
-                '--newline',
-                '--remote-components', 'ejs:github',
-                '--user-agent', 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                '--no-overwrites',
-                '--restrict-filenames',
-                url
-            ]
-        
-        # Add ffmpeg location if available
-        if ffmpeg_dir:
-            # Insert after --no-check-certificate
-            cmd.insert(2, '--ffmpeg-location')
-            cmd.insert(3, ffmpeg_dir)
-        
-        # Run yt-dlp and capture output
-        process = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True,
-            bufsize=1
-        )
-        
-        title = 'video'
-        
         # Parse output for progress
         for line in process.stdout:
             line = line.strip()
@@ -215,83 +793,445 @@ def download_video(url, download_id, cookies_path=None):
             # Extract title from destination line
             if 'Destination:' in line or '[download] Destination:' in line:
                 # Extract title from filename (format: title.ext)
-                # Remove the download folder path and get just the filename
-                if DOWNLOAD_FOLDER in line:
-                    filename_part = line.split(DOWNLOAD_FOLDER)[-1].strip()
+                # Remove the output folder path and get just the filename
+                if output_dir in line:
+                    filename_part = line.split(output_dir)[-1].strip()
                     # Remove leading slash if present
                     filename_part = filename_part.lstrip('/').lstrip('\\')
                     # Extract title (everything before the extension)
                     match = re.search(r'(.+?)\.(mp4|webm|mkv|m4a|f\d+\.)', filename_part)
                     if match:
                         title = match.group(1)
-                        downloads[download_id]['title'] = title
+                        update_download(download_id, title=title)
+            
+            # A single progressive MP4 (not a .fNNN. part of a DASH merge) can be
+            # streamed to the client while it downloads
+            if line.startswith('[download] Destination:'):
+                mark_stage(download_id, 'download')
+                destination = line.split('Destination:', 1)[1].strip()
+                if streamable and destination.endswith('.mp4') and not re.search(r'\.f\d+\.', destination):
+                    update_download(download_id, progressive=True, stream_file=destination)
             
             # Parse download progress
             if '[download]' in line and '%' in line:
                 match = re.search(r'(\d+\.?\d*)%', line)
                 if match:
                     percent = float(match.group(1))
-                    downloads[download_id]['progress'] = percent
+                    update_download(download_id, progress=percent)
             
             # Detect merge
             if '[Merger]' in line:
-                downloads[download_id]['status'] = 'processing'
-                downloads[download_id]['progress'] = 100
+                mark_stage(download_id, 'merge')
+                update_download(download_id, status='processing', progress=100)
         
         process.wait()
+    finally:
+        scheduler.unregister_process(download_id)
+    
+    return process.returncode, title
+
+
+def build_ytdlp_params(output_template, cookies_path=None, options=None):
+    """YoutubeDL options matching build_ytdlp_command, for the in-process engine"""
+    params = {
+        'nocheckcertificate': True,
+        'outtmpl': output_template,
+        'remote_components': ['ejs:github'],  # Enable JS challenge solver
+        'http_headers': {'User-Agent': DOWNLOAD_USER_AGENT},
+        'overwrites': False,
+        'restrictfilenames': True,
+    }
+    if cookies_path:
+        params['cookiefile'] = cookies_path
+    ffmpeg_dir = os.path.dirname(FFMPEG_PATH) if FFMPEG_PATH else ''
+    if ffmpeg_dir:
+        params['ffmpeg_location'] = ffmpeg_dir
+    if options:
+        params['format'] = format_selector(options)
+        sections = download_sections(options)
+        if sections:
+            # Not a YoutubeDL option - the engine turns it into download_ranges
+            params['download_sections'] = sections
+    return params
+
+
+def is_fragmented(info):
+    """True if extracted info says the download comes in fragments (DASH/HLS)"""
+    formats = (info.get('requested_formats') or [info]) if info else []
+    return any('dash' in (fmt.get('protocol') or '') or 'm3u8' in (fmt.get('protocol') or '')
+               for fmt in formats)
+
+
+def run_ytdlp_pooled(job, download_id, weight=1.0, fragmented=False, streamable=True):
+    """
+    Run a download job on the warm worker pool, reporting its hook events to the
+    download record. Returns (returncode, title); returncode is None if the worker died.
+    The job's bandwidth share is adjusted while it runs as other downloads come and go.
+    """
+    state = {'title': 'video', 'filename': None, 'downloading': False}
+    workers = []
+    
+    def on_rate_change(rate):
+        job['params']['ratelimit'] = rate  # Still goes out with the job if it hasn't started
+        for worker in workers:
+            worker.control('ratelimit', rate)
+    
+    def on_start(worker):
+        workers.append(worker)
+        register_process(download_id, worker.process)
+    
+    def on_event(event):
+        if event['event'] == 'postprocess':
+            if event['postprocessor'] == 'Merger' and event['status'] == 'started':
+                mark_stage(download_id, 'merge')
+                update_download(download_id, status='processing', progress=100)
+            return
         
-        # Find the final merged file - look for the most recently created video file
-        time.sleep(2)  # Give it a bit more time to finish
+        if not state['downloading']:
+            state['downloading'] = True
+            mark_stage(download_id, 'download')
         
-        filename = None
-        largest_size = 0
-        most_recent_time = 0
+        fields = {}
+        if event['title'] and event['title'] != state['title']:
+            state['title'] = fields['title'] = event['title']
         
-        # Get the title from downloads dict if available
-        video_title = downloads[download_id].get('title', 'video')
+        filename = event['filename']
+        if filename and filename != state['filename']:
+            state['filename'] = filename
+            # A single progressive MP4 (not a .fNNN. part of a DASH merge) can be
+            # streamed to the client while it downloads
+            if streamable and filename.endswith('.mp4') and not re.search(r'\.f\d+\.', filename):
+                fields.update(progressive=True, stream_file=filename)
         
-        # Find the most recently created video file (should be the one we just downloaded)
-        for f in os.listdir(DOWNLOAD_FOLDER):
-            filepath = os.path.join(DOWNLOAD_FOLDER, f)
-            
-            # Skip partial and intermediate files
-            if '.part' in f or re.search(r'\.f\d+\.', f):
-                continue
-            # Skip files that start with download_id (old format)
-            if f.startswith(download_id):
-                continue
-            # Skip if it's already an MP4 (might be from previous conversion)
-            if f.endswith('.mp4') and os.path.getmtime(filepath) < time.time() - 10:
+        total = event['total_bytes']
+        if event['status'] == 'finished':
+            fields['progress'] = 100
+        elif total and event['downloaded_bytes'] is not None:
+            fields['progress'] = round(event['downloaded_bytes'] / total * 100, 1)
+        for name in ('downloaded_bytes', 'total_bytes', 'speed', 'eta', 'fragment_index', 'fragment_count'):
+            if event[name] is not None:
+                fields[name] = event[name]
+        update_download(download_id, **fields)
+        if event['status'] == 'downloading':
+            bandwidth.report(download_id, event['speed'])
+    
+    try:
+        with bandwidth.share(download_id, weight, fragmented, on_rate_change) as (ratelimit, fragments):
+            if ratelimit:
+                job['params'].update(ratelimit=ratelimit, concurrent_fragment_downloads=fragments)
+            done = ytdlp_pool.run(job, on_event, on_start=on_start)
+    finally:
+        scheduler.unregister_process(download_id)
+    
+    return done['returncode'], state['title']
+
+
+def staging_dir(download_id):
+    """Private working directory for one download, so jobs never see each other's files"""
+    return os.path.join(STAGING_FOLDER, download_id)
+
+
+def remove_staging(download_id):
+    staging = staging_dir(download_id)
+    shutil.rmtree(staging, ignore_errors=True)
+    staging_locks.release(staging)
+
+
+def find_output_file(staging, filepath_record):
+    """Return the finished file yt-dlp produced in a job's staging directory, or None"""
+    # yt-dlp reports the final path itself once the file has been moved into place
+    if os.path.exists(filepath_record):
+        with open(filepath_record) as f:
+            lines = f.read().splitlines()
+        if lines and os.path.exists(lines[-1]):
+            return lines[-1]
+    
+    # Older yt-dlp without --print-to-file: the staging directory only holds this job's files
+    for f in os.listdir(staging):
+        # Skip partial and intermediate files
+        if '.part' in f or re.search(r'\.f\d+\.', f):
+            continue
+        if f.endswith(('.mp4', '.webm', '.mkv', '.m4a')):
+            return os.path.join(staging, f)
+    return None
+
+
+def publish_file(filepath):
+    """
+    Move a finished file from staging into DOWNLOAD_FOLDER without overwriting anything.
+    Returns the final path.
+    """
+    base_name, ext = os.path.splitext(os.path.basename(filepath))
+    target = os.path.join(DOWNLOAD_FOLDER, base_name + ext)
+    counter = 1
+    while True:
+        try:
+            # link() fails instead of clobbering when the name is taken, and the file
+            # appears fully written under its final name in one step
+            os.link(filepath, target)
+            os.remove(filepath)
+            return target
+        except FileExistsError:
+            target = os.path.join(DOWNLOAD_FOLDER, f'{base_name} ({counter}){ext}')
+            counter += 1
+        except OSError:
+            # No hard links on this filesystem - an atomic rename is the next best thing
+            if os.path.exists(target):
+                target = os.path.join(DOWNLOAD_FOLDER, f'{base_name} ({counter}){ext}')
+                counter += 1
                 continue
+            os.replace(filepath, target)
+            return target
+
+
+def download_video(url, download_id, cookies_path=None):
+    """Download video with yt-dlp, on the warm engine pool or the command line"""
+    staging = staging_dir(download_id)
+    try:
+        if not update_download(download_id, status='downloading'):
+            return
+        mark_stage(download_id, 'extract')
+        
+        # Clip and format options the download was queued with
+        options = (store.get(download_id) or {}).get('options') or {}
+        
+        # Downloads of the same media share one file: finish right away if it is
+        # stored already, or let the download fetching it finish this one too
+        key = media_key(url, options, cookies_path)
+        cached = info_cache.get(info_cache_key(url, cookies_path))
+        estimate = estimate_filesize(cached, options)
+        state, media = claim_media(key, download_id, estimate)
+        if state == 'ready':
+            if not update_download(download_id, status='completed', progress=100, media_key=key,
+                                   media_generation=media['generation'], filename=media['path'],
+                                   title=media['title']):
+                release_media_file(key, media['generation'])
+            return
+        if state == 'follow':
+            mark_stage(download_id, 'attached')
+            update_download(download_id, media_key=key, attached_to=media)
+            return
+        # The info may have been extracted since the download was queued
+        update_download(download_id, media_key=key, **download_estimates(cached, options))
+        
+        # Each job downloads into its own staging directory and yt-dlp tells us the final path
+        os.makedirs(staging, exist_ok=True)
+        if not staging_locks.acquire(staging):
+            return  # Another process is running this job
+        download = store.get(download_id) or {}
+        write_manifest(staging, {
+            'download_id': download_id,
+            'url': url,
+            'options': options or None,
+            'priority': download.get('priority') or 0,
+            'cookies_token': download.get('cookies_token'),
+            'cookies_path': cookies_path,
+            'media_key': key,
+            'stage': 'download',
+            'owner': owner(),
+            'pid': None,
+            'created': round(time.time(), 3),
+        })
+        # Clips are named after their time range so they don't pass for the whole video
+        label = clip_label(options)
+        output_template = os.path.join(staging, f'%(title)s_{label}.%(ext)s' if label else '%(title)s.%(ext)s')
+        filepath_record = os.path.join(staging, '.filepath')
+        
+        # Reuse the metadata /api/info just extracted so yt-dlp skips the page and player work
+        info_path = None
+        info = reusable_info(url, cookies_path)
+        if info is not None:
+            info_path = os.path.join(staging, '.info.json')
+            with open(info_path, 'w') as f:
+                json.dump(without_cookies(info), f)
+        
+        # Bandwidth is shared by priority, and fragmented formats can use several connections
+        weight = priority_weight((store.get(download_id) or {}).get('priority') or 0)
+        fragmented = is_fragmented(info)
+        # ffmpeg writes a clip's MP4 index last, so it can't be watched before it is done
+        streamable = not label
+        
+        with admission.track('download'), cookie_resolver.for_job(cookies_path, staging) as cookies_file:
+            if ytdlp_pool is not None:
+                job = {
+                    'url': url,
+                    'params': build_ytdlp_params(output_template, cookies_file, options),
+                    'info_path': info_path,
+                    'filepath_record': filepath_record,
+                }
+                returncode, title = run_ytdlp_pooled(job, download_id, weight, fragmented, streamable)
+            else:
+                with bandwidth.share(download_id, weight, fragmented) as (ratelimit, fragments):
+                    cmd = build_ytdlp_command(url, output_template, filepath_record, cookies_file,
+                                              info_path=info_path, ratelimit=ratelimit, fragments=fragments,
+                                              options=options)
+                    returncode, title = run_ytdlp(cmd, download_id, staging, streamable)
             
-            # Accept video formats
-            if f.endswith(('.mp4', '.webm', '.mkv', '.m4a')):
-                size = os.path.getsize(filepath)
-                file_time = os.path.getmtime(filepath)
-                
-                # Prefer the most recently created file that's large enough
-                if size > 1000000 and file_time > most_recent_time:  # > 1MB and most recent
-                    most_recent_time = file_time
-                    largest_size = size
-                    filename = filepath
+            if returncode != 0 and (info_path or ytdlp_pool is not None) and not is_cancelled(download_id):
+                # The cached info can go bad in ways we can't see upfront, and the in-process
+                # engine can fail where the CLI copes - retry on the CLI with a fresh extraction
+                update_download(download_id, progress=0)
+                with bandwidth.share(download_id, weight) as (ratelimit, fragments):
+                    cmd = build_ytdlp_command(url, output_template, filepath_record, cookies_file,
+                                              ratelimit=ratelimit, fragments=fragments, options=options)
+                    returncode, title = run_ytdlp(cmd, download_id, staging, streamable)
+        
+        if is_cancelled(download_id):
+            remove_staging(download_id)
+            return
+        
+        filename = find_output_file(staging, filepath_record)
         
-        if filename and os.path.exists(filename) and largest_size > 1000000:  # > 1MB
-            # Convert to MP4 if not already
+        if filename:
+            record_download_rate(download_id, filename)
+            # Convert to MP4 if not already - conversions run on their own, smaller pool
             if not filename.endswith('.mp4'):
-                downloads[download_id]['status'] = 'converting'
-                filename = convert_to_mp4(filename, download_id)
-            
-            downloads[download_id]['status'] = 'completed'
-            downloads[download_id]['filename'] = filename
-            downloads[download_id]['title'] = title
+                mark_stage(download_id, 'convert_queued')
+                update_download(download_id, status='processing')
+                # The download is done - a restart converts this file instead of fetching it again
+                update_manifest(staging, stage='convert', filename=filename, title=title, pid=None)
+                scheduler.submit(download_id, 'convert', finish_download, filename, download_id, title)
+                if EXECUTION_MODE == 'queue':
+                    staging_locks.release(staging)  # Another worker process may convert it
+            else:
+                finish_download(filename, download_id, title)
         else:
-            files_found = [f for f in os.listdir(DOWNLOAD_FOLDER) if f.startswith(download_id)]
-            downloads[download_id]['status'] = 'error'
-            downloads[download_id]['error'] = f'Merge may have failed. Files found: {files_found}'
+            files_found = [f for f in os.listdir(staging) if not f.startswith('.')]
+            fail_download(download_id, f'Merge may have failed. Files found: {files_found}')
+            remove_staging(download_id)
             
     except Exception as e:
-        downloads[download_id]['status'] = 'error'
-        downloads[download_id]['error'] = str(e)
+        fail_download(download_id, str(e))
+        remove_staging(download_id)
+
+
+def record_download_rate(download_id, filename):
+    """Feed a fetched file's size and download rate into the metrics"""
+    download = store.get(download_id) or {}
+    started = next((stage['start'] for stage in download.get('timeline') or []
+                    if stage['stage'] == 'download'), None)
+    size = os.path.getsize(filename)
+    DOWNLOADED_BYTES.inc(size)
+    if started is not None and time.time() > started:
+        DOWNLOAD_RATE.observe(size / (time.time() - started))
+
+
+def finish_download(filename, download_id, title):
+    """Convert the downloaded file to MP4 if needed, publish it and mark the download completed"""
+    try:
+        if not filename.endswith('.mp4'):
+            if not update_download(download_id, status='converting'):
+                return
+            mark_stage(download_id, 'convert')
+            filename = convert_to_mp4(filename, download_id)
+        
+        if is_cancelled(download_id):
+            # Cancelled or cleaned up meanwhile - nobody will ever fetch this file
+            return
+        
+        filename = publish_file(filename)
+        download = store.get(download_id)
+        key = download.get('media_key') if download else None
+        if key is None:
+            if not update_download(download_id, status='completed', filename=filename, title=title):
+                os.remove(filename)
+            return
+        
+        # Finish every download that was waiting for this file; each one holds a reference
+        followers, generation = store.publish_media(key, filename, title, os.path.getsize(filename))
+        for follower in followers + [download_id]:
+            if not update_download(follower, status='completed', progress=100, filename=filename,
+                                   title=title, attached_to=None, media_generation=generation):
+                release_media_file(key, generation)
+        
+        # The estimate admission went by may have been low
+        disk_budget.enforce()
+    except Exception as e:
+        fail_download(download_id, str(e))
+    finally:
+        remove_staging(download_id)
+
+
+def media_key(url, options=None, cookies_path=None):
+    """
+    Identity of the file a download produces: the video, the format selection,
+    the clip and, like info_cache_key(), whose uploaded cookies fetched it - an
+    account can download what others can't, and fail where they don't
+    """
+    key = f'{video_key(url)}:{format_selector(options)}'
+    label = clip_label(options)
+    if label:
+        key = f'{key}:{label}'
+    identity = cookies_identity(cookies_path)
+    return f'{key}@{identity}' if identity else key
+
+
+def download_estimates(info, options=None):
+    """estimated_size/estimated_duration fields for a download record, going by extracted info"""
+    return {
+        'estimated_size': estimate_filesize(info, options) or None,
+        'estimated_duration': clip_duration(info, options),
+    }
+
+
+def claim_media(key, download_id, estimate=0):
+    """store.claim_media(), fetching the file again if it was deleted from disk"""
+    state, value = store.claim_media(key, download_id, estimate)
+    if state == 'ready' and not os.path.exists(value['path']):
+        # Only the entry found missing - another download may have stored the file again meanwhile
+        store.forget_media(key, value['generation'])
+        state, value = store.claim_media(key, download_id, estimate)
+    return state, value
+
+
+def release_media_file(key, generation):
+    """Drop a download's reference to a stored file, deleting the file with the last one"""
+    filename = store.release_media(key, generation)
+    if filename and os.path.exists(filename):
+        try:
+            os.remove(filename)
+        except OSError:
+            pass
+
+
+def fail_download(download_id, error):
+    """Mark a download failed, along with the downloads waiting for its file"""
+    update_download(download_id, status='error', error=error)
+    download = store.get(download_id)
+    if download and download.get('media_key'):
+        for follower in store.drop_media(download['media_key'], download_id):
+            update_download(follower, status='error', error=error)
+
+
+def hand_over_media(download_id, key):
+    """
+    A leading download was cancelled or removed before its file was stored -
+    the first download still waiting for the same file fetches it instead
+    """
+    while True:
+        leader, followers = store.promote_media(key, download_id)
+        if leader is None:
+            return
+        download = store.get(leader)
+        if download is not None and download['status'] not in FINISHED_STATUSES:
+            break
+        download_id = leader  # Gone or cancelled meanwhile - try the next one
+    
+    for follower in followers:
+        update_download(follower, attached_to=leader)
+    update_download(leader, status='queued', attached_to=None)
+    mark_stage(leader, 'queued')
+    cookies_token = download.get('cookies_token')
+    cookies_path = store.get_cookies(cookies_token) if cookies_token else None
+    scheduler.submit(leader, 'download', download_video, download['url'], leader, cookies_path,
+                     priority=download.get('priority') or 0)
+
+
+# What worker.py runs for each queue stage
+STAGE_HANDLERS = {
+    'download': download_video,
+    'convert': finish_download,
+}
 
 
 @app.route('/')
@@ -310,7 +1250,11 @@ def video_info():
     if not url:
         return jsonify({'error': 'No URL provided'}), 400
     
-    cookies_path = cookies_store.get(cookies_token) if cookies_token else None
+    rejection = shed_load('info')
+    if rejection is not None:
+        return rejection
+    
+    cookies_path = store.get_cookies(cookies_token) if cookies_token else None
     
     try:
         info = get_video_info(url, cookies_path=cookies_path)
@@ -319,6 +1263,61 @@ def video_info():
         return jsonify({'error': str(e)}), 400
 
 
+def client_id():
+    """Who a request counts against for per-client quotas"""
+    if TRUST_PROXY and request.access_route:
+        return request.access_route[0]
+    return request.remote_addr
+
+
+def download_load():
+    """(queued, running, workers) of the download stage, for admission control"""
+    stage = scheduler.stats().get('download', {})
+    # Queue mode can't see how many worker processes there are
+    return stage.get('queued') or 0, stage.get('running') or 0, stage.get('workers', MAX_DOWNLOADS)
+
+
+def shed_load(kind, cost=1):
+    """A 429 response with Retry-After if admission control turns the request away, else None"""
+    retry_after = admission.check(kind, client_id(), cost)
+    if retry_after is None:
+        return None
+    response = jsonify({'error': 'Server is busy, try again shortly', 'retry_after': retry_after})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Metrics in the Prometheus text format"""
+    return app.response_class(metrics.render(), mimetype=None, content_type=METRICS_CONTENT_TYPE)
+
+
+@app.route('/api/admission/stats')
+def admission_stats():
+    """Load readings, stage latencies and rejection counters of admission control"""
+    return jsonify(admission.stats())
+
+
+@app.route('/api/cache/stats')
+def cache_stats():
+    """Video metadata cache hit/miss counters"""
+    return jsonify(info_cache.stats())
+
+
+@app.route('/api/disk/stats')
+def disk_stats():
+    """Disk quota usage and eviction counters"""
+    return jsonify(disk_budget.stats())
+
+
+@app.route('/api/bandwidth/stats')
+def bandwidth_stats():
+    """Bandwidth cap and each running download's current share"""
+    return jsonify(bandwidth.stats())
+
+
 @app.route('/api/download', methods=['POST'])
 def start_download():
     """Start a video download"""
@@ -329,43 +1328,456 @@ def start_download():
     if not url:
         return jsonify({'error': 'No URL provided'}), 400
     
-    cookies_path = cookies_store.get(cookies_token) if cookies_token else None
+    # Optional priority - higher runs first, equal priorities run in arrival order
+    try:
+        priority = int(data.get('priority', 0))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid priority'}), 400
+    
+    # Optional time range (start/end) and format (audio_only, max_height) - only that is fetched
+    try:
+        options = parse_download_options(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    rejection = shed_load('download')
+    if rejection is not None:
+        return rejection
+    
+    cookies_path = store.get_cookies(cookies_token) if cookies_token else None
+    
+    if not disk_budget.admit(download_estimate(url, options, cookies_path)):
+        return jsonify({'error': 'Not enough disk space for this download, try again later'}), 507
+    
+    download_id = queue_download(url, cookies_token, cookies_path, priority, options)
     
+    return jsonify({'download_id': download_id})
+
+
+def download_estimate(url, options=None, cookies_path=None):
+    """
+    Disk space a new download of url needs, going by the size the extracted info
+    promises; stored media is shared rather than fetched again, so it needs none
+    """
+    if store.has_media(media_key(url, options, cookies_path)):
+        return 0
+    return estimate_filesize(info_cache.get(info_cache_key(url, cookies_path)), options)
+
+
+def queue_download(url, cookies_token, cookies_path, priority=0, options=None):
+    """Create a download record and queue it. Returns the download ID."""
     download_id = str(uuid.uuid4())[:8]
-    downloads[download_id] = {
-        'status': 'starting',
+    store.create(download_id, {
+        'status': 'queued',
         'progress': 0,
         'url': url,
         'error': None,
         'filename': None,
-        'cookies_token': cookies_token if cookies_path else None
-    }
+        'cookies_token': cookies_token if cookies_path else None,
+        'priority': priority,
+        'options': options or None,
+        **download_estimates(info_cache.get(info_cache_key(url, cookies_path)), options),
+        'timeline': [{'stage': 'queued', 'start': round(time.time(), 3), 'end': None}]
+    })
     
-    # Start download in background thread
-    thread = threading.Thread(target=download_video, args=(url, download_id, cookies_path))
-    thread.daemon = True
-    thread.start()
+    # Queue the download - the scheduler's worker pool picks it up when a slot frees up
+    scheduler.submit(download_id, 'download', download_video, url, download_id, cookies_path, priority=priority)
+    return download_id
+
+
+@app.route('/api/batch', methods=['POST'])
+def start_batch():
+    """
+    Start downloading a list of URLs ({"urls": [...]}) or every video of a
+    playlist ({"url": ...}). Items run in parallel within the download limits.
+    """
+    data = request.get_json()
+    urls = data.get('urls')
+    url = data.get('url', '')
+    cookies_token = data.get('cookies_token')
     
-    return jsonify({'download_id': download_id})
+    if urls is not None and (not isinstance(urls, list) or not all(isinstance(u, str) and u for u in urls)):
+        return jsonify({'error': 'urls must be a list of URLs'}), 400
+    if not urls and not url:
+        return jsonify({'error': 'No URL provided'}), 400
+    
+    try:
+        priority = int(data.get('priority', 0))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid priority'}), 400
+    
+    # The same clip and format options apply to every item
+    try:
+        options = parse_download_options(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    cookies_path = store.get_cookies(cookies_token) if cookies_token else None
+    
+    if not urls:
+        # Listing the playlist is an extraction of its own
+        rejection = shed_load('info')
+        if rejection is not None:
+            return rejection
+        try:
+            urls = expand_playlist(url, cookies_path=cookies_path)
+        except Exception as e:
+            return jsonify({'error': str(e)}), 400
+        if not urls:
+            return jsonify({'error': 'Playlist is empty'}), 400
+    if len(urls) > MAX_BATCH_ITEMS:
+        return jsonify({'error': f'At most {MAX_BATCH_ITEMS} URLs per batch'}), 400
+    
+    rejection = shed_load('download', cost=len(urls))
+    if rejection is not None:
+        return rejection
+    
+    if not disk_budget.admit(sum(download_estimate(u, options, cookies_path) for u in urls)):
+        return jsonify({'error': 'Not enough disk space for this batch, try again later'}), 507
+    
+    download_ids = [queue_download(u, cookies_token, cookies_path, priority, options) for u in urls]
+    batch_id = str(uuid.uuid4())[:8]
+    store.create_batch(batch_id, download_ids)
+    
+    return jsonify({'batch_id': batch_id, 'download_ids': download_ids})
+
+
+@app.route('/api/batch/<batch_id>')
+def batch_progress(batch_id):
+    """Aggregate progress of a batch, plus each item's status"""
+    download_ids = store.get_batch(batch_id)
+    if download_ids is None:
+        return jsonify({'error': 'Batch not found'}), 404
+    
+    items = []
+    counts = {}
+    total = 0.0
+    for download_id in download_ids:
+        _, download = progress_snapshot(download_id)
+        status = download['status'] if download is not None else 'expired'
+        counts[status] = counts.get(status, 0) + 1
+        finished = status in FINISHED_STATUSES or status == 'expired'
+        total += 100 if finished else (download.get('progress') or 0)
+        items.append({
+            'download_id': download_id,
+            'status': status,
+            'progress': download.get('progress') if download is not None else None,
+            'title': download.get('title') if download is not None else None,
+            'error': download.get('error') if download is not None else None,
+        })
+    
+    completed = counts.get('completed', 0)
+    if any(status not in FINISHED_STATUSES and status != 'expired' for status in counts):
+        status = 'running'
+    elif completed == len(download_ids):
+        status = 'completed'
+    else:
+        status = 'partial' if completed else 'error'
+    
+    return jsonify({
+        'batch_id': batch_id,
+        'status': status,
+        'progress': round(total / len(download_ids), 1) if download_ids else 100.0,
+        'counts': counts,
+        'items': items,
+    })
+
+
+class ZipStream:
+    """Write-only file object collecting what zipfile writes, so it can be sent as it is produced"""
+    
+    def __init__(self):
+        self._chunks = []
+    
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+    
+    def flush(self):
+        pass
+    
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+@app.route('/api/batch/<batch_id>/zip')
+def batch_zip(batch_id):
+    """
+    Send a finished batch's files as one ZIP archive, built on the fly.
+    Media doesn't compress, so entries are stored as they are; ZIP64 entries with
+    data descriptors let the archive be written front to back without seeking.
+    """
+    download_ids = store.get_batch(batch_id)
+    if download_ids is None:
+        return jsonify({'error': 'Batch not found'}), 404
+    
+    files = []
+    for download_id in download_ids:
+        download = store.get(download_id)
+        if download is None:
+            continue
+        if download['status'] not in FINISHED_STATUSES:
+            return jsonify({'error': 'Batch not finished'}), 409
+        filename = download.get('filename')
+        if download['status'] == 'completed' and filename and os.path.exists(filename):
+            files.append((filename, download.get('media_key')))
+    if not files:
+        return jsonify({'error': 'No completed files in this batch'}), 404
+    
+    def generate():
+        stream = ZipStream()
+        names = set()
+        with zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_STORED) as zf:
+            for filename, key in files:
+                # The same file can appear twice (repeated URLs), and titles can collide
+                base_name, ext = os.path.splitext(os.path.basename(filename))
+                name, counter = base_name + ext, 1
+                while name in names:
+                    name = f'{base_name} ({counter}){ext}'
+                    counter += 1
+                names.add(name)
+                
+                try:
+                    src = open(filename, 'rb')
+                except OSError:
+                    continue  # Evicted or cleaned up meanwhile
+                if key:
+                    store.touch_media(key)
+                with src, zf.open(zipfile.ZipInfo.from_file(filename, name), 'w', force_zip64=True) as dest:
+                    while chunk := src.read(1024 * 1024):
+                        dest.write(chunk)
+                        yield stream.drain()
+        yield stream.drain()
+    
+    response = app.response_class(generate(), mimetype='application/zip')
+    response.headers['Content-Disposition'] = attachment_header(f'tubegrab-{batch_id}.zip')
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@app.route('/api/batch/<batch_id>/cancel', methods=['POST'])
+def cancel_batch(batch_id):
+    """Cancel every unfinished download of a batch"""
+    download_ids = store.get_batch(batch_id)
+    if download_ids is None:
+        return jsonify({'error': 'Batch not found'}), 404
+    
+    for download_id in download_ids:
+        cancel_job(download_id)
+    
+    return jsonify({'success': True})
+
+
+@app.route('/api/batch/<batch_id>', methods=['DELETE'])
+def cleanup_batch(batch_id):
+    """Clean up a batch and all of its downloads"""
+    for download_id in store.delete_batch(batch_id) or []:
+        cleanup_job(download_id)
+    
+    return jsonify({'success': True})
 
 
 @app.route('/api/progress/<download_id>')
 def check_progress(download_id):
     """Check download progress"""
-    if download_id not in downloads:
+    _, download = progress_snapshot(download_id)
+    if download is None:
+        return jsonify({'error': 'Download not found'}), 404
+    
+    return jsonify(client_view(download))
+
+
+@app.route('/api/progress/<download_id>/stream')
+def stream_progress(download_id):
+    """
+    Stream download progress as Server-Sent Events.
+    Each event carries only the fields that changed since the previous one;
+    the stream ends after the download finishes.
+    """
+    if progress_snapshot(download_id)[1] is None:
+        return jsonify({'error': 'Download not found'}), 404
+    
+    def generate():
+        sent = {}
+        last_event = time.monotonic()
+        while True:
+            version, download = progress_snapshot(download_id)
+            message = progress_event(sent, download)
+            now = time.monotonic()
+            if message is not None:
+                yield message
+                last_event = now
+                if stream_finished(download):
+                    return
+                time.sleep(SSE_MIN_INTERVAL)
+            elif now - last_event >= SSE_HEARTBEAT:
+                yield ': heartbeat\n\n'
+                last_event = now
+            
+            # Queue positions and the progress of a download this one is attached to
+            # move without an update to this download, so re-check them often
+            timeout = 1 if download['queue_position'] or download.get('attached_to') else SSE_HEARTBEAT
+            store.wait_for_change(download_id, version, timeout)
+    
+    response = app.response_class(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Don't let nginx buffer the stream
+    return response
+
+
+def progress_event(sent, download):
+    """
+    The SSE message for a progress snapshot: the fields that changed since the
+    ones in `sent` (which is updated), a 'gone' event once the download was
+    removed, or None if nothing changed
+    """
+    if download is None:
+        return 'event: gone\ndata: {}\n\n'
+    changes = {key: value for key, value in client_view(download).items() if key not in sent or sent[key] != value}
+    if not changes:
+        return None
+    sent.update(changes)
+    return f'data: {json.dumps(changes)}\n\n'
+
+
+def stream_finished(download):
+    """True once a progress stream has sent its last event"""
+    return download is None or download['status'] in FINISHED_STATUSES
+
+
+@app.route('/api/cancel/<download_id>', methods=['POST'])
+def cancel_download(download_id):
+    """Cancel a queued or running download"""
+    status = cancel_job(download_id)
+    if status is None:
         return jsonify({'error': 'Download not found'}), 404
+    if status in FINISHED_STATUSES:
+        return jsonify({'error': f'Download already {status}'}), 400
+    
+    return jsonify({'success': True})
+
+
+def cancel_job(download_id):
+    """Cancel a download unless it already finished. Returns its previous status (None if unknown)."""
+    status = store.cancel(download_id)
+    if status is None or status in FINISHED_STATUSES:
+        return status
+    JOBS_FINISHED.inc(status='cancelled')
     
-    return jsonify(downloads[download_id])
+    scheduler.cancel(download_id)
+    
+    download = store.get(download_id)
+    if download and download.get('media_key'):
+        hand_over_media(download_id, download['media_key'])
+    return status
+
+
+def attachment_header(download_name):
+    """Content-Disposition value that survives non-ASCII titles"""
+    simple = unicodedata.normalize('NFKD', download_name).encode('ascii', 'ignore').decode('ascii')
+    value = f'attachment; filename="{simple}"'
+    if simple != download_name:
+        value += f"; filename*=UTF-8''{quote(download_name, safe='')}"
+    return value
+
+
+def send_media_file(filename, download_name):
+    """
+    Serve a finished video with Range (206), ETag, Last-Modified and If-Range support.
+    File bytes don't go through Python: either a front proxy serves the file
+    (X-Accel-Redirect / X-Sendfile) or the WSGI server's file wrapper sends it
+    with sendfile(), for resumed downloads too.
+    """
+    if SENDFILE_MODE == 'x-accel-redirect':
+        # nginx serves the file (and handles ranges) from an internal location
+        response = app.response_class(mimetype='video/mp4')
+        relative_path = os.path.relpath(filename, DOWNLOAD_FOLDER).replace(os.sep, '/')
+        response.headers['X-Accel-Redirect'] = SENDFILE_PREFIX.rstrip('/') + '/' + quote(relative_path)
+        response.headers['Content-Disposition'] = attachment_header(download_name)
+        return response
+    
+    if SENDFILE_MODE == 'x-sendfile':
+        # Apache / lighttpd serve the file by absolute path
+        response = app.response_class(mimetype='video/mp4')
+        response.headers['X-Sendfile'] = os.path.abspath(filename)
+        response.headers['Content-Disposition'] = attachment_header(download_name)
+        return response
+    
+    stat = os.stat(filename)
+    size = stat.st_size
+    etag = f'{stat.st_mtime_ns:x}-{size:x}'
+    last_modified = datetime.fromtimestamp(int(stat.st_mtime), timezone.utc)
+    
+    response = app.response_class(mimetype='video/mp4', direct_passthrough=True)
+    response.headers['Content-Disposition'] = attachment_header(download_name)
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True  # Revalidate with the ETag, then 304
+    
+    if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        response.status_code = 304
+        return response
+    
+    start, length = 0, size
+    byte_range = request.range
+    if byte_range is not None and byte_range.units == 'bytes' and if_range_matches(etag, last_modified):
+        span = byte_range.range_for_length(size)
+        if span is not None:
+            start, stop = span
+            length = stop - start
+            response.status_code = 206
+            response.content_range = ContentRange('bytes', start, stop, size)
+        elif len(byte_range.ranges) == 1:
+            # Multi-range requests just get the whole file, a single bad range is an error
+            response.status_code = 416
+            response.content_range = ContentRange('bytes', None, None, size)
+            return response
+    
+    f = open(filename, 'rb')
+    f.seek(start)
+    response.content_length = length
+    if start + length == size:
+        # Runs to the end of the file - the server's file wrapper can sendfile() it from the offset
+        response.response = wrap_file(request.environ, f)
+    else:
+        response.response = read_file_range(f, length)
+    return response
+
+
+def if_range_matches(etag, last_modified):
+    """True unless an If-Range header says the client's partial copy is outdated"""
+    if_range = request.if_range
+    if if_range.etag is not None:
+        return if_range.etag == etag
+    if if_range.date is not None:
+        return if_range.date >= last_modified
+    return True
+
+
+def read_file_range(f, length, chunk_size=256 * 1024):
+    """Yield exactly length bytes from f's current position, then close it"""
+    try:
+        while length > 0:
+            chunk = f.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
 
 
 @app.route('/api/file/<download_id>')
 def get_file(download_id):
     """Download the completed file"""
-    if download_id not in downloads:
+    download = store.get(download_id)
+    if download is None:
         return jsonify({'error': 'Download not found'}), 404
     
-    download = downloads[download_id]
-    
     if download['status'] != 'completed':
         return jsonify({'error': 'Download not completed'}), 400
     
@@ -373,6 +1785,10 @@ def get_file(download_id):
     if not filename or not os.path.exists(filename):
         return jsonify({'error': 'File not found'}), 404
     
+    # Recently served files are the last to be evicted
+    if download.get('media_key'):
+        store.touch_media(download['media_key'])
+    
     # Get the original filename without path
     original_filename = os.path.basename(filename)
     # If it's already .mp4, use it as-is, otherwise change extension to .mp4
@@ -384,12 +1800,72 @@ def get_file(download_id):
         download_name = f'{base_name}.mp4'
     
     # Always serve as MP4 since we convert everything to MP4
-    return send_file(
-        filename,
-        as_attachment=True,
-        download_name=download_name,
-        mimetype='video/mp4'
-    )
+    started = time.monotonic()
+    response = send_media_file(filename, download_name)
+    # The transfer itself runs in the server (or front proxy) after this returns
+    STAGE_SECONDS.observe(time.monotonic() - started, stage='serve')
+    FILES_SERVED.inc(code=response.status_code)
+    SERVED_BYTES.inc(response.content_length or 0)
+    return response
+
+
+@app.route('/api/stream/<download_id>')
+def stream_file(download_id):
+    """
+    Send a progressive download's bytes as they land on disk.
+    Completed downloads are served like /api/file; merged (DASH) downloads
+    can't be streamed and have to wait for completion.
+    """
+    version, download = progress_snapshot(download_id)
+    if download is None:
+        return jsonify({'error': 'Download not found'}), 404
+    
+    if download['status'] == 'completed':
+        return get_file(download_id)
+    
+    stream_path = download.get('stream_file')
+    if download['status'] != 'downloading' or not stream_path:
+        return jsonify({'error': 'Download not completed', 'progressive': False}), 409
+    
+    f = open_progressive(stream_path)
+    if f is None:
+        return jsonify({'error': 'Download not started yet', 'progressive': True}), 409
+    
+    def generate(version):
+        try:
+            while True:
+                chunk = f.read(256 * 1024)
+                if chunk:
+                    yield chunk
+                    continue
+                
+                # Caught up with the writer - finish once the download is done, else wait for more
+                version, current = progress_snapshot(download_id)
+                if current is None or current['status'] != 'downloading':
+                    while chunk := f.read(256 * 1024):
+                        yield chunk
+                    return
+                store.wait_for_change(download_id, version, timeout=0.5)
+        finally:
+            f.close()
+    
+    download_name = os.path.basename(stream_path)
+    response = app.response_class(generate(version), mimetype='video/mp4')
+    response.headers['Content-Disposition'] = attachment_header(download_name)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def open_progressive(stream_path):
+    """Open the file a progressive download is writing, or None if it hasn't started"""
+    # yt-dlp writes to <name>.part and renames it when done; an open handle survives the rename
+    for path in (stream_path + '.part', stream_path):
+        try:
+            return open(path, 'rb')
+        except FileNotFoundError:
+            continue
+    return None
 
 
 @app.route('/api/cookies', methods=['POST'])
@@ -405,38 +1881,209 @@ def upload_cookies():
     if file.filename == '':
         return jsonify({'error': 'Empty filename'}), 400
     
+    # Identical uploads share one file; each still gets its own token
     cookies_id = str(uuid.uuid4())
-    cookies_path = os.path.join(COOKIES_FOLDER, f'{cookies_id}.txt')
-    file.save(cookies_path)
+    cookies_path = cookie_resolver.save_upload(file.read())
     
     # Keep track so we can reuse for this session/download
-    cookies_store[cookies_id] = cookies_path
+    store.set_cookies(cookies_id, cookies_path)
     
     return jsonify({'cookies_token': cookies_id})
 
 
+@app.route('/api/strategies')
+def strategy_stats():
+    """Success statistics and circuit breaker state of the info extraction strategies"""
+    return jsonify(extraction_strategies.stats())
+
+
+@app.route('/api/cookies/stats')
+def cookies_stats():
+    """Browser cookies export state"""
+    return jsonify(cookie_resolver.stats())
+
+
 @app.route('/api/cleanup/<download_id>', methods=['DELETE'])
 def cleanup(download_id):
     """Clean up downloaded file"""
-    if download_id in downloads:
-        filename = downloads[download_id].get('filename')
-        if filename and os.path.exists(filename):
+    cleanup_job(download_id)
+    return jsonify({'success': True})
+
+
+def cleanup_job(download_id):
+    """Forget a download, stopping it if it is still queued or running, and delete its files"""
+    download = store.delete(download_id)
+    
+    if download is not None:
+        # Stop the job if it is still queued or running
+        scheduler.cancel(download_id)
+        if download.get('media_key') and download['status'] not in FINISHED_STATUSES:
+            hand_over_media(download_id, download['media_key'])
+        remove_download_files(download)
+
+
+def remove_download_files(download):
+    """Delete a removed download's file and the uploaded cookies it used"""
+    filename = download.get('filename')
+    if filename and download.get('media_key'):
+        # Stored media may be shared with other downloads - the last one deletes it. The reference
+        # is to the generation this download completed with, not a newer copy stored since.
+        filename = store.release_media(download['media_key'], download.get('media_generation'))
+    if filename and os.path.exists(filename):
+        try:
+            os.remove(filename)
+        except:
+            pass
+    # Remove uploaded cookies if they were used for this download
+    cookies_token = download.get('cookies_token')
+    if cookies_token:
+        cookies_path = store.pop_cookies(cookies_token)
+        if cookies_path and os.path.exists(cookies_path):
             try:
-                os.remove(filename)
+                os.remove(cookies_path)
             except:
                 pass
-        # Remove uploaded cookies if they were used for this download
-        cookies_token = downloads[download_id].get('cookies_token')
+
+
+def recover_downloads():
+    """
+    Startup pass over the staging folder: queue the downloads a crash or restart
+    interrupted again, continuing from their partial files, and remove staging
+    directories (and stray intermediate files) no job will pick up again.
+    """
+    # Leftovers of downloads that ran straight in the download folder
+    for name in os.listdir(DOWNLOAD_FOLDER):
+        path = os.path.join(DOWNLOAD_FOLDER, name)
+        if not name.startswith('.') and is_intermediate(name) and os.path.isfile(path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    
+    for download_id in os.listdir(STAGING_FOLDER):
+        staging = staging_dir(download_id)
+        if not os.path.isdir(staging) or not staging_locks.acquire(staging):
+            continue  # Still running in another process
+        try:
+            recovered = recover_download(download_id, staging)
+        except Exception:
+            recovered = False
+        if not recovered:
+            remove_staging(download_id)
+
+
+def recover_download(download_id, staging):
+    """Queue one interrupted download again from its manifest. Returns False if it can't be."""
+    manifest = read_manifest(staging)
+    if manifest is None:
+        return False
+    download = store.get(download_id)
+    if download is None and JOB_STORE != 'memory':
+        return False  # Cleaned up while it ran
+    if download is not None and download['status'] in FINISHED_STATUSES:
+        return False
+    
+    # Whatever the old process left running would write into the same files
+    kill_orphan(manifest)
+    
+    cookies_path = manifest.get('cookies_path')
+    if cookies_path and not os.path.exists(cookies_path):
+        cookies_path = None
+    priority = manifest.get('priority') or 0
+    key = manifest.get('media_key')
+    if download is None:
+        # The in-memory store went down with the old process - rebuild the record
+        cookies_token = manifest.get('cookies_token') if cookies_path else None
         if cookies_token:
-            cookies_path = cookies_store.pop(cookies_token, None)
-            if cookies_path and os.path.exists(cookies_path):
-                try:
-                    os.remove(cookies_path)
-                except:
-                    pass
-        del downloads[download_id]
+            store.set_cookies(cookies_token, cookies_path)
+        store.create(download_id, {
+            'status': 'queued',
+            'progress': 0,
+            'url': manifest['url'],
+            'error': None,
+            'filename': None,
+            'cookies_token': cookies_token,
+            'priority': priority,
+            'options': manifest.get('options'),
+            'timeline': [{'stage': 'queued', 'start': round(time.time(), 3), 'end': None}]
+        })
+        if key:
+            store.claim_media(key, download_id)
+            update_download(download_id, media_key=key)
+    else:
+        update_download(download_id, status='queued', progress=0, attached_to=None)
+        mark_stage(download_id, 'queued')
     
-    return jsonify({'success': True})
+    filename = manifest.get('filename')
+    if manifest.get('stage') == 'convert' and filename and os.path.exists(filename):
+        # Fully downloaded - only the conversion is left; drop its half-written output
+        for name in os.listdir(staging):
+            if name.endswith('.mp4'):
+                os.remove(os.path.join(staging, name))
+        mark_stage(download_id, 'convert_queued')
+        update_download(download_id, status='processing', recovered=True)
+        scheduler.submit(download_id, 'convert', finish_download, filename, download_id,
+                         manifest.get('title') or 'video', priority=priority)
+        return True
+    
+    # yt-dlp continues the .part files where they end
+    update_download(download_id, recovered=True, resumed_bytes=partial_bytes(staging))
+    scheduler.submit(download_id, 'download', download_video, manifest['url'], download_id, cookies_path,
+                     priority=priority)
+    return True
+
+
+def sweep_staging():
+    """Remove staging directories left behind by downloads that are over or gone"""
+    cutoff = time.time() - STAGING_GRACE
+    for download_id in os.listdir(STAGING_FOLDER):
+        staging = staging_dir(download_id)
+        download = store.get(download_id)
+        if download is not None and download['status'] not in FINISHED_STATUSES:
+            continue
+        try:
+            if download is None and not staging_locks.held(staging) and os.path.getmtime(staging) > cutoff:
+                continue  # Possibly a job another process has only just started
+        except OSError:
+            continue
+        if not staging_locks.locked_elsewhere(staging):
+            remove_staging(download_id)
+
+
+def janitor():
+    """
+    Forget finished downloads nobody cleaned up (closed tabs) once they pass
+    JOB_TTL or MAX_FINISHED_JOBS, deleting their files and cookies, and delete
+    uploaded cookies that were never used for a download, and staging
+    directories of downloads that are over.
+    """
+    while True:
+        time.sleep(JANITOR_INTERVAL)
+        try:
+            for download in store.expire(JOB_TTL, MAX_FINISHED_JOBS):
+                remove_download_files(download)
+            store.expire_batches(BATCH_TTL)
+            disk_budget.enforce()
+            sweep_staging()
+            
+            cutoff = time.time() - COOKIES_TTL
+            for f in os.listdir(COOKIES_FOLDER):
+                if f.startswith('.'):
+                    continue  # Browser cookies export and files being written
+                cookies_path = os.path.join(COOKIES_FOLDER, f)
+                if os.path.getmtime(cookies_path) < cutoff:
+                    store.drop_cookies(cookies_path)
+                    os.remove(cookies_path)
+        except Exception:
+            pass  # Try again next round
+
+
+# Resume what a restart interrupted. In queue mode the queue's leases take care of that,
+# and under the Flask reloader only the child process that serves requests does it.
+if EXECUTION_MODE == 'inline' and not (__name__ == '__main__' and 'WERKZEUG_RUN_MAIN' not in os.environ):
+    recover_downloads()
+
+threading.Thread(target=janitor, name='tubegrab-janitor', daemon=True).start()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,288 @@
+"""
+TubeGrab - ASGI server
+Serves the same API as app.py from an asyncio event loop, so slow clients cost
+a connection instead of a worker thread:
+
+    pip install starlette uvicorn
+    uvicorn asgi:app --port 5001
+
+Progress streams and progressive downloads are served natively: one poller
+takes the progress snapshots every open stream needs, and file chunks are read
+on a thread pool and sent without holding it. Every other route runs the Flask
+view from app.py on a thread pool; its request body is read and its response
+body (file transfers, batch ZIPs) is sent asynchronously, a chunk at a time.
+Info extractions get a pool of their own, so they can't starve other requests.
+"""
+
+import asyncio
+import io
+import os
+import sys
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+try:
+    from starlette.responses import JSONResponse, StreamingResponse
+    from starlette.routing import Route, Router
+except ImportError as e:
+    raise ImportError('The ASGI server needs Starlette: pip install starlette uvicorn') from e
+
+import app as tubegrab
+
+# Threads running Flask views, store lookups and file reads
+ASGI_THREADS = int(os.environ.get('TUBEGRAB_ASGI_THREADS', 32))
+# Requests that extract info (/api/info, playlist batches) - admission control turns away the rest
+EXTRACTION_THREADS = tubegrab.admission.max_info_inflight
+EXTRACTION_PATHS = ('/api/info', '/api/batch')
+
+CHUNK_SIZE = 256 * 1024
+
+executor = ThreadPoolExecutor(ASGI_THREADS, thread_name_prefix='tubegrab-asgi')
+extraction_executor = ThreadPoolExecutor(EXTRACTION_THREADS, thread_name_prefix='tubegrab-asgi-extract')
+
+
+async def in_thread(func, *args, executor=executor):
+    return await asyncio.get_running_loop().run_in_executor(executor, partial(func, *args))
+
+
+class FileBody:
+    """wsgi.file_wrapper reading big blocks, so a transfer takes few thread round trips"""
+
+    def __init__(self, file, block_size=CHUNK_SIZE):
+        self.file = file
+        self.block_size = max(block_size, CHUNK_SIZE)
+
+    def __iter__(self):
+        while chunk := self.file.read(self.block_size):
+            yield chunk
+
+    def close(self):
+        self.file.close()
+
+
+async def flask_bridge(scope, receive, send):
+    """Run a request through the Flask app on a thread, moving the bodies asynchronously"""
+    if scope['type'] != 'http':
+        return
+    body = bytearray()
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            break
+
+    disconnected = asyncio.Event()
+
+    async def watch_disconnect():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+        disconnected.set()
+
+    watcher = asyncio.ensure_future(watch_disconnect())
+    pool = extraction_executor if scope['path'] in EXTRACTION_PATHS else executor
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started['status'] = int(status.split(' ', 1)[0])
+        started['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                              for name, value in headers]
+        return lambda data: None  # The write() callable - Flask doesn't use it
+
+    def call_app():
+        result = tubegrab.app(wsgi_environ(scope, body), start_response)
+        return result, iter(result)
+
+    result, chunks = await in_thread(call_app, executor=pool)
+    try:
+        await send({'type': 'http.response.start', 'status': started['status'], 'headers': started['headers']})
+        while not disconnected.is_set():
+            # Only reading the next chunk takes a thread; a slow client only holds the connection
+            chunk = await in_thread(next, chunks, None, executor=pool)
+            if chunk is None:
+                break
+            if chunk:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        watcher.cancel()
+        if hasattr(result, 'close'):
+            await in_thread(result.close, executor=pool)
+
+
+def wsgi_environ(scope, body):
+    """The WSGI environ for an ASGI HTTP request"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client')
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode().decode('latin-1'),
+        'PATH_INFO': scope['path'].encode().decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1] or 80),
+        'SERVER_PROTOCOL': f'HTTP/{scope["http_version"]}',
+        'REMOTE_ADDR': client[0] if client else '',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+        'wsgi.file_wrapper': FileBody,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            environ[name] = value
+            continue
+        key = f'HTTP_{name}'
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+class ProgressPoller:
+    """
+    Snapshots the progress of every download an open stream watches, all in one
+    thread round trip per tick, and hands each stream the latest one
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._watchers = {}  # download_id -> set of asyncio.Queue(maxsize=1)
+        self._task = None
+
+    def watch(self, download_id):
+        queue = asyncio.Queue(maxsize=1)
+        self._watchers.setdefault(download_id, set()).add(queue)
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+        return queue
+
+    def unwatch(self, download_id, queue):
+        queues = self._watchers.get(download_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._watchers[download_id]
+
+    async def _run(self):
+        try:
+            while self._watchers:
+                await asyncio.sleep(self.interval)
+                try:
+                    snapshots = await in_thread(self._snapshots, list(self._watchers))
+                except Exception:
+                    # e.g. SQLite's "database is locked" under load - the streams get the next tick
+                    traceback.print_exc()
+                    continue
+                for download_id, snapshot in snapshots.items():
+                    for queue in self._watchers.get(download_id, ()):
+                        publish(queue, snapshot)
+        finally:
+            # However the loop ends, the next watch() starts a new one
+            self._task = None
+
+    @staticmethod
+    def _snapshots(download_ids):
+        return {download_id: tubegrab.progress_snapshot(download_id) for download_id in download_ids}
+
+
+def publish(queue, item):
+    """Put item on a one-slot queue, replacing what the reader hasn't picked up yet"""
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(item)
+
+
+poller = ProgressPoller(tubegrab.SSE_MIN_INTERVAL)
+
+STREAM_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+
+async def stream_progress(request):
+    """Download progress as Server-Sent Events, like app.stream_progress()"""
+    download_id = request.path_params['download_id']
+    snapshot = await in_thread(tubegrab.progress_snapshot, download_id)
+    if snapshot[1] is None:
+        return JSONResponse({'error': 'Download not found'}, status_code=404)
+
+    queue = poller.watch(download_id)
+    publish(queue, snapshot)
+
+    async def generate():
+        loop = asyncio.get_running_loop()
+        sent = {}
+        last_event = loop.time()
+        try:
+            while True:
+                _, download = await queue.get()
+                message = tubegrab.progress_event(sent, download)
+                if message is not None:
+                    yield message
+                    last_event = loop.time()
+                    if tubegrab.stream_finished(download):
+                        return
+                elif loop.time() - last_event >= tubegrab.SSE_HEARTBEAT:
+                    yield ': heartbeat\n\n'
+                    last_event = loop.time()
+        finally:
+            poller.unwatch(download_id, queue)
+
+    return StreamingResponse(generate(), media_type='text/event-stream', headers=STREAM_HEADERS)
+
+
+async def stream_file(request):
+    """A progressive download's bytes as they land on disk, like app.stream_file()"""
+    download_id = request.path_params['download_id']
+    _, download = await in_thread(tubegrab.progress_snapshot, download_id)
+    stream_path = download.get('stream_file') if download else None
+    f = None
+    if download is not None and download['status'] == 'downloading' and stream_path:
+        f = await in_thread(tubegrab.open_progressive, stream_path)
+    if f is None:
+        # Completed, not found, not streamable or not started - Flask has the answers
+        return flask_bridge
+
+    queue = poller.watch(download_id)
+
+    async def generate():
+        try:
+            while True:
+                chunk = await in_thread(f.read, CHUNK_SIZE)
+                if chunk:
+                    yield chunk
+                    continue
+
+                # Caught up with the writer - finish once the download is done, else wait for more
+                _, current = await queue.get()
+                if current is None or current['status'] != 'downloading':
+                    while chunk := await in_thread(f.read, CHUNK_SIZE):
+                        yield chunk
+                    return
+        finally:
+            poller.unwatch(download_id, queue)
+            f.close()
+
+    headers = dict(STREAM_HEADERS, **{
+        'Content-Disposition': tubegrab.attachment_header(os.path.basename(stream_path)),
+    })
+    return StreamingResponse(generate(), media_type='video/mp4', headers=headers)
+
+
+app = Router(
+    routes=[
+        Route('/api/progress/{download_id}/stream', stream_progress),
+        Route('/api/stream/{download_id}', stream_file),
+    ],
+    default=flask_bridge,
+)
+
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, port=5001)
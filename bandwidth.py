@@ -0,0 +1,150 @@
+"""
+TubeGrab - Bandwidth controller
+Splits a global download rate cap between the running downloads by weight,
+re-dividing it whenever a download starts, finishes or turns out to need less
+than its share.
+"""
+
+import math
+import threading
+from contextlib import contextmanager
+
+
+def priority_weight(priority):
+    """Bandwidth weight for a download priority: each step up doubles the share"""
+    return 2.0 ** max(-3, min(3, priority))
+
+
+class _Job:
+    __slots__ = ('weight', 'fragmented', 'on_change', 'rate', 'fragments', 'demand')
+
+    def __init__(self, weight, fragmented, on_change):
+        self.weight = weight
+        self.fragmented = fragmented
+        self.on_change = on_change
+        self.rate = None
+        self.fragments = 1
+        self.demand = math.inf
+
+
+class BandwidthController:
+    """
+    Weighted max-min fair sharing of `limit` bytes/s (0 for no limit).
+
+    Every job gets limit * weight / total weight, except that a job observed
+    running well below its share (a slow origin, a nearly finished file) is
+    only given a little more than it uses, and the rest goes to the others.
+
+    yt-dlp applies its rate limit per connection, so fragmented (DASH/HLS)
+    jobs that get a big enough share are given several fragment connections,
+    each limited to an equal part of the share.
+    """
+
+    # Share that justifies one more concurrent fragment connection
+    FRAGMENT_RATE = 1024 * 1024
+    MAX_FRAGMENTS = 4
+    # Below this fraction of its share a job counts as needing less...
+    UNDERUSE = 0.75
+    # ...and is given this much headroom over what it uses, to find out if it wants more
+    HEADROOM = 1.5
+    # Re-divide only for changes bigger than this fraction, so progress reports don't cause churn
+    MIN_CHANGE = 0.1
+
+    def __init__(self, limit, min_rate=32 * 1024):
+        self.limit = limit
+        self.min_rate = min_rate
+        self._lock = threading.Lock()
+        self._jobs = {}
+
+    def add(self, download_id, weight=1.0, fragmented=False, on_change=None):
+        """
+        Start sharing bandwidth with a job. Returns its (rate limit, fragment connections);
+        the rate is None when there is no limit. on_change(rate) is called when the job's
+        rate limit changes later on.
+        """
+        if not self.limit:
+            return None, 1
+        with self._lock:
+            job = self._jobs[download_id] = _Job(weight, fragmented, on_change)
+            changed = [change for change in self._rebalance() if change[0] is not on_change]
+            rate, fragments = job.rate, job.fragments
+        self._notify(changed)
+        return rate, fragments
+
+    def remove(self, download_id):
+        if not self.limit:
+            return
+        with self._lock:
+            if self._jobs.pop(download_id, None) is None:
+                return
+            changed = self._rebalance()
+        self._notify(changed)
+
+    @contextmanager
+    def share(self, download_id, weight=1.0, fragmented=False, on_change=None):
+        """add() for the duration of a with block, which gets (rate limit, fragment connections)"""
+        limits = self.add(download_id, weight, fragmented, on_change)
+        try:
+            yield limits
+        finally:
+            self.remove(download_id)
+
+    def report(self, download_id, speed):
+        """Feed a job's measured download speed (bytes/s) back into the shares"""
+        if not self.limit or not speed:
+            return
+        with self._lock:
+            job = self._jobs.get(download_id)
+            if job is None or job.rate is None:
+                return
+            share = job.rate * job.fragments
+            demand = max(speed * self.HEADROOM, self.min_rate) if speed < share * self.UNDERUSE else math.inf
+            if demand == job.demand:
+                return
+            job.demand = demand
+            changed = self._rebalance()
+        self._notify(changed)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'limit': self.limit,
+                'jobs': {
+                    download_id: {'weight': job.weight, 'rate': job.rate, 'fragments': job.fragments}
+                    for download_id, job in self._jobs.items()
+                },
+            }
+
+    def _rebalance(self):
+        # Caller holds the lock. Water-filling: jobs that need less than a fair part of
+        # what's left take only what they need, the rest is split by weight.
+        # Returns [(on_change, new rate)] for jobs whose limit changed noticeably.
+        # Jobs that can't be told about changes (a yt-dlp process gets its --limit-rate
+        # once) keep the rate they started with, which is taken off the top.
+        fixed = [job for job in self._jobs.values() if job.on_change is None and job.rate is not None]
+        adjustable = [job for job in self._jobs.values() if job.on_change is not None or job.rate is None]
+        remaining = max(0, self.limit - sum(job.rate * job.fragments for job in fixed))
+        weights = sum(job.weight for job in adjustable)
+        changed = []
+        for job in sorted(adjustable, key=lambda job: job.demand / job.weight):
+            fair = remaining * job.weight / weights if weights else remaining
+            share = max(self.min_rate, min(job.demand, fair))
+            remaining = max(0, remaining - share)
+            weights -= job.weight
+
+            if job.rate is None and job.fragmented:
+                # Connections are opened when the job starts, so this is fixed from then on
+                job.fragments = max(1, min(self.MAX_FRAGMENTS, int(share // self.FRAGMENT_RATE)))
+            rate = int(share // job.fragments)
+            if job.rate is None or abs(rate - job.rate) > job.rate * self.MIN_CHANGE:
+                job.rate = rate
+                if job.on_change is not None:
+                    changed.append((job.on_change, rate))
+        return changed
+
+    def _notify(self, changed):
+        for on_change, rate in changed:
+            try:
+                on_change(rate)
+            except Exception:
+                pass  # The job may just have finished
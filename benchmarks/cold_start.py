@@ -0,0 +1,109 @@
+"""
+TubeGrab - Serverless cold start benchmark
+Measures what a fresh serverless instance pays for the api/ info functions:
+module import time, the first request and a warm repeat, each in a new Python
+process, against a local stub oEmbed server so the network doesn't skew it.
+
+    python benchmarks/cold_start.py [--runs 5] [--json results.json]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+API_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'api')
+HANDLERS = ('info-simple.py', 'info.py')
+VIDEO_URL = 'https://www.youtube.com/watch?v=dQw4w9WgXcQ'
+
+# Run in a fresh interpreter: import the handler file, serve it, POST twice
+PROBE = r'''
+import importlib.util, json, sys, threading, time, urllib.request
+from http.server import HTTPServer
+
+started = time.perf_counter()
+spec = importlib.util.spec_from_file_location('handler_module', sys.argv[1])
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+imported = time.perf_counter()
+
+server = HTTPServer(('127.0.0.1', 0), module.handler)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+body = json.dumps({'url': sys.argv[2], 'fields': ['title', 'channel', 'thumbnail']}).encode()
+
+def post():
+    t = time.perf_counter()
+    request = urllib.request.Request(f'http://127.0.0.1:{server.server_port}/', data=body,
+                                     headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request) as response:
+        response.read()
+    return time.perf_counter() - t
+
+first = post()
+warm = post()
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'first_request_ms': first * 1000,
+    'warm_request_ms': warm * 1000,
+    'yt_dlp_imported': 'yt_dlp' in sys.modules,
+}))
+'''
+
+
+class StubOembed(BaseHTTPRequestHandler):
+    """Answers every request like YouTube's oEmbed endpoint, over keep-alive"""
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = json.dumps({'title': 'Stub video', 'author_name': 'Stub channel'}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[1])
+    parser.add_argument('--runs', type=int, default=5, help='fresh processes per handler')
+    parser.add_argument('--json', help='write the results to this file')
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubOembed)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    env = dict(os.environ, TUBEGRAB_OEMBED_URL=f'http://127.0.0.1:{server.server_port}/oembed')
+
+    results = {}
+    for name in HANDLERS:
+        runs = []
+        for _ in range(args.runs):
+            output = subprocess.run(
+                [sys.executable, '-c', PROBE, os.path.join(API_DIR, name), VIDEO_URL],
+                env=env, capture_output=True, text=True, check=True
+            ).stdout
+            runs.append(json.loads(output))
+        results[name] = {
+            key: round(statistics.median(run[key] for run in runs), 2)
+            for key in ('import_ms', 'first_request_ms', 'warm_request_ms')
+        }
+        results[name]['yt_dlp_imported'] = any(run['yt_dlp_imported'] for run in runs)
+
+    print(f'{"handler":<16}{"import ms":>12}{"first req ms":>15}{"warm req ms":>14}  yt_dlp loaded')
+    for name, result in results.items():
+        print(f'{name:<16}{result["import_ms"]:>12.2f}{result["first_request_ms"]:>15.2f}'
+              f'{result["warm_request_ms"]:>14.2f}  {result["yt_dlp_imported"]}')
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+TubeGrab - Benchmark helpers
+Shared by the benchmark scripts: free ports, starting a server and watching the
+resources of its process tree (Linux /proc).
+"""
+
+import os
+import socket
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_until_up(url, server, name, timeout=30):
+    """Wait for url to answer, failing early if the server process exits"""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            urllib.request.urlopen(url, timeout=1).read()
+            return
+        except OSError:
+            if time.monotonic() > deadline or server.poll() is not None:
+                raise RuntimeError(f'{name} server did not start')
+            time.sleep(0.2)
+
+
+def process_tree(pid):
+    """pid and all its descendants"""
+    pids = [pid]
+    for parent in pids:
+        try:
+            for task in os.listdir(f'/proc/{parent}/task'):
+                with open(f'/proc/{parent}/task/{task}/children') as f:
+                    pids += [int(child) for child in f.read().split()]
+        except OSError:
+            pass
+    return pids
+
+
+def tree_usage(pid):
+    """{'threads', 'rss', 'fds'} summed over a process and its descendants"""
+    usage = {'threads': 0, 'rss': 0, 'fds': 0}
+    for child in process_tree(pid):
+        try:
+            with open(f'/proc/{child}/status') as f:
+                for line in f:
+                    if line.startswith('Threads:'):
+                        usage['threads'] += int(line.split()[1])
+                    elif line.startswith('VmRSS:'):
+                        usage['rss'] += int(line.split()[1]) * 1024
+            usage['fds'] += len(os.listdir(f'/proc/{child}/fd'))
+        except OSError:
+            pass  # Exited meanwhile
+    return usage
+
+
+def tree_cpu(pid, exclude=()):
+    """
+    CPU seconds (user + system) used so far by a process and its descendants,
+    leaving out those whose command line contains any of `exclude`
+    """
+    ticks = 0
+    for child in process_tree(pid):
+        try:
+            with open(f'/proc/{child}/cmdline', 'rb') as f:
+                cmdline = f.read().decode(errors='replace')
+            if any(word in cmdline for word in exclude):
+                continue
+            with open(f'/proc/{child}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            ticks += int(fields[11]) + int(fields[12])  # utime, stime
+        except (OSError, IndexError, ValueError):
+            pass  # Exited meanwhile
+    return ticks / os.sysconf('SC_CLK_TCK')
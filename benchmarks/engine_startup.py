@@ -0,0 +1,138 @@
+"""
+TubeGrab - Download engine startup benchmark
+Runs the same downloads through both engines app.py can use: a fresh yt-dlp
+process per job (TUBEGRAB_ENGINE=cli) and the warm YtdlpPool workers of
+engine.py (TUBEGRAB_ENGINE=pool). Reports how long each job takes to its first
+progress report and to the end, so the startup overhead the pool saves shows
+as the difference. The video comes from a local origin.
+
+    python benchmarks/engine_startup.py [--runs 10] [--size 4M] [--ytdlp /usr/bin/yt-dlp] [--json results.json]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+from common import ROOT
+from pipeline import MediaOrigin, parse_size, percentile
+
+sys.path.insert(0, ROOT)
+
+from engine import YtdlpPool
+
+ENGINES = ('cli', 'pool')
+
+
+def run_cli(command, url, folder):
+    """(seconds to the first progress line, seconds to exit) of one yt-dlp process"""
+    started = time.perf_counter()
+    first_progress = None
+    process = subprocess.Popen(
+        command + ['--newline', '--no-check-certificate', '-o', os.path.join(folder, '%(title)s.%(ext)s'), url],
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+    )
+    for line in process.stdout:
+        if first_progress is None and line.startswith('[download]') and '%' in line:
+            first_progress = time.perf_counter() - started
+    if process.wait() != 0:
+        raise RuntimeError(f'yt-dlp exited with {process.returncode}')
+    return first_progress, time.perf_counter() - started
+
+
+def run_pool(pool, url, folder):
+    """(seconds to the first progress event, seconds to the 'done' event) of one pool job"""
+    started = time.perf_counter()
+    first_progress = []
+
+    def on_event(event):
+        if event['event'] == 'progress' and not first_progress:
+            first_progress.append(time.perf_counter() - started)
+
+    job = {
+        'url': url,
+        'params': {'outtmpl': os.path.join(folder, '%(title)s.%(ext)s'), 'nocheckcertificate': True},
+        'info_path': None,
+        'filepath_record': None,
+    }
+    done = pool.run(job, on_event)
+    if done['returncode'] != 0:
+        raise RuntimeError(f'pool job failed: {done["error"]}')
+    return (first_progress or [None])[0], time.perf_counter() - started
+
+
+def summarize(samples):
+    return {
+        'p50_ms': round(statistics.median(samples) * 1000, 1),
+        'p95_ms': round(percentile(samples, 0.95) * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[1])
+    parser.add_argument('--runs', type=int, default=10, help='downloads per engine')
+    parser.add_argument('--size', type=parse_size, default='4M', help='bytes per video')
+    parser.add_argument('--ytdlp', help='yt-dlp executable for the cli engine (default: python -m yt_dlp)')
+    parser.add_argument('--json', help='write the results to this file')
+    args = parser.parse_args()
+
+    origin = ThreadingHTTPServer(('127.0.0.1', 0), MediaOrigin)
+    threading.Thread(target=origin.serve_forever, daemon=True).start()
+    command = [args.ytdlp] if args.ytdlp else [sys.executable, '-m', 'yt_dlp']
+    folder = tempfile.mkdtemp(prefix='tubegrab-bench-engine-')
+
+    pool = YtdlpPool(1)
+    started = time.perf_counter()
+    pool.prewarm()
+    # The worker is up once it has taken a job; a first download shows when that was
+    warmup_url = f'http://127.0.0.1:{origin.server_port}/media/warmup.mp4?size=1024'
+    run_pool(pool, warmup_url, folder)
+    prewarm = time.perf_counter() - started
+
+    timings = {engine: {'first_progress': [], 'total': []} for engine in ENGINES}
+    try:
+        for i in range(args.runs):
+            for engine in ENGINES:
+                # Every job gets its own file name, so nothing is skipped as already downloaded
+                url = f'http://127.0.0.1:{origin.server_port}/media/{engine}-{i}.mp4?size={args.size}'
+                if engine == 'cli':
+                    first_progress, total = run_cli(command, url, folder)
+                else:
+                    first_progress, total = run_pool(pool, url, folder)
+                if first_progress is not None:
+                    timings[engine]['first_progress'].append(first_progress)
+                timings[engine]['total'].append(total)
+    finally:
+        # The pool's workers exit when their stdin closes, with this process
+        origin.shutdown()
+        shutil.rmtree(folder, ignore_errors=True)
+
+    results = {
+        engine: {name: summarize(samples) for name, samples in values.items() if samples}
+        for engine, values in timings.items()
+    }
+    results['pool']['prewarm_ms'] = round(prewarm * 1000, 1)
+
+    print(f'{args.runs} downloads of {args.size / 1024 ** 2:g} MB per engine')
+    print(f'{"engine":<8}{"first progress p50":>20}{"p95":>10}{"total p50":>12}{"p95":>10}')
+    for engine in ENGINES:
+        result = results[engine]
+        first = result.get('first_progress', {'p50_ms': None, 'p95_ms': None})
+        print(f'{engine:<8}{str(first["p50_ms"]):>20}{str(first["p95_ms"]):>10}'
+              f'{result["total"]["p50_ms"]:>12}{result["total"]["p95_ms"]:>10}')
+    print(f'pool prewarm (paid once, at startup): {results["pool"]["prewarm_ms"]} ms')
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+"""
+TubeGrab - File serving benchmark
+Downloads one large video through the stub yt-dlp, then has concurrent clients
+fetch it from /api/file the three ways clients do: the whole file, a resume
+from an offset (an open-ended Range, served with sendfile() like the whole
+file) and a bounded Range (copied through Python in chunks). Reports the
+throughput and the server's CPU seconds per GB served for each.
+
+    python benchmarks/file_serving.py [--size 256M] [--clients 4] [--rounds 3]
+                                      [--server gunicorn] [--json results.json]
+"""
+
+import argparse
+import http.client
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+from common import ROOT, free_port, tree_cpu, wait_until_up
+from pipeline import STUBS, MediaOrigin, parse_size, request
+
+CASES = ('full', 'resume', 'range')
+READ_SIZE = 1024 * 1024
+
+
+def server_command(args, port):
+    if args.server == 'uvicorn':
+        return [sys.executable, '-m', 'uvicorn', 'asgi:app', '--port', str(port), '--log-level', 'warning']
+    return [sys.executable, '-m', 'gunicorn', '-w', '1', '--threads', str(args.clients + 4),
+            '-b', f'127.0.0.1:{port}', 'app:app']
+
+
+def range_header(case, size):
+    if case == 'resume':
+        return f'bytes={size // 2}-'
+    if case == 'range':
+        return f'bytes=0-{size - 2}'  # All but the last byte: not open-ended, so no sendfile()
+    return None
+
+
+def fetch(port, path, header):
+    """Bytes received for one GET of path, read into a reused buffer"""
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    try:
+        connection.request('GET', path, headers={'Range': header} if header else {})
+        response = connection.getresponse()
+        if response.status not in (200, 206):
+            raise RuntimeError(f'{path}: {response.status}')
+        buffer = memoryview(bytearray(READ_SIZE))
+        received = 0
+        while n := response.readinto(buffer):
+            received += n
+        return received
+    finally:
+        connection.close()
+
+
+def run_case(case, port, pid, download_id, size, args):
+    header = range_header(case, size)
+    received = []
+    errors = []
+
+    def client():
+        try:
+            for _ in range(args.rounds):
+                received.append(fetch(port, f'/api/file/{download_id}', header))
+        except (OSError, RuntimeError) as e:
+            errors.append(str(e))
+
+    cpu_before = tree_cpu(pid)
+    started = time.monotonic()
+    clients = [threading.Thread(target=client) for _ in range(args.clients)]
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    wall = time.monotonic() - started
+    cpu = tree_cpu(pid) - cpu_before
+
+    gigabytes = sum(received) / 1024 ** 3
+    return {
+        'transfers': len(received),
+        'errors': len(errors),
+        'error_samples': errors[:3],
+        'mb_per_second': round(sum(received) / wall / 1024 ** 2, 1),
+        'server_cpu_seconds': round(cpu, 2),
+        'cpu_seconds_per_gb': round(cpu / gigabytes, 3) if gigabytes else None,
+    }
+
+
+def run(args):
+    origin = ThreadingHTTPServer(('127.0.0.1', 0), MediaOrigin)
+    threading.Thread(target=origin.serve_forever, daemon=True).start()
+
+    folder = tempfile.mkdtemp(prefix='tubegrab-bench-files-')
+    port = free_port()
+    base = f'http://127.0.0.1:{port}'
+    env = dict(
+        os.environ,
+        TUBEGRAB_DOWNLOAD_FOLDER=folder,
+        TUBEGRAB_ENGINE='cli',
+        TUBEGRAB_COOKIES_BROWSER='',
+        TUBEGRAB_CLIENT_RATE='0',
+        TUBEGRAB_MIN_FREE_DISK='0',
+        YTDLP_PATH=os.path.join(STUBS, 'yt-dlp'),
+        FFMPEG_PATH=os.path.join(STUBS, 'ffmpeg'),
+        FFPROBE_PATH=os.path.join(STUBS, 'ffprobe'),
+    )
+    server = subprocess.Popen(server_command(args, port), cwd=ROOT, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+    try:
+        wait_until_up(f'{base}/api/cache/stats', server, args.server)
+
+        url = f'http://127.0.0.1:{origin.server_port}/media/large.mp4?size={args.size}&rate=0'
+        status, _, payload = request('POST', f'{base}/api/download', {'url': url})
+        if status != 200:
+            raise RuntimeError(f'/api/download: {status} {payload}')
+        download_id = payload['download_id']
+        deadline = time.monotonic() + 300
+        while (download := request('GET', f'{base}/api/progress/{download_id}')[2])['status'] != 'completed':
+            if download['status'] in ('error', 'cancelled') or time.monotonic() > deadline:
+                raise RuntimeError(f'the download did not complete: {download.get("error")}')
+            time.sleep(0.2)
+
+        fetch(port, f'/api/file/{download_id}', None)  # Warm the page cache
+        return {case: run_case(case, port, server.pid, download_id, args.size, args)
+                for case in args.cases.split(',')}
+    finally:
+        os.killpg(server.pid, signal.SIGTERM)
+        server.wait()
+        origin.shutdown()
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[1])
+    parser.add_argument('--size', type=parse_size, default='256M', help='size of the served video')
+    parser.add_argument('--clients', type=int, default=4, help='concurrent clients')
+    parser.add_argument('--rounds', type=int, default=3, help='transfers per client and case')
+    parser.add_argument('--server', choices=('gunicorn', 'uvicorn'), default='gunicorn')
+    parser.add_argument('--cases', default=','.join(CASES), help='comma-separated: full, resume, range')
+    parser.add_argument('--json', help='write the results to this file')
+    args = parser.parse_args()
+
+    results = run(args)
+
+    print(f'{args.size / 1024 ** 2:g} MB video, {args.clients} clients x {args.rounds} transfers, {args.server}')
+    print(f'{"case":<8}{"transfers":>11}{"MB/s":>10}{"CPU s":>9}{"CPU s/GB":>10}{"errors":>8}')
+    for case, result in results.items():
+        print(f'{case:<8}{result["transfers"]:>11}{result["mb_per_second"]:>10}{result["server_cpu_seconds"]:>9}'
+              f'{str(result["cpu_seconds_per_gb"]):>10}{result["errors"]:>8}')
+        for error in result['error_samples']:
+            print(f'error: {error}')
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
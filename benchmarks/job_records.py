@@ -0,0 +1,105 @@
+"""
+TubeGrab - Job record memory benchmark
+Takes N download records through the fields a typical job gets - queued with
+its options, estimates and timeline, then progress ticks, the title, the media
+key and completion - and measures the memory they hold (tracemalloc), stored as
+MemoryJobStore's JobRecord objects and as plain dicts. Also reports how many
+records still need an `extra` dict for fields without a slot.
+
+    python benchmarks/job_records.py [--jobs 100000] [--json results.json]
+"""
+
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+
+from common import ROOT
+
+sys.path.insert(0, ROOT)
+
+from jobstore import JobRecord
+
+
+def lifecycle(i):
+    """The records a job is created with and the updates it gets, like app.py sends them"""
+    started = round(time.time(), 3)
+    created = {
+        'status': 'queued',
+        'progress': 0,
+        'url': f'https://www.youtube.com/watch?v=video{i:06d}',
+        'error': None,
+        'filename': None,
+        'cookies_token': None,
+        'priority': 0,
+        'options': None,
+        'estimated_size': 48_000_000 + i,
+        'estimated_duration': 600.0,
+        'timeline': [{'stage': 'queued', 'start': started, 'end': None}],
+    }
+    timeline = [{'stage': 'queued', 'start': started, 'end': started + 0.1},
+                {'stage': 'download', 'start': started + 0.1, 'end': None}]
+    updates = [
+        {'status': 'downloading', 'timeline': timeline, 'media_key': f'video{i:06d}|best'},
+        {'progress': 42.5, 'speed': 2_500_000.0, 'eta': 12, 'downloaded_bytes': 20_000_000,
+         'total_bytes': 48_000_000},
+        {'title': f'Video number {i}'},
+        {'progress': 100, 'speed': None, 'eta': 0, 'downloaded_bytes': 48_000_000},
+        {'status': 'completed', 'progress': 100, 'filename': f'/downloads/Video number {i}.mp4',
+         'attached_to': None, 'timeline': timeline[:1] + [dict(timeline[1], end=started + 20)]},
+    ]
+    return created, updates
+
+
+def measure(kind, jobs):
+    """(bytes held by the records, records with an extra dict)"""
+    tracemalloc.start()
+    records = {}
+    for i in range(jobs):
+        created, updates = lifecycle(i)
+        if kind == 'record':
+            record = JobRecord(created)
+            for fields in updates:
+                record.update(fields)
+        else:
+            record = dict(created)
+            for fields in updates:
+                record.update(fields)
+        records[f'{i:08x}'] = record
+        del created, updates
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    with_extra = sum(1 for record in records.values() if kind == 'record' and record.extra)
+    return held, with_extra
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[1])
+    parser.add_argument('--jobs', type=int, default=100_000, help='download records to keep')
+    parser.add_argument('--json', help='write the results to this file')
+    args = parser.parse_args()
+
+    results = {}
+    for kind in ('dict', 'record'):
+        held, with_extra = measure(kind, args.jobs)
+        results[kind] = {
+            'mb': round(held / 1024 ** 2, 1),
+            'bytes_per_job': round(held / args.jobs),
+            'records_with_extra': with_extra,
+        }
+
+    print(f'{args.jobs} completed jobs')
+    print(f'{"storage":<10}{"MB":>9}{"bytes/job":>12}{"with extra":>12}')
+    for kind, result in results.items():
+        print(f'{kind:<10}{result["mb"]:>9}{result["bytes_per_job"]:>12}{result["records_with_extra"]:>12}')
+    saved = 1 - results['record']['mb'] / results['dict']['mb']
+    print(f'JobRecord saves {saved:.0%} against dicts')
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
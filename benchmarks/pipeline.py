@@ -0,0 +1,363 @@
+"""
+TubeGrab - Download pipeline benchmark
+Runs app.py's whole pipeline offline and reports throughput, per-stage
+latencies and the server's peak resource use. Each job goes through
+/api/info, /api/download, /api/progress polling and /api/file, against a local
+media origin with configurable size and speed; yt-dlp, ffmpeg and ffprobe are
+the stand-ins in benchmarks/stubs (with --engine pool, the real yt-dlp module
+fetches from the origin instead).
+
+    python benchmarks/pipeline.py [--jobs 20] [--concurrency 4] [--size 8M] [--rate 4M]
+                                  [--conversion remux|audio|encode]
+                                  [--json baseline.json] [--compare baseline.json]
+
+--json saves the results as a baseline; --compare prints the change against one
+and exits with status 1 if anything got worse by more than --tolerance.
+"""
+
+import argparse
+import json
+import math
+import os
+import re
+import shutil
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from common import ROOT, free_port, tree_usage, wait_until_up
+
+STUBS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stubs')
+FINISHED = ('completed', 'error', 'cancelled')
+SAMPLE_INTERVAL = 0.25
+# Codecs the stub ffprobe reports (video, audio), for each path of converter.py's planner
+CONVERSIONS = {'remux': ('h264', 'aac'), 'audio': ('h264', 'vorbis'), 'encode': ('vp8', 'vorbis')}
+
+# Metrics where a higher value is better; for all the others lower is better
+HIGHER_IS_BETTER = ('jobs_per_second', 'served_mb_per_second')
+
+
+def parse_size(value):
+    """'8M' -> bytes"""
+    match = re.fullmatch(r'(\d+(?:\.\d+)?)\s*([KMG]?)', value.strip().upper())
+    if not match:
+        raise argparse.ArgumentTypeError(f'not a size: {value}')
+    return int(float(match.group(1)) * 1024 ** ' KMG'.index(match.group(2) or ' '))
+
+
+class MediaOrigin(BaseHTTPRequestHandler):
+    """
+    Serves /media/<name>.<ext>?size=<bytes>&rate=<bytes/s> as that many bytes
+    at that speed (0 for unthrottled), with the content type of the extension
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.respond(body=True)
+
+    def do_HEAD(self):
+        self.respond(body=False)
+
+    def respond(self, body):
+        parts = urlsplit(self.path)
+        query = parse_qs(parts.query)
+        size = int(query.get('size', ['1048576'])[0])
+        rate = float(query.get('rate', ['0'])[0])
+        ext = os.path.splitext(parts.path)[1].lstrip('.') or 'mp4'
+        self.send_response(200)
+        self.send_header('Content-Type', f'video/{ext}')
+        self.send_header('Content-Length', str(size))
+        self.end_headers()
+        if not body:
+            return
+
+        chunk = b'\0' * 65536
+        sent, started = 0, time.monotonic()
+        try:
+            while sent < size:
+                n = min(len(chunk), size - sent)
+                self.wfile.write(chunk[:n])
+                sent += n
+                if rate:
+                    time.sleep(max(0.0, started + sent / rate - time.monotonic()))
+        except OSError:
+            pass  # Extractors only read the start
+
+    def log_message(self, format, *args):
+        pass
+
+
+def request(method, url, data=None, timeout=60):
+    """(status, headers, parsed JSON body or None)"""
+    body = json.dumps(data).encode() if data is not None else None
+    req = urllib.request.Request(url, data=body, method=method, headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            return response.status, response.headers, json.load(response)
+    except urllib.error.HTTPError as e:
+        try:
+            payload = json.load(e)
+        except ValueError:
+            payload = None
+        return e.code, e.headers, payload
+
+
+def admitted(method, url, data, stats):
+    """A request retried while the server answers 429, honouring Retry-After"""
+    while True:
+        status, headers, payload = request(method, url, data)
+        if status != 429:
+            return status, payload
+        with stats['lock']:
+            stats['rejected'] += 1
+        time.sleep(float(headers.get('Retry-After') or 1))
+
+
+def run_job(base, media_url, poll, stats):
+    """One job through the whole API. Returns {stage: seconds} or raises on failure."""
+    timings = {}
+    started = time.perf_counter()
+
+    t = time.perf_counter()
+    status, info = admitted('POST', f'{base}/api/info', {'url': media_url}, stats)
+    if status != 200:
+        raise RuntimeError(f'/api/info: {status} {info}')
+    timings['info'] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    status, payload = admitted('POST', f'{base}/api/download', {'url': media_url}, stats)
+    if status != 200:
+        raise RuntimeError(f'/api/download: {status} {payload}')
+    download_id = payload['download_id']
+    timings['download_request'] = time.perf_counter() - t
+
+    while True:
+        status, _, download = request('GET', f'{base}/api/progress/{download_id}')
+        if status != 200:
+            raise RuntimeError(f'/api/progress: {status}')
+        if download['status'] in FINISHED:
+            break
+        time.sleep(poll)
+    if download['status'] != 'completed':
+        raise RuntimeError(f'download {download["status"]}: {download.get("error")}')
+    timings['pipeline'] = time.perf_counter() - t
+
+    # The server's own stage timeline: queued, extract, download, merge, convert_queued, convert
+    for stage in download.get('timeline') or []:
+        if stage['end'] is not None:
+            timings[f'server_{stage["stage"]}'] = timings.get(f'server_{stage["stage"]}', 0) + (
+                stage['end'] - stage['start'])
+
+    t = time.perf_counter()
+    size = 0
+    with urllib.request.urlopen(f'{base}/api/file/{download_id}', timeout=60) as response:
+        while chunk := response.read(1024 * 1024):
+            size += len(chunk)
+    timings['file'] = time.perf_counter() - t
+    timings['end_to_end'] = time.perf_counter() - started
+
+    request('DELETE', f'{base}/api/cleanup/{download_id}')
+    with stats['lock']:
+        stats['served_bytes'] += size
+    return timings
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, math.ceil(len(values) * fraction) - 1)]
+
+
+def server_command(args, port):
+    if args.server == 'uvicorn':
+        return [sys.executable, '-m', 'uvicorn', 'asgi:app', '--port', str(port), '--log-level', 'warning']
+    # Enough threads that progress polling never waits behind file transfers
+    return [sys.executable, '-m', 'gunicorn', '-w', '1', '--threads', str(args.concurrency * 2 + 8),
+            '-b', f'127.0.0.1:{port}', 'app:app']
+
+
+def run(args):
+    origin = ThreadingHTTPServer(('127.0.0.1', 0), MediaOrigin)
+    threading.Thread(target=origin.serve_forever, daemon=True).start()
+
+    folder = tempfile.mkdtemp(prefix='tubegrab-bench-')
+    port = free_port()
+    base = f'http://127.0.0.1:{port}'
+    env = dict(
+        os.environ,
+        TUBEGRAB_DOWNLOAD_FOLDER=folder,
+        TUBEGRAB_ENGINE=args.engine,
+        TUBEGRAB_MAX_DOWNLOADS=str(args.max_downloads),
+        TUBEGRAB_COOKIES_BROWSER='',
+        TUBEGRAB_CLIENT_RATE='0',
+        TUBEGRAB_MIN_FREE_DISK='0',
+        YTDLP_PATH=os.path.join(STUBS, 'yt-dlp'),
+        FFMPEG_PATH=os.path.join(STUBS, 'ffmpeg'),
+        FFPROBE_PATH=os.path.join(STUBS, 'ffprobe'),
+        BENCH_FFMPEG_RATE=str(args.ffmpeg_rate),
+        BENCH_VCODEC=CONVERSIONS[args.conversion][0],
+        BENCH_ACODEC=CONVERSIONS[args.conversion][1],
+    )
+    server = subprocess.Popen(server_command(args, port), cwd=ROOT, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+
+    peak = {'threads': 0, 'rss': 0, 'fds': 0}
+    sampling = threading.Event()
+
+    def sample():
+        while not sampling.wait(SAMPLE_INTERVAL):
+            for key, value in tree_usage(server.pid).items():
+                peak[key] = max(peak[key], value)
+
+    stats = {'lock': threading.Lock(), 'served_bytes': 0, 'rejected': 0}
+    timings, errors = [], []
+    try:
+        wait_until_up(f'{base}/api/cache/stats', server, args.server)
+        sampler = threading.Thread(target=sample, daemon=True)
+        sampler.start()
+
+        # Every job gets its own URL - the same one would be served from the first download's file
+        urls = [f'http://127.0.0.1:{origin.server_port}/media/video-{i}.{args.ext}?size={args.size}&rate={args.rate}'
+                for i in range(args.jobs)]
+        started = time.perf_counter()
+        with ThreadPoolExecutor(args.concurrency) as pool:
+            futures = [pool.submit(run_job, base, url, args.poll, stats) for url in urls]
+            for future in futures:
+                try:
+                    timings.append(future.result())
+                except Exception as e:
+                    errors.append(str(e))
+        wall = time.perf_counter() - started
+        sampling.set()
+        sampler.join()
+    finally:
+        sampling.set()
+        os.killpg(server.pid, signal.SIGTERM)
+        server.wait()
+        origin.shutdown()
+        shutil.rmtree(folder, ignore_errors=True)
+
+    stages = sorted({stage for job in timings for stage in job})
+    return {
+        'jobs': len(timings),
+        'errors': len(errors),
+        'error_samples': errors[:5],
+        'rejected_429': stats['rejected'],
+        'wall_seconds': round(wall, 3),
+        'jobs_per_second': round(len(timings) / wall, 3),
+        'served_mb_per_second': round(stats['served_bytes'] / wall / 1048576, 3),
+        'stages': {
+            stage: {
+                'p50_ms': round(statistics.median(values) * 1000, 1),
+                'p99_ms': round(percentile(values, 0.99) * 1000, 1),
+            }
+            for stage in stages
+            for values in [[job[stage] for job in timings if stage in job]]
+        },
+        'peak_rss_mb': round(peak['rss'] / 1048576, 1),
+        'peak_threads': peak['threads'],
+        'peak_fds': peak['fds'],
+    }
+
+
+def flatten(results):
+    """{metric name: value} of the numbers worth comparing between runs"""
+    metrics = {key: results[key] for key in ('jobs_per_second', 'served_mb_per_second', 'peak_rss_mb',
+                                             'peak_threads', 'peak_fds', 'errors')}
+    for stage, values in results['stages'].items():
+        for name, value in values.items():
+            metrics[f'{stage}.{name}'] = value
+    return metrics
+
+
+def compare(baseline, results, tolerance, min_delta_ms):
+    """
+    Print each metric's change against a baseline. Returns the names of the
+    regressed ones; latencies that moved less than min_delta_ms are noise.
+    """
+    before, after = flatten(baseline['results']), flatten(results)
+    regressions = []
+    print(f'\nAgainst {baseline.get("commit") or "baseline"}:')
+    print(f'{"metric":<34}{"baseline":>12}{"now":>12}{"change":>10}')
+    for name in sorted(set(before) | set(after)):
+        old, new = before.get(name), after.get(name)
+        if old is None or new is None:
+            print(f'{name:<34}{str(old):>12}{str(new):>12}{"":>10}')
+            continue
+        change = (new - old) / old if old else (0.0 if new == old else math.inf)
+        worse = -change if name in HIGHER_IS_BETTER else change
+        flag = ''
+        noise = name.endswith('_ms') and abs(new - old) < min_delta_ms
+        if worse > tolerance and not noise and (name != 'errors' or new > old):
+            flag = '  !'
+            regressions.append(name)
+        print(f'{name:<34}{old:>12}{new:>12}{change:>+9.1%}{flag}')
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[1])
+    parser.add_argument('--jobs', type=int, default=20, help='downloads to run')
+    parser.add_argument('--concurrency', type=int, default=4, help='jobs driven at the same time')
+    parser.add_argument('--size', type=parse_size, default='8M', help='bytes per video')
+    parser.add_argument('--rate', type=parse_size, default='4M', help='origin speed per download in bytes/s (0: unthrottled)')
+    parser.add_argument('--ext', default='webm', help='media extension: webm goes through conversion, mp4 does not')
+    parser.add_argument('--conversion', choices=CONVERSIONS, default='audio',
+                        help='conversion plan the webm files get (the stub ffmpeg copies the bytes either way)')
+    parser.add_argument('--ffmpeg-rate', type=parse_size, default='0', help='stub ffmpeg speed in bytes/s (0: unthrottled)')
+    parser.add_argument('--engine', choices=('cli', 'pool'), default='cli',
+                        help='cli runs the stub yt-dlp, pool the real yt-dlp module in warm workers')
+    parser.add_argument('--server', choices=('gunicorn', 'uvicorn'), default='gunicorn')
+    parser.add_argument('--max-downloads', type=int, default=3, help='TUBEGRAB_MAX_DOWNLOADS of the server')
+    parser.add_argument('--poll', type=float, default=0.1, help='seconds between /api/progress polls')
+    parser.add_argument('--json', help='save the results (a baseline) to this file')
+    parser.add_argument('--compare', help='baseline file to compare the results with')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='allowed change before flagging (0.1 = 10%%)')
+    parser.add_argument('--min-delta-ms', type=float, default=50,
+                        help='latency changes smaller than this are never flagged')
+    args = parser.parse_args()
+
+    results = run(args)
+
+    print(f'{results["jobs"]} jobs in {results["wall_seconds"]} s: {results["jobs_per_second"]} jobs/s, '
+          f'{results["served_mb_per_second"]} MB/s served, {results["errors"]} errors, '
+          f'{results["rejected_429"]} 429s')
+    print(f'peak: {results["peak_rss_mb"]} MB RSS, {results["peak_threads"]} threads, {results["peak_fds"]} fds')
+    print(f'{"stage":<24}{"p50 ms":>10}{"p99 ms":>10}')
+    for stage, values in results['stages'].items():
+        print(f'{stage:<24}{values["p50_ms"]:>10}{values["p99_ms"]:>10}')
+    for error in results['error_samples']:
+        print(f'error: {error}')
+
+    regressions = []
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), results, args.tolerance, args.min_delta_ms)
+
+    if args.json:
+        config = {name: value for name, value in vars(args).items() if name not in ('json', 'compare')}
+        with open(args.json, 'w') as f:
+            json.dump({'commit': git_commit(), 'config': config, 'results': results}, f, indent=2)
+
+    if regressions:
+        sys.exit(f'\nRegressed beyond {args.tolerance:.0%}: {", ".join(regressions)}')
+
+
+if __name__ == '__main__':
+    main()
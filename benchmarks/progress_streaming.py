@@ -0,0 +1,173 @@
+"""
+TubeGrab - Progress polling vs streaming benchmark
+Runs N downloads at once and watches each one the two ways the web client can:
+polling /api/progress every 500 ms, or holding an /api/progress/<id>/stream
+(Server-Sent Events) connection open. Reports the requests per second the
+server answers, the bytes it sends and the CPU it spends on them. Downloads run
+the stub yt-dlp against a local, throttled origin; its CPU is left out.
+
+    python benchmarks/progress_streaming.py [--jobs 50] [--seconds 15] [--poll 0.5]
+                                            [--server gunicorn] [--json results.json]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+from common import ROOT, free_port, tree_cpu, wait_until_up
+from pipeline import STUBS, MediaOrigin, request
+
+MODES = ('poll', 'sse')
+RATE = 64 * 1024  # Origin speed per download: slow enough that every job outlasts the window
+
+
+def server_command(args, port):
+    if args.server == 'uvicorn':
+        return [sys.executable, '-m', 'uvicorn', 'asgi:app', '--port', str(port), '--log-level', 'warning']
+    # Every open stream holds a worker thread, so there is one per client and some to spare
+    return [sys.executable, '-m', 'gunicorn', '-w', '1', '--threads', str(args.jobs + 8),
+            '-b', f'127.0.0.1:{port}', 'app:app']
+
+
+def poll_client(base, download_id, interval, until, counts):
+    """Poll /api/progress like the web client without EventSource"""
+    requests = received = 0
+    while time.monotonic() < until:
+        started = time.monotonic()
+        with urllib.request.urlopen(f'{base}/api/progress/{download_id}', timeout=30) as response:
+            received += len(response.read())
+        requests += 1
+        time.sleep(max(0.0, started + interval - time.monotonic()))
+    counts.append({'requests': requests, 'bytes': received, 'updates': requests})
+
+
+def sse_client(base, download_id, until, counts):
+    """Hold one progress stream open, reading its events until the deadline"""
+    received = events = 0
+    with urllib.request.urlopen(f'{base}/api/progress/{download_id}/stream', timeout=30) as response:
+        while time.monotonic() < until:
+            line = response.readline()
+            if not line:
+                break  # The download finished and the stream ended
+            received += len(line)
+            if line.startswith(b'data:'):
+                events += 1
+    counts.append({'requests': 1, 'bytes': received, 'updates': events})
+
+
+def run_mode(mode, origin_port, args):
+    folder = tempfile.mkdtemp(prefix=f'tubegrab-bench-{mode}-')
+    port = free_port()
+    base = f'http://127.0.0.1:{port}'
+    env = dict(
+        os.environ,
+        TUBEGRAB_DOWNLOAD_FOLDER=folder,
+        TUBEGRAB_ENGINE='cli',
+        TUBEGRAB_MAX_DOWNLOADS=str(args.jobs),
+        TUBEGRAB_MAX_QUEUED=str(args.jobs * 2),
+        TUBEGRAB_ASGI_THREADS=str(args.jobs + 8),
+        TUBEGRAB_COOKIES_BROWSER='',
+        TUBEGRAB_CLIENT_RATE='0',
+        TUBEGRAB_MIN_FREE_DISK='0',
+        YTDLP_PATH=os.path.join(STUBS, 'yt-dlp'),
+        FFMPEG_PATH=os.path.join(STUBS, 'ffmpeg'),
+        FFPROBE_PATH=os.path.join(STUBS, 'ffprobe'),
+    )
+    server = subprocess.Popen(server_command(args, port), cwd=ROOT, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+    try:
+        wait_until_up(f'{base}/api/cache/stats', server, args.server)
+
+        size = RATE * int(args.seconds + 30)
+        download_ids = []
+        for i in range(args.jobs):
+            url = f'http://127.0.0.1:{origin_port}/media/{mode}-{i}.mp4?size={size}&rate={RATE}'
+            status, _, payload = request('POST', f'{base}/api/download', {'url': url})
+            if status != 200:
+                raise RuntimeError(f'/api/download: {status} {payload}')
+            download_ids.append(payload['download_id'])
+
+        # Measure only once every download is moving
+        deadline = time.monotonic() + 60
+        while not all(request('GET', f'{base}/api/progress/{download_id}')[2]['status'] == 'downloading'
+                      for download_id in download_ids):
+            if time.monotonic() > deadline:
+                raise RuntimeError(f'{mode}: the downloads did not start')
+            time.sleep(0.2)
+
+        counts = []
+        cpu_before = tree_cpu(server.pid, exclude=('yt-dlp',))
+        started = time.monotonic()
+        until = started + args.seconds
+        if mode == 'poll':
+            clients = [threading.Thread(target=poll_client, args=(base, download_id, args.poll, until, counts))
+                       for download_id in download_ids]
+        else:
+            clients = [threading.Thread(target=sse_client, args=(base, download_id, until, counts))
+                       for download_id in download_ids]
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+        wall = time.monotonic() - started
+        cpu = tree_cpu(server.pid, exclude=('yt-dlp',)) - cpu_before
+
+        requests = sum(count['requests'] for count in counts)
+        received = sum(count['bytes'] for count in counts)
+        updates = sum(count['updates'] for count in counts)
+        return {
+            'clients': len(counts),
+            'requests': requests,
+            'requests_per_second': round(requests / wall, 1),
+            'updates_per_second': round(updates / wall, 1),
+            'kb_per_second': round(received / wall / 1024, 1),
+            'server_cpu_seconds': round(cpu, 2),
+            'server_cpu_percent': round(cpu / wall * 100, 1),
+        }
+    finally:
+        os.killpg(server.pid, signal.SIGTERM)
+        server.wait()
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[1])
+    parser.add_argument('--jobs', type=int, default=50, help='concurrent downloads, each with one watching client')
+    parser.add_argument('--seconds', type=float, default=15, help='how long the clients watch')
+    parser.add_argument('--poll', type=float, default=0.5, help='seconds between polls (the web client uses 0.5)')
+    parser.add_argument('--server', choices=('gunicorn', 'uvicorn'), default='gunicorn')
+    parser.add_argument('--modes', default=','.join(MODES), help='comma-separated: poll, sse')
+    parser.add_argument('--json', help='write the results to this file')
+    args = parser.parse_args()
+
+    origin = ThreadingHTTPServer(('127.0.0.1', 0), MediaOrigin)
+    threading.Thread(target=origin.serve_forever, daemon=True).start()
+    try:
+        results = {mode: run_mode(mode, origin.server_port, args) for mode in args.modes.split(',')}
+    finally:
+        origin.shutdown()
+
+    print(f'{args.jobs} concurrent jobs, {args.seconds:g} s, {args.server}')
+    print(f'{"mode":<6}{"clients":>9}{"requests":>10}{"req/s":>9}{"updates/s":>11}{"KB/s":>9}'
+          f'{"CPU s":>8}{"CPU %":>8}')
+    for mode, result in results.items():
+        print(f'{mode:<6}{result["clients"]:>9}{result["requests"]:>10}{result["requests_per_second"]:>9}'
+              f'{result["updates_per_second"]:>11}{result["kb_per_second"]:>9}'
+              f'{result["server_cpu_seconds"]:>8}{result["server_cpu_percent"]:>8}')
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
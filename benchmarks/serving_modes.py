@@ -0,0 +1,199 @@
+"""
+TubeGrab - Serving mode benchmark
+Compares the Flask app under gunicorn (worker threads) with the ASGI app under
+uvicorn while slow clients keep file transfers open: how long a quick API
+request takes meanwhile, and the threads and memory each server needs. The
+video comes from a local origin so the network doesn't skew it.
+
+    python benchmarks/serving_modes.py [--slow-clients 64] [--threads 8] [--seconds 10] [--json results.json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from common import ROOT, free_port, tree_usage, wait_until_up
+
+MODES = ('flask', 'asgi')
+VIDEO_SIZE = 32 * 1024 * 1024
+PROBE_TIMEOUT = 5
+
+
+class StubOrigin(BaseHTTPRequestHandler):
+    """Serves VIDEO_SIZE bytes for any path, like a plain MP4 on a web server"""
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'video/mp4')
+        self.send_header('Content-Length', str(VIDEO_SIZE))
+        self.end_headers()
+        chunk = b'\0' * (1024 * 1024)
+        try:
+            for _ in range(VIDEO_SIZE // len(chunk)):
+                self.wfile.write(chunk)
+        except OSError:
+            pass  # The downloader hung up
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'video/mp4')
+        self.send_header('Content-Length', str(VIDEO_SIZE))
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def server_command(mode, port, threads):
+    if mode == 'flask':
+        return [sys.executable, '-m', 'gunicorn', '-w', '1', '--threads', str(threads),
+                '-b', f'127.0.0.1:{port}', 'app:app']
+    return [sys.executable, '-m', 'uvicorn', 'asgi:app', '--port', str(port), '--log-level', 'warning']
+
+
+def http_json(method, url, data=None):
+    body = json.dumps(data).encode() if data is not None else None
+    request = urllib.request.Request(url, data=body, method=method, headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request, timeout=30) as response:
+        return json.load(response)
+
+
+async def slow_client(port, path, until, connected):
+    """Fetch path with a tiny receive window, reading a little at a time until the deadline"""
+    sock = socket.socket()
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8192)
+    sock.setblocking(False)
+    try:
+        await asyncio.get_running_loop().sock_connect(sock, ('127.0.0.1', port))
+        reader, writer = await asyncio.open_connection(sock=sock)
+        writer.write(f'GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n'.encode())
+        await writer.drain()
+        await reader.readuntil(b'\r\n\r\n')
+        if time.monotonic() < until:
+            connected.append(1)  # Not one of those let in as the others hung up
+        while time.monotonic() < until:
+            if not await reader.read(4096):
+                break
+            await asyncio.sleep(0.1)
+        writer.close()
+    except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+        sock.close()
+
+
+async def probe(port, path):
+    """Seconds a quick GET takes, or None if it timed out"""
+    started = time.monotonic()
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), PROBE_TIMEOUT)
+        writer.write(f'GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n\r\n'.encode())
+        await asyncio.wait_for(reader.read(), PROBE_TIMEOUT - (time.monotonic() - started))
+        writer.close()
+    except (OSError, asyncio.TimeoutError):
+        return None
+    return time.monotonic() - started
+
+
+async def load(port, download_id, pid, slow_clients, seconds):
+    until = time.monotonic() + seconds
+    connected = []
+    clients = [asyncio.ensure_future(slow_client(port, f'/api/file/{download_id}', until, connected))
+               for _ in range(slow_clients)]
+    await asyncio.sleep(1)  # Let the transfers fill the server's workers
+
+    latencies, timeouts = [], 0
+    peak_threads = peak_rss = 0
+    while time.monotonic() < until:
+        latency = await probe(port, f'/api/progress/{download_id}')
+        if latency is None:
+            timeouts += 1
+        else:
+            latencies.append(latency)
+        usage = tree_usage(pid)
+        peak_threads, peak_rss = max(peak_threads, usage['threads']), max(peak_rss, usage['rss'])
+        await asyncio.sleep(0.1)
+    await asyncio.gather(*clients)
+
+    latencies.sort()
+    return {
+        'slow_clients_served': len(connected),
+        'probes': len(latencies) + timeouts,
+        'probe_timeouts': timeouts,
+        'probe_p50_ms': round(statistics.median(latencies) * 1000, 2) if latencies else None,
+        'probe_p99_ms': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000, 2)
+                        if latencies else None,
+        'peak_threads': peak_threads,
+        'peak_rss_mb': round(peak_rss / 1024 / 1024, 1),
+    }
+
+
+def run_mode(mode, origin, args):
+    folder = tempfile.mkdtemp(prefix=f'tubegrab-bench-{mode}-')
+    port = free_port()
+    env = dict(
+        os.environ,
+        TUBEGRAB_DOWNLOAD_FOLDER=folder,
+        TUBEGRAB_ASGI_THREADS=str(args.threads),
+        TUBEGRAB_COOKIES_BROWSER='',
+        TUBEGRAB_CLIENT_RATE='0',
+    )
+    server = subprocess.Popen(server_command(mode, port, args.threads), cwd=ROOT, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+    base = f'http://127.0.0.1:{port}'
+    try:
+        wait_until_up(f'{base}/api/cache/stats', server, mode)
+
+        download_id = http_json('POST', f'{base}/api/download', {'url': f'{origin}/video.mp4'})['download_id']
+        deadline = time.monotonic() + 120
+        while http_json('GET', f'{base}/api/progress/{download_id}')['status'] != 'completed':
+            if time.monotonic() > deadline:
+                raise RuntimeError(f'{mode}: the download did not complete')
+            time.sleep(0.2)
+
+        return asyncio.run(load(port, download_id, server.pid, args.slow_clients, args.seconds))
+    finally:
+        os.killpg(server.pid, signal.SIGTERM)
+        server.wait()
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[1])
+    parser.add_argument('--slow-clients', type=int, default=64, help='concurrent slow file transfers')
+    parser.add_argument('--threads', type=int, default=8, help='gunicorn worker threads / ASGI thread pool size')
+    parser.add_argument('--seconds', type=float, default=10, help='how long the slow clients stay')
+    parser.add_argument('--modes', default=','.join(MODES), help='comma-separated: flask, asgi')
+    parser.add_argument('--json', help='write the results to this file')
+    args = parser.parse_args()
+
+    origin = ThreadingHTTPServer(('127.0.0.1', 0), StubOrigin)
+    threading.Thread(target=origin.serve_forever, daemon=True).start()
+    origin_url = f'http://127.0.0.1:{origin.server_port}'
+
+    results = {mode: run_mode(mode, origin_url, args) for mode in args.modes.split(',')}
+
+    print(f'{"mode":<8}{"slow served":>13}{"probe p50 ms":>14}{"probe p99 ms":>14}{"timeouts":>10}'
+          f'{"threads":>9}{"RSS MB":>9}')
+    for mode, result in results.items():
+        print(f'{mode:<8}{result["slow_clients_served"]:>13}{str(result["probe_p50_ms"]):>14}'
+              f'{str(result["probe_p99_ms"]):>14}{result["probe_timeouts"]:>6}/{result["probes"]:<3}'
+              f'{result["peak_threads"]:>9}{result["peak_rss_mb"]:>9}')
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
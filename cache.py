@@ -0,0 +1,146 @@
+"""
+TubeGrab - Metadata cache
+TTL + LRU cache with a memory bound that merges concurrent lookups of the same key
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+def json_size(value):
+    """Rough memory footprint of a JSON-like value (its serialized length)"""
+    return len(json.dumps(value, default=str))
+
+
+class _Entry:
+    __slots__ = ('value', 'size', 'created', 'expires')
+
+    def __init__(self, value, size, ttl):
+        self.value = value
+        self.size = size
+        self.created = time.time()
+        self.expires = self.created + ttl
+
+
+class _Pending:
+    """A load in progress that other callers for the same key wait on"""
+    __slots__ = ('event', 'value', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class InfoCache:
+    """
+    Thread-safe cache evicting least recently used entries once either
+    max_entries or max_bytes is exceeded. Entries expire after ttl seconds.
+    """
+
+    def __init__(self, ttl=600, max_entries=256, max_bytes=64 * 1024 * 1024, sizeof=json_size):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.merged = 0
+        self.evictions = 0
+
+    def get(self, key, max_age=None):
+        """Return a fresh cached value (or None) without counting it as a lookup"""
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is None:
+                return None
+            if max_age is not None and time.time() - entry.created > max_age:
+                return None
+            return entry.value
+
+    def put(self, key, value):
+        size = self._sizeof(value)
+        with self._lock:
+            self._remove(key)
+            if size > self.max_bytes:
+                return  # Would evict everything else and still not fit
+            self._entries[key] = _Entry(value, size, self.ttl)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def get_or_load(self, key, loader):
+        """
+        Return the cached value for key, calling loader() on a miss.
+        Concurrent misses for the same key share a single loader() call.
+        Errors are not cached.
+        """
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is not None:
+                self.hits += 1
+                return entry.value
+
+            pending = self._inflight.get(key)
+            leader = pending is None
+            if leader:
+                pending = self._inflight[key] = _Pending()
+                self.misses += 1
+            else:
+                self.merged += 1
+
+        if not leader:
+            pending.event.wait()
+            if pending.error is not None:
+                raise pending.error
+            return pending.value
+
+        try:
+            pending.value = loader()
+            self.put(key, pending.value)
+            return pending.value
+        except Exception as e:
+            pending.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            pending.event.set()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses + self.merged
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'merged': self.merged,
+                'evictions': self.evictions,
+                'hit_rate': (self.hits + self.merged) / lookups if lookups else 0.0,
+            }
+
+    def _lookup(self, key):
+        # Caller holds the lock
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires <= time.time():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _remove(self, key):
+        # Caller holds the lock
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
@@ -0,0 +1,118 @@
+"""
+TubeGrab - Conversion planner
+Probes a downloaded file with ffprobe and picks the cheapest way to turn it into
+an MP4: remux every stream as is, re-encode only the audio, or re-encode the video.
+"""
+
+import json
+import subprocess
+
+# Codecs an MP4 container can carry as they are. The target is playback in Chromium
+# and Firefox based browsers and VLC/mpv, which play VP9 and Opus from MP4, so
+# YouTube's usual VP9/Opus WebM is only remuxed; AUDIO is for Vorbis and the other
+# audio those players don't take from MP4. For QuickTime, older Safari and most TVs
+# vp9, opus and flac would have to come out of these sets.
+MP4_VIDEO_CODECS = frozenset({'h264', 'hevc', 'av1', 'vp9', 'mpeg4'})
+MP4_AUDIO_CODECS = frozenset({'aac', 'mp3', 'opus', 'flac', 'alac', 'ac3', 'eac3'})
+
+# Plans, cheapest first
+REMUX = 'remux'     # Copy all streams, just move the index to the front
+AUDIO = 'audio'     # Copy the video, re-encode the audio to AAC
+ENCODE = 'encode'   # Re-encode everything to H.264/AAC
+
+
+def probe_media(ffprobe_path, path, timeout=60):
+    """
+    Return {'duration': seconds or None, 'video': codec or None, 'audio': codec or None}
+    for the first video and audio stream of a file, or None if ffprobe can't read it.
+    """
+    cmd = [
+        ffprobe_path, '-v', 'error',
+        '-show_entries', 'format=duration:stream=codec_type,codec_name',
+        '-of', 'json',
+        path
+    ]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
+        data = json.loads(result.stdout) if result.returncode == 0 else None
+    except (OSError, subprocess.TimeoutExpired, ValueError):
+        return None
+    if not data:
+        return None
+
+    media = {'duration': None, 'video': None, 'audio': None}
+    try:
+        media['duration'] = float(data.get('format', {}).get('duration'))
+    except (TypeError, ValueError):
+        pass
+    for stream in data.get('streams', []):
+        kind = stream.get('codec_type')
+        if kind in ('video', 'audio') and media[kind] is None:
+            media[kind] = stream.get('codec_name')
+    return media
+
+
+def plan_conversion(media):
+    """Pick REMUX, AUDIO or ENCODE for probed media (None if probing failed)"""
+    if media is None:
+        return REMUX  # Unknown streams - try the cheap path, ENCODE is the fallback anyway
+    if media['video'] is not None and media['video'] not in MP4_VIDEO_CODECS:
+        return ENCODE
+    if media['audio'] is not None and media['audio'] not in MP4_AUDIO_CODECS:
+        return AUDIO
+    return REMUX
+
+
+def ffmpeg_command(ffmpeg_path, input_file, output_file, plan, media=None, threads=0, preset='veryfast'):
+    """Build the ffmpeg command for a plan, reporting progress as key=value lines on stdout"""
+    cmd = [
+        ffmpeg_path, '-nostdin', '-v', 'error', '-nostats', '-progress', 'pipe:1',
+        '-i', input_file,
+        '-sn', '-dn',  # Subtitle and data tracks from WebM/MKV rarely survive the trip into MP4
+    ]
+
+    if plan == ENCODE:
+        cmd += ['-c:v', 'libx264', '-preset', preset, '-pix_fmt', 'yuv420p']
+        if threads:
+            cmd += ['-threads', str(threads)]
+    else:
+        cmd += ['-c:v', 'copy']
+        if media and media['video'] == 'hevc':
+            cmd += ['-tag:v', 'hvc1']  # The tag Apple players expect
+
+    if plan == REMUX:
+        cmd += ['-c:a', 'copy']
+    else:
+        cmd += ['-c:a', 'aac', '-b:a', '192k']
+
+    cmd += [
+        '-movflags', '+faststart',  # Index up front so playback can start before the file is in
+        '-y',
+        output_file
+    ]
+    return cmd
+
+
+def parse_progress(block, duration):
+    """
+    Turn one block of ffmpeg -progress output (a dict of its key=value lines)
+    into (percent, eta seconds). Either is None when it can't be worked out.
+    """
+    if not duration:
+        return None, None
+    # out_time_ms is in microseconds as well, despite its name
+    out_time = block.get('out_time_us') or block.get('out_time_ms')
+    try:
+        done = int(out_time) / 1_000_000
+    except (TypeError, ValueError):
+        return None, None
+    percent = max(0.0, min(100.0, done / duration * 100))
+
+    eta = None
+    try:
+        speed = float(block.get('speed', '').rstrip('x'))
+        if speed > 0:
+            eta = max(0.0, (duration - done) / speed)
+    except ValueError:
+        pass
+    return round(percent, 1), eta
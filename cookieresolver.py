@@ -0,0 +1,146 @@
+"""
+TubeGrab - Cookie resolver
+Works out which cookies.txt a yt-dlp run should use. Browser cookies are
+decrypted once into a cookies.txt that is reused until it goes stale, instead
+of yt-dlp reading the browser's database on every call, and uploaded cookies
+files are stored once per distinct content.
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from yt_dlp.cookies import extract_cookies_from_browser
+
+
+class CookieResolver:
+    """
+    Resolves the cookies file for a yt-dlp run: the uploaded file if there is
+    one, else the cached export of `browser` ('chrome', 'firefox:profile', ...;
+    empty for none).
+
+    The export is refreshed after `refresh` seconds. It lives on disk so every
+    process sharing the folder reuses it. A failed export (e.g. no browser on a
+    headless server) isn't retried for `retry` seconds, and runs go without
+    browser cookies meanwhile.
+    """
+
+    def __init__(self, folder, browser='chrome', refresh=1800, retry=600):
+        self.folder = folder
+        self.browser = browser
+        self.refresh = refresh
+        self.retry = retry
+        # Dot-prefixed so the janitor's sweep of stale uploads leaves it alone
+        self.browser_path = os.path.join(folder, f'.browser-{browser.replace(":", "-")}.txt')
+        self._lock = threading.Lock()
+        self._failed_at = None
+        self.exports = 0
+        self.failures = 0
+
+    def resolve(self, cookies_path=None, browser=True):
+        """Cookies file for a run: the uploaded one, else the browser export (None if neither)"""
+        if cookies_path:
+            return cookies_path
+        return self.browser_cookies() if browser else None
+
+    @contextmanager
+    def for_job(self, cookies_path=None, directory=None, browser=True):
+        """
+        resolve() into a private copy for one yt-dlp run, deleted afterwards.
+        yt-dlp writes the cookies file back when it finishes, so runs must not
+        share one.
+        """
+        path = self.resolve(cookies_path, browser)
+        if path is None:
+            yield None
+            return
+        fd, copy = tempfile.mkstemp(prefix='.cookies-', suffix='.txt', dir=directory or self.folder)
+        try:
+            with os.fdopen(fd, 'wb') as dst, open(path, 'rb') as src:
+                shutil.copyfileobj(src, dst)
+        except OSError:
+            # The file went away (e.g. the janitor expired it) - run without cookies
+            os.remove(copy)
+            yield None
+            return
+        try:
+            yield copy
+        finally:
+            try:
+                os.remove(copy)
+            except OSError:
+                pass
+
+    def browser_cookies(self):
+        """Path of the browser cookies export, refreshing it if stale, or None if unavailable"""
+        if not self.browser:
+            return None
+        if self._fresh():
+            return self.browser_path
+        with self._lock:
+            # Another thread may have exported while we waited
+            if self._fresh():
+                return self.browser_path
+            if self._failed_at is not None and time.monotonic() - self._failed_at < self.retry:
+                return None
+            try:
+                self._export()
+            except Exception:
+                self._failed_at = time.monotonic()
+                self.failures += 1
+                # A stale export still beats none at all
+                return self.browser_path if os.path.exists(self.browser_path) else None
+            self._failed_at = None
+            self.exports += 1
+            return self.browser_path
+
+    def save_upload(self, data):
+        """
+        Store an uploaded cookies.txt under its content hash and return its path.
+        Re-uploading the same file reuses the stored one and restarts its TTL.
+        """
+        path = os.path.join(self.folder, hashlib.sha256(data).hexdigest() + '.txt')
+        if os.path.exists(path):
+            os.utime(path)
+            return path
+        fd, tmp = tempfile.mkstemp(prefix='.upload-', dir=self.folder)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+        return path
+
+    def stats(self):
+        try:
+            age = time.time() - os.path.getmtime(self.browser_path)
+        except OSError:
+            age = None
+        return {
+            'browser': self.browser or None,
+            'export_age': age,
+            'exports': self.exports,
+            'failures': self.failures,
+            'failing': self._failed_at is not None,
+        }
+
+    def _fresh(self):
+        try:
+            return time.time() - os.path.getmtime(self.browser_path) < self.refresh
+        except OSError:
+            return False
+
+    def _export(self):
+        browser, _, profile = self.browser.partition(':')
+        jar = extract_cookies_from_browser(browser, profile or None)
+        # Write then rename, so other processes never read a half-written file
+        fd, tmp = tempfile.mkstemp(prefix='.browser-', suffix='.tmp', dir=self.folder)
+        os.close(fd)
+        try:
+            jar.save(tmp)
+            os.replace(tmp, self.browser_path)
+        except BaseException:
+            os.remove(tmp)
+            raise
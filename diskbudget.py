@@ -0,0 +1,99 @@
+"""
+TubeGrab - Disk budget
+Keeps the download folder under a byte quota by evicting the least recently
+served files, using the job store's media index instead of scanning the folder.
+"""
+
+import os
+import threading
+
+
+def parse_size(value):
+    """Parse a byte count like '500M', '20G' or '1048576' (0 or empty means no limit)"""
+    value = (value or '').strip().upper().rstrip('B')
+    if not value:
+        return 0
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+    if value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
+class DiskBudget:
+    """
+    Byte quota over the files in the media index.
+
+    Once usage would go over `quota`, stored files are evicted, least recently
+    served first, until usage is back under the low-water mark (a fraction of
+    the quota) - so eviction happens in batches rather than on every download.
+    Files still being fetched count with their estimated size but can't be evicted.
+    """
+
+    def __init__(self, store, quota, low_water=0.9):
+        self.store = store
+        self.quota = quota
+        self.low_water = low_water
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.evicted_bytes = 0
+        self.rejections = 0
+
+    def admit(self, size):
+        """Make room for `size` more bytes. Returns False if they can't fit even after evicting."""
+        if not self.quota:
+            return True
+        with self._lock:
+            stored, reserved = self.store.media_usage()
+            if reserved + size > self.quota:
+                # Wouldn't fit even with every stored file evicted
+                self.rejections += 1
+                return False
+            used = stored + reserved
+            if used + size > self.quota:
+                used = self._evict(used, min(self.quota * self.low_water, self.quota - size))
+            if used + size > self.quota:
+                self.rejections += 1
+                return False
+            return True
+
+    def enforce(self):
+        """Evict down to the low-water mark if usage went over the quota (e.g. estimates ran low)"""
+        if not self.quota:
+            return
+        with self._lock:
+            used = sum(self.store.media_usage())
+            if used > self.quota:
+                self._evict(used, self.quota * self.low_water)
+
+    def stats(self):
+        return {
+            'quota': self.quota,
+            'used': sum(self.store.media_usage()),
+            'low_water': int(self.quota * self.low_water),
+            'evictions': self.evictions,
+            'evicted_bytes': self.evicted_bytes,
+            'rejections': self.rejections,
+        }
+
+    def _evict(self, used, target):
+        # Caller holds the lock. Returns the usage afterwards.
+        while used > target:
+            candidates = self.store.lru_media()
+            if not candidates:
+                break
+            for key, size in candidates:
+                path = self.store.forget_media(key)
+                if path is not None:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                    self.evictions += 1
+                    self.evicted_bytes += size
+                used -= size
+                if used <= target:
+                    break
+            else:
+                # Re-read in case other processes changed the index meanwhile
+                used = sum(self.store.media_usage())
+        return used
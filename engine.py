@@ -0,0 +1,231 @@
+"""
+TubeGrab - In-process download engine
+Runs downloads through yt_dlp.YoutubeDL in long-lived worker processes, so a job
+doesn't pay for a fresh interpreter and yt-dlp import, and progress arrives as
+structured hook data instead of scraped console output.
+
+The parent talks to each worker over its stdin/stdout, one JSON object per line:
+a job goes in, progress/postprocess events and a final 'done' event come out.
+While a job runs the parent can also send {'control': 'ratelimit', 'value': ...}
+to change its download rate limit on the fly.
+"""
+
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+
+# Minimum seconds between 'downloading' progress events from one job
+PROGRESS_INTERVAL = 0.2
+
+
+class EngineWorker:
+    """One warm `python engine.py` process"""
+
+    def __init__(self):
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            bufsize=1,
+            start_new_session=True  # Own process group so cancel can kill its ffmpeg too
+        )
+        self.jobs = 0
+        self._write_lock = threading.Lock()
+
+    def send(self, message):
+        with self._write_lock:
+            self.process.stdin.write(json.dumps(message) + '\n')
+
+    def control(self, name, value):
+        """Adjust the running job (e.g. 'ratelimit'); ignored if the worker is gone"""
+        try:
+            self.send({'control': name, 'value': value})
+        except (OSError, ValueError):
+            pass
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def stop(self):
+        # Closing stdin ends the worker's job loop
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+
+
+class YtdlpPool:
+    """
+    Pool of warm worker processes, each running one download at a time.
+    Workers are started on demand (or upfront with prewarm()) and replaced
+    after max_jobs downloads, or when a cancel killed them.
+    """
+
+    def __init__(self, size, max_jobs=50):
+        self.size = size
+        self.max_jobs = max_jobs
+        self._lock = threading.Lock()
+        self._idle = []
+        self._busy = 0
+
+    def prewarm(self):
+        """Start idle workers up to the pool size so the first jobs don't wait for them"""
+        with self._lock:
+            while len(self._idle) < self.size:
+                self._idle.append(EngineWorker())
+
+    def stats(self):
+        with self._lock:
+            return {'idle': len(self._idle), 'busy': self._busy}
+
+    def run(self, job, on_event, on_start=None):
+        """
+        Run a download job on a worker, passing each event dict to on_event().
+        on_start(worker) is called with the EngineWorker before the job starts, so the
+        caller can register worker.process for cancellation and use worker.control().
+        Returns the final 'done' event: {'returncode': ..., 'error': ...}.
+        """
+        worker = self._acquire()
+        if on_start is not None:
+            on_start(worker)
+        worker.jobs += 1
+        try:
+            worker.send(job)
+            for line in worker.process.stdout:
+                event = json.loads(line)
+                if event['event'] == 'done':
+                    return event
+                on_event(event)
+        except (OSError, ValueError):
+            pass  # Worker killed mid-job (e.g. cancelled)
+        finally:
+            self._release(worker)
+        return {'event': 'done', 'returncode': None, 'error': 'Download engine worker died'}
+
+    def _acquire(self):
+        with self._lock:
+            self._busy += 1
+            while self._idle:
+                worker = self._idle.pop()
+                if worker.alive():
+                    return worker
+        return EngineWorker()
+
+    def _release(self, worker):
+        with self._lock:
+            self._busy -= 1
+            if worker.alive() and worker.jobs < self.max_jobs and len(self._idle) < self.size:
+                self._idle.append(worker)
+                return
+        worker.stop()
+
+
+def run_job(yt_dlp, job, send, running):
+    """
+    Run one download job in this worker. Returns its 'done' event.
+    The job's YoutubeDL is left in running['ydl'] for control messages.
+    """
+    last_progress = [0.0]
+
+    def progress_hook(d):
+        if d['status'] == 'downloading':
+            now = time.monotonic()
+            if now - last_progress[0] < PROGRESS_INTERVAL:
+                return
+            last_progress[0] = now
+        info = d.get('info_dict') or {}
+        send({
+            'event': 'progress',
+            'status': d['status'],
+            'filename': d.get('filename'),
+            'title': info.get('title'),
+            'downloaded_bytes': d.get('downloaded_bytes'),
+            'total_bytes': d.get('total_bytes') or d.get('total_bytes_estimate'),
+            'speed': d.get('speed'),
+            'eta': d.get('eta'),
+            'fragment_index': d.get('fragment_index'),
+            'fragment_count': d.get('fragment_count'),
+        })
+
+    def postprocessor_hook(d):
+        send({'event': 'postprocess', 'status': d['status'], 'postprocessor': d.get('postprocessor')})
+
+    def post_hook(filepath):
+        # Same record the CLI writes with --print-to-file after_move:filepath
+        if job.get('filepath_record'):
+            with open(job['filepath_record'], 'a') as f:
+                f.write(filepath + '\n')
+
+    params = dict(job['params'])
+    if params.get('cookiesfrombrowser'):
+        params['cookiesfrombrowser'] = tuple(params['cookiesfrombrowser'])
+    sections = params.pop('download_sections', None)
+    if sections:
+        # What --download-sections sets; an end of None runs to the end of the video
+        params['download_ranges'] = yt_dlp.utils.download_range_func(
+            None, [(start, float('inf') if end is None else end) for start, end in sections])
+    params.update(
+        quiet=True,
+        noprogress=True,
+        progress_hooks=[progress_hook],
+        postprocessor_hooks=[postprocessor_hook],
+        post_hooks=[post_hook],
+    )
+
+    try:
+        with yt_dlp.YoutubeDL(params) as ydl:
+            running['ydl'] = ydl
+            if job.get('info_path'):
+                returncode = ydl.download_with_info_file(job['info_path'])
+            else:
+                returncode = ydl.download([job['url']])
+        return {'event': 'done', 'returncode': returncode, 'error': None}
+    except Exception as e:
+        return {'event': 'done', 'returncode': 1, 'error': str(e)}
+    finally:
+        running['ydl'] = None
+
+
+def read_messages(jobs, running):
+    """Worker stdin reader: queue jobs, apply control messages to the running job"""
+    for line in sys.stdin:
+        message = json.loads(line)
+        if 'control' not in message:
+            jobs.put(message)
+            continue
+        ydl = running['ydl']
+        if ydl is not None and message['control'] == 'ratelimit':
+            # The HTTP downloader reads this for every chunk it throttles
+            ydl.params['ratelimit'] = message['value']
+    jobs.put(None)
+
+
+def serve():
+    """Worker process main loop: run jobs read from stdin until it closes"""
+    # Keep the protocol on a private copy of stdout; anything yt-dlp or ffmpeg
+    # print themselves goes to stderr instead
+    protocol = os.fdopen(os.dup(1), 'w', buffering=1)
+    os.dup2(2, 1)
+
+    import yt_dlp
+    # Building a YoutubeDL loads the extractor registry - do it once, before the first job
+    yt_dlp.YoutubeDL({'quiet': True}).close()
+
+    def send(event):
+        protocol.write(json.dumps(event) + '\n')
+
+    jobs = queue.Queue()
+    running = {'ydl': None}
+    threading.Thread(target=read_messages, args=(jobs, running), daemon=True).start()
+    while (job := jobs.get()) is not None:
+        send(run_job(yt_dlp, job, send, running))
+
+
+if __name__ == '__main__':
+    serve()
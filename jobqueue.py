@@ -0,0 +1,196 @@
+"""
+TubeGrab - Durable job queue
+Download and conversion stages queued in SQLite, claimed by worker processes
+(see worker.py) with leases that expire when a worker stops heartbeating.
+"""
+
+import json
+import os
+import signal
+import socket
+import threading
+import time
+
+from jobstore import SQLiteConnections, transaction
+from scheduler import kill_process
+
+
+class SQLiteJobQueue:
+    """
+    Priority FIFO queue of (download_id, stage) entries.
+
+    A claimed entry belongs to its worker until lease_until; workers extend
+    their leases with heartbeat() and delete entries with complete(). Entries
+    whose lease ran out are handed to the next worker that asks.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._connections = SQLiteConnections(path)
+        self._connections.get().execute(
+            'CREATE TABLE IF NOT EXISTS queue ('
+            'id TEXT NOT NULL, stage TEXT NOT NULL, priority INTEGER NOT NULL, '
+            'seq INTEGER NOT NULL, args TEXT NOT NULL, worker TEXT, lease_until REAL, '
+            'pid INTEGER, attempts INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (id, stage))'
+        )
+
+    def put(self, download_id, stage, args, priority=0):
+        db = self._connections.get()
+        with transaction(db):
+            seq = db.execute('SELECT COALESCE(MAX(seq), 0) + 1 FROM queue').fetchone()[0]
+            db.execute(
+                'INSERT OR REPLACE INTO queue (id, stage, priority, seq, args) VALUES (?, ?, ?, ?, ?)',
+                (download_id, stage, priority, seq, json.dumps(args))
+            )
+
+    def claim(self, worker, stage, lease):
+        """
+        Claim the next entry of a stage for `worker`.
+        Returns (download_id, args, attempts, previous_owner) or None when the stage is empty;
+        previous_owner is (worker, child pid) for entries taken over from a dead worker.
+        """
+        now = time.time()
+        db = self._connections.get()
+        with transaction(db):
+            row = db.execute(
+                'SELECT id, args, attempts, worker, pid FROM queue '
+                'WHERE stage = ? AND (worker IS NULL OR lease_until < ?) '
+                'ORDER BY priority DESC, seq LIMIT 1',
+                (stage, now)
+            ).fetchone()
+            if row is None:
+                return None
+            download_id, args, attempts, previous_worker, pid = row
+            db.execute(
+                'UPDATE queue SET worker = ?, lease_until = ?, pid = NULL, attempts = attempts + 1 '
+                'WHERE id = ? AND stage = ?',
+                (worker, now + lease, download_id, stage)
+            )
+        previous_owner = (previous_worker, pid) if previous_worker else None
+        return download_id, json.loads(args), attempts + 1, previous_owner
+
+    def heartbeat(self, worker, lease):
+        """Extend the leases of everything `worker` holds"""
+        self._connections.get().execute(
+            'UPDATE queue SET lease_until = ? WHERE worker = ?', (time.time() + lease, worker)
+        )
+
+    def set_pid(self, download_id, worker, pid):
+        """Remember a running entry's child process so a successor on this host can kill it"""
+        self._connections.get().execute(
+            'UPDATE queue SET pid = ? WHERE id = ? AND worker = ?', (pid, download_id, worker)
+        )
+
+    def complete(self, download_id, stage, worker):
+        self._connections.get().execute(
+            'DELETE FROM queue WHERE id = ? AND stage = ? AND worker = ?', (download_id, stage, worker)
+        )
+
+    def release(self, worker):
+        """Give a stopping worker's entries back to the queue right away"""
+        # Expire the leases rather than clearing the owner, so the next claimant
+        # still learns which child processes may be left over
+        self._connections.get().execute('UPDATE queue SET lease_until = 0 WHERE worker = ?', (worker,))
+
+    def remove(self, download_id):
+        """Drop a download's unclaimed entries. Returns True if it was queued or running."""
+        db = self._connections.get()
+        with transaction(db):
+            found = db.execute('SELECT COUNT(*) FROM queue WHERE id = ?', (download_id,)).fetchone()[0]
+            db.execute(
+                'DELETE FROM queue WHERE id = ? AND (worker IS NULL OR lease_until < ?)',
+                (download_id, time.time())
+            )
+        return found > 0
+
+    def position(self, download_id):
+        """Return (stage, 1-based position) of an unclaimed entry, or (None, None)"""
+        now = time.time()
+        db = self._connections.get()
+        row = db.execute(
+            'SELECT stage, priority, seq FROM queue '
+            'WHERE id = ? AND (worker IS NULL OR lease_until < ?)',
+            (download_id, now)
+        ).fetchone()
+        if row is None:
+            return None, None
+        stage, priority, seq = row
+        ahead = db.execute(
+            'SELECT COUNT(*) FROM queue WHERE stage = ? AND (worker IS NULL OR lease_until < ?) '
+            'AND (priority > ? OR (priority = ? AND seq < ?))',
+            (stage, now, priority, priority, seq)
+        ).fetchone()[0]
+        return stage, ahead + 1
+
+    def stats(self):
+        now = time.time()
+        rows = self._connections.get().execute(
+            'SELECT stage, SUM(worker IS NULL OR lease_until < ?), SUM(worker IS NOT NULL AND lease_until >= ?) '
+            'FROM queue GROUP BY stage',
+            (now, now)
+        ).fetchall()
+        return {stage: {'queued': queued, 'running': running} for stage, queued, running in rows}
+
+
+class QueueScheduler:
+    """
+    Drop-in replacement for DownloadScheduler that puts jobs on the durable queue
+    for worker.py processes instead of running them in this process.
+    The stage name tells the worker what to run, so `func` is not stored.
+    """
+
+    def __init__(self, queue, worker=None):
+        self.queue = queue
+        self.worker = worker or f'{socket.gethostname()}:{os.getpid()}'
+        self._lock = threading.Lock()
+        self._processes = {}
+
+    def submit(self, download_id, stage, func, *args, priority=0):
+        self.queue.put(download_id, stage, list(args), priority=priority)
+
+    def queue_position(self, download_id):
+        return self.queue.position(download_id)
+
+    def stats(self):
+        return self.queue.stats()
+
+    def process_count(self):
+        with self._lock:
+            return len(self._processes)
+
+    def register_process(self, download_id, process):
+        with self._lock:
+            self._processes[download_id] = process
+        self.queue.set_pid(download_id, self.worker, process.pid)
+
+    def unregister_process(self, download_id):
+        with self._lock:
+            self._processes.pop(download_id, None)
+
+    def cancel(self, download_id):
+        found = self.queue.remove(download_id)
+        with self._lock:
+            process = self._processes.get(download_id)
+        if process is not None:
+            kill_process(process)
+        return found
+
+    def kill_all(self):
+        with self._lock:
+            processes = list(self._processes.values())
+        for process in processes:
+            kill_process(process)
+
+
+def kill_orphan(previous_owner):
+    """
+    Kill the child process group a dead worker left running, if it was on this host.
+    Children run in their own session (pid == pgid), so this also reaps ffmpeg.
+    """
+    worker, pid = previous_owner
+    if not pid or worker.rsplit(':', 1)[0] != socket.gethostname() or not hasattr(os, 'killpg'):
+        return
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
@@ -0,0 +1,757 @@
+"""
+TubeGrab - Job store
+Where download records, batches, uploaded-cookie tokens and the index of stored
+media files live. The in-memory store is
+per process; the SQLite store (WAL mode) is shared by every gunicorn worker and
+survives restarts.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+FINISHED_STATUSES = ('completed', 'error', 'cancelled')
+
+_UNSET = object()  # A JobRecord field that was never set
+
+
+class SQLiteConnections:
+    """One autocommit sqlite3 connection per thread (they can't be shared between threads)"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def get(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+        return db
+
+
+@contextmanager
+def transaction(db):
+    """BEGIN IMMEDIATE ... COMMIT, rolled back on error"""
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        yield db
+    except BaseException:
+        db.execute('ROLLBACK')
+        raise
+    db.execute('COMMIT')
+
+
+class JobRecord:
+    """
+    One download's state. __slots__ keeps a record at a fraction of a dict's
+    size; fields outside the common set go to a small `extra` dict.
+    """
+
+    __slots__ = (
+        'status', 'progress', 'url', 'error', 'filename', 'cookies_token',
+        'title', 'progressive', 'stream_file',
+        'priority', 'options', 'timeline', 'media_key', 'media_generation', 'estimated_size',
+        'estimated_duration', 'speed', 'eta', 'downloaded_bytes', 'total_bytes', 'attached_to',
+        'extra', 'finished_at',
+    )
+    # Always present in to_dict(), even when None
+    BASE_FIELDS = ('status', 'progress', 'url', 'error', 'filename', 'cookies_token')
+    # Only present once set to something other than None
+    OPTIONAL_FIELDS = ('title', 'progressive', 'stream_file')
+    # Present once set, None included - like the fields in `extra`
+    SET_FIELDS = (
+        'priority', 'options', 'timeline', 'media_key', 'media_generation', 'estimated_size',
+        'estimated_duration', 'speed', 'eta', 'downloaded_bytes', 'total_bytes', 'attached_to',
+    )
+    FIELDS = frozenset(BASE_FIELDS + OPTIONAL_FIELDS + SET_FIELDS)
+
+    def __init__(self, fields):
+        for name in self.BASE_FIELDS + self.OPTIONAL_FIELDS:
+            setattr(self, name, None)
+        for name in self.SET_FIELDS:
+            setattr(self, name, _UNSET)
+        self.extra = self.finished_at = None
+        self.update(fields)
+
+    def update(self, fields):
+        for name, value in fields.items():
+            if name in self.FIELDS:
+                setattr(self, name, value)
+            else:
+                if self.extra is None:
+                    self.extra = {}
+                self.extra[name] = value
+        if self.finished_at is None and self.status in FINISHED_STATUSES:
+            self.finished_at = time.time()
+
+    def to_dict(self):
+        download = {name: getattr(self, name) for name in self.BASE_FIELDS}
+        for name in self.OPTIONAL_FIELDS:
+            value = getattr(self, name)
+            if value is not None:
+                download[name] = value
+        for name in self.SET_FIELDS:
+            value = getattr(self, name)
+            if value is not _UNSET:
+                download[name] = value
+        if self.extra:
+            download.update(self.extra)
+        return download
+
+
+class MemoryJobStore:
+    """Job records in a dict, for a single process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._versions = {}     # download_id -> change counter, bumped on every update
+        self._watchers = {}     # download_id -> Condition notified when it changes
+        self._finished = OrderedDict()  # download_id -> None, in the order jobs finished
+        self._cookies = {}
+        self._media = {}        # media key -> {'path', 'title', 'generation', 'leader', 'followers', 'refs',
+                                #               'size', 'accessed'}
+        self._batches = {}      # batch_id -> (created, [download_id, ...])
+
+    def create(self, download_id, record):
+        with self._lock:
+            self._jobs[download_id] = JobRecord(record)
+            self._notify(download_id)
+
+    def get(self, download_id):
+        """Return the record as a dict, or None"""
+        with self._lock:
+            download = self._jobs.get(download_id)
+            return download.to_dict() if download is not None else None
+
+    def snapshot(self, download_id):
+        """Return (version, record dict), or (None, None) for unknown downloads"""
+        with self._lock:
+            download = self._jobs.get(download_id)
+            if download is None:
+                return None, None
+            return self._versions.get(download_id, 0), download.to_dict()
+
+    def update(self, download_id, **fields):
+        """Update a record, ignoring removed or cancelled downloads. Returns False if ignored."""
+        with self._lock:
+            download = self._jobs.get(download_id)
+            if download is None or download.status == 'cancelled':
+                return False
+            download.update(fields)
+            if download.finished_at is not None:
+                self._finished.setdefault(download_id, None)
+            self._notify(download_id)
+            return True
+
+    def cancel(self, download_id):
+        """Mark an unfinished download cancelled. Returns its previous status (None if unknown)."""
+        with self._lock:
+            download = self._jobs.get(download_id)
+            if download is None:
+                return None
+            status = download.status
+            if status not in FINISHED_STATUSES:
+                download.update({'status': 'cancelled'})
+                self._finished.setdefault(download_id, None)
+                self._notify(download_id)
+            return status
+
+    def delete(self, download_id):
+        """Remove and return a record dict (None if unknown)"""
+        with self._lock:
+            download = self._remove(download_id)
+            return download.to_dict() if download is not None else None
+
+    def expire(self, ttl, max_finished):
+        """
+        Remove finished downloads older than ttl seconds, and the oldest ones beyond
+        max_finished. Returns the removed records so their files can be deleted.
+        """
+        cutoff = time.time() - ttl
+        expired = []
+        with self._lock:
+            while self._finished:
+                download_id = next(iter(self._finished))
+                download = self._jobs[download_id]
+                if download.finished_at >= cutoff and len(self._finished) <= max_finished:
+                    break
+                self._remove(download_id)
+                expired.append(download.to_dict())
+        return expired
+
+    def count(self):
+        with self._lock:
+            return len(self._jobs)
+
+    def wait_for_change(self, download_id, version, timeout):
+        """Block until the download changes past `version` (or goes away), or timeout expires"""
+        with self._lock:
+            watcher = self._watchers.get(download_id)
+            if watcher is None:
+                watcher = self._watchers[download_id] = threading.Condition(self._lock)
+            watcher.wait_for(
+                lambda: download_id not in self._jobs or self._versions.get(download_id, 0) != version,
+                timeout
+            )
+
+    def create_batch(self, batch_id, download_ids):
+        with self._lock:
+            self._batches[batch_id] = (time.time(), list(download_ids))
+
+    def get_batch(self, batch_id):
+        """Return a batch's download ids, or None"""
+        with self._lock:
+            batch = self._batches.get(batch_id)
+            return list(batch[1]) if batch is not None else None
+
+    def delete_batch(self, batch_id):
+        """Remove a batch and return its download ids (None if unknown)"""
+        with self._lock:
+            batch = self._batches.pop(batch_id, None)
+            return batch[1] if batch is not None else None
+
+    def expire_batches(self, ttl):
+        """Remove batches created more than ttl seconds ago (their downloads expire on their own)"""
+        cutoff = time.time() - ttl
+        with self._lock:
+            for batch_id in [batch_id for batch_id, (created, _) in self._batches.items() if created < cutoff]:
+                del self._batches[batch_id]
+
+    def set_cookies(self, token, path):
+        with self._lock:
+            self._cookies[token] = path
+
+    def get_cookies(self, token):
+        with self._lock:
+            return self._cookies.get(token)
+
+    def pop_cookies(self, token):
+        """Forget a token. Returns its file's path once no other token uses it (uploads are shared)."""
+        with self._lock:
+            path = self._cookies.pop(token, None)
+            return path if path not in self._cookies.values() else None
+
+    def drop_cookies(self, path):
+        """Forget every token using a cookies file"""
+        with self._lock:
+            for token in [token for token, p in self._cookies.items() if p == path]:
+                del self._cookies[token]
+
+    def claim_media(self, key, download_id, estimate=0):
+        """
+        Find or start the media stored under key for a download. Returns
+        ('ready', {'path', 'title', 'generation'}) if the file is stored - the download now holds
+        a reference to that generation of it -
+        ('follow', leader_id) if another download is fetching it and will finish this one too, or
+        ('lead', None) if this download has to fetch it; `estimate` bytes are reserved for it.
+        """
+        with self._lock:
+            media = self._media.get(key)
+            if media is None:
+                self._media[key] = {
+                    'path': None, 'title': None, 'generation': None, 'leader': download_id, 'followers': [],
+                    'refs': 0, 'size': estimate, 'accessed': time.time(),
+                }
+                return 'lead', None
+            if media['path'] is not None:
+                media['refs'] += 1
+                media['accessed'] = time.time()
+                return 'ready', {'path': media['path'], 'title': media['title'], 'generation': media['generation']}
+            if media['leader'] == download_id:
+                return 'lead', None
+            if download_id not in media['followers']:
+                media['followers'].append(download_id)
+            return 'follow', media['leader']
+
+    def publish_media(self, key, path, title, size):
+        """
+        Record the leader's finished file. The leader and each of its followers
+        get a reference. Returns (the followers, the file's generation) - references
+        are released against the generation, so one to a file that was evicted and
+        fetched again doesn't count against the new file.
+        """
+        generation = time.time_ns()
+        with self._lock:
+            media = self._media.get(key)
+            followers = media['followers'] if media is not None and media['path'] is None else []
+            self._media[key] = {
+                'path': path, 'title': title, 'generation': generation, 'leader': None, 'followers': [],
+                'refs': 1 + len(followers), 'size': size, 'accessed': time.time(),
+            }
+            return followers, generation
+
+    def promote_media(self, key, download_id):
+        """
+        The leader stopped without a file: make its first follower the leader.
+        Returns (new leader, its remaining followers), or (None, []) if nobody was waiting.
+        """
+        with self._lock:
+            media = self._media.get(key)
+            if media is None or media['leader'] != download_id:
+                return None, []
+            if not media['followers']:
+                del self._media[key]
+                return None, []
+            media['leader'] = media['followers'].pop(0)
+            return media['leader'], list(media['followers'])
+
+    def drop_media(self, key, download_id):
+        """The leader failed: forget the pending media. Returns the followers that were waiting."""
+        with self._lock:
+            media = self._media.get(key)
+            if media is None or media['leader'] != download_id:
+                return []
+            del self._media[key]
+            return media['followers']
+
+    def release_media(self, key, generation):
+        """
+        Drop a reference to a generation of a stored file. Returns the file's path once
+        nothing refers to it any more, else None (also for a generation that is gone).
+        """
+        with self._lock:
+            media = self._media.get(key)
+            if media is None or media['path'] is None or media['generation'] != generation:
+                return None
+            media['refs'] -= 1
+            if media['refs'] > 0:
+                return None
+            del self._media[key]
+            return media['path']
+
+    def forget_media(self, key, generation=None):
+        """
+        Remove a stored file's entry (evicted, or the file went missing) - only if it is
+        still that generation, when one is given. Returns its path.
+        """
+        with self._lock:
+            media = self._media.get(key)
+            if media is None or media['path'] is None:
+                return None
+            if generation is not None and media['generation'] != generation:
+                return None
+            del self._media[key]
+            return media['path']
+
+    def has_media(self, key):
+        """True if a file is stored under key"""
+        with self._lock:
+            media = self._media.get(key)
+            return media is not None and media['path'] is not None
+
+    def touch_media(self, key):
+        """Note that a stored file was just served"""
+        with self._lock:
+            media = self._media.get(key)
+            if media is not None:
+                media['accessed'] = time.time()
+
+    def media_usage(self):
+        """Return (bytes taken by stored files, bytes reserved for files being fetched)"""
+        stored = reserved = 0
+        with self._lock:
+            for media in self._media.values():
+                if media['path'] is not None:
+                    stored += media['size'] or 0
+                else:
+                    reserved += media['size'] or 0
+        return stored, reserved
+
+    def lru_media(self, limit=100):
+        """Return up to `limit` (key, size) of stored files, least recently served first"""
+        with self._lock:
+            stored = [(media['accessed'], key, media['size'] or 0)
+                      for key, media in self._media.items() if media['path'] is not None]
+        return [(key, size) for _, key, size in sorted(stored)[:limit]]
+
+    def _remove(self, download_id):
+        # Caller holds the lock
+        download = self._jobs.pop(download_id, None)
+        self._notify(download_id)
+        self._versions.pop(download_id, None)
+        self._watchers.pop(download_id, None)
+        self._finished.pop(download_id, None)
+        return download
+
+    def _notify(self, download_id):
+        # Caller holds the lock
+        self._versions[download_id] = self._versions.get(download_id, 0) + 1
+        watcher = self._watchers.get(download_id)
+        if watcher is not None:
+            watcher.notify_all()
+
+
+class SQLiteJobStore:
+    """
+    Job records in an SQLite database in WAL mode, shared between processes.
+
+    Progress ticks arrive many times a second per download, so updates that only
+    touch HOT_FIELDS are buffered in memory and written in one batch every
+    flush_interval seconds. Reads from the same process see the buffered values.
+    """
+
+    HOT_FIELDS = frozenset({
+        'progress', 'speed', 'eta', 'downloaded_bytes', 'total_bytes', 'fragment_index', 'fragment_count',
+    })
+
+    def __init__(self, path, flush_interval=0.5, poll_interval=0.25):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.poll_interval = poll_interval
+        self._connections = SQLiteConnections(path)
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        # Held from taking buffered fields out of _pending until they are written, so
+        # a flush can't write older progress over an update that was written meanwhile
+        self._write_lock = threading.Lock()
+        self._pending = {}      # download_id -> buffered hot fields
+        self._cancelled = set() # downloads a buffered write found cancelled
+
+        db = self._db()
+        db.execute(
+            'CREATE TABLE IF NOT EXISTS jobs ('
+            'id TEXT PRIMARY KEY, data TEXT NOT NULL, version INTEGER NOT NULL DEFAULT 0, '
+            'updated REAL NOT NULL)'
+        )
+        db.execute('CREATE TABLE IF NOT EXISTS cookies (token TEXT PRIMARY KEY, path TEXT NOT NULL)')
+        # Uploads with the same content share a file, looked up by path when a token goes
+        db.execute('CREATE INDEX IF NOT EXISTS cookies_path ON cookies (path)')
+        db.execute(
+            'CREATE TABLE IF NOT EXISTS batches (id TEXT PRIMARY KEY, items TEXT NOT NULL, created REAL NOT NULL)'
+        )
+        db.execute(
+            'CREATE TABLE IF NOT EXISTS media ('
+            'key TEXT PRIMARY KEY, path TEXT, title TEXT, leader TEXT, '
+            "followers TEXT NOT NULL DEFAULT '[]', refs INTEGER NOT NULL DEFAULT 0)"
+        )
+        for column in ('size INTEGER', 'accessed REAL', 'generation INTEGER'):
+            try:
+                # File size (or the reserved estimate) and last access, for the disk budget;
+                # the generation of the stored file, which references are held against
+                db.execute(f'ALTER TABLE media ADD COLUMN {column}')
+            except sqlite3.OperationalError:
+                pass  # Already there
+        db.execute('CREATE INDEX IF NOT EXISTS media_accessed ON media (accessed)')
+        try:
+            # When the job reached a finished status, for expiry
+            db.execute('ALTER TABLE jobs ADD COLUMN finished REAL')
+        except sqlite3.OperationalError:
+            pass  # Already there
+        db.execute('CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished)')
+
+        flusher = threading.Thread(target=self._flush_loop, name='tubegrab-jobstore-flush', daemon=True)
+        flusher.start()
+
+    def create(self, download_id, record):
+        self._db().execute(
+            'INSERT OR REPLACE INTO jobs (id, data, version, updated) VALUES (?, ?, 0, ?)',
+            (download_id, json.dumps(record), time.time())
+        )
+        self._wake()
+
+    def get(self, download_id):
+        return self.snapshot(download_id)[1]
+
+    def snapshot(self, download_id):
+        row = self._db().execute('SELECT version, data FROM jobs WHERE id = ?', (download_id,)).fetchone()
+        if row is None:
+            return None, None
+        download = json.loads(row[1])
+        with self._lock:
+            download.update(self._pending.get(download_id, {}))
+        return row[0], download
+
+    def update(self, download_id, **fields):
+        with self._lock:
+            if download_id in self._cancelled:
+                return False
+            if fields.keys() <= self.HOT_FIELDS:
+                self._pending.setdefault(download_id, {}).update(fields)
+                return True
+        # Anything else is written now, together with whatever was buffered
+        with self._write_lock:
+            with self._lock:
+                fields = {**self._pending.pop(download_id, {}), **fields}
+            return download_id not in self._write({download_id: fields})
+
+    def cancel(self, download_id):
+        db = self._db()
+        with transaction(db):
+            row = db.execute('SELECT data FROM jobs WHERE id = ?', (download_id,)).fetchone()
+            if row is None:
+                return None
+            download = json.loads(row[0])
+            status = download['status']
+            if status not in FINISHED_STATUSES:
+                download['status'] = 'cancelled'
+                self._save(db, download_id, download)
+        self._wake()
+        return status
+
+    def delete(self, download_id):
+        db = self._db()
+        with transaction(db):
+            row = db.execute('SELECT data FROM jobs WHERE id = ?', (download_id,)).fetchone()
+            db.execute('DELETE FROM jobs WHERE id = ?', (download_id,))
+        with self._lock:
+            self._pending.pop(download_id, None)
+            self._cancelled.discard(download_id)
+        self._wake()
+        return json.loads(row[0]) if row is not None else None
+
+    def expire(self, ttl, max_finished):
+        db = self._db()
+        with transaction(db):
+            rows = db.execute(
+                'SELECT id, data FROM jobs WHERE finished < ? '
+                'UNION SELECT id, data FROM jobs WHERE id IN ('
+                'SELECT id FROM jobs WHERE finished IS NOT NULL ORDER BY finished DESC LIMIT -1 OFFSET ?)',
+                (time.time() - ttl, max_finished)
+            ).fetchall()
+            db.executemany('DELETE FROM jobs WHERE id = ?', [(row[0],) for row in rows])
+        with self._lock:
+            for row in rows:
+                self._pending.pop(row[0], None)
+                self._cancelled.discard(row[0])
+        if rows:
+            self._wake()
+        return [json.loads(row[1]) for row in rows]
+
+    def count(self):
+        return self._db().execute('SELECT COUNT(*) FROM jobs').fetchone()[0]
+
+    def wait_for_change(self, download_id, version, timeout):
+        # Changes made by other processes are only visible by polling the version
+        deadline = time.monotonic() + timeout
+        while True:
+            row = self._db().execute('SELECT version FROM jobs WHERE id = ?', (download_id,)).fetchone()
+            remaining = deadline - time.monotonic()
+            if row is None or row[0] != version or remaining <= 0:
+                return
+            with self._changed:
+                self._changed.wait(min(remaining, self.poll_interval))
+
+    def create_batch(self, batch_id, download_ids):
+        self._db().execute(
+            'INSERT OR REPLACE INTO batches (id, items, created) VALUES (?, ?, ?)',
+            (batch_id, json.dumps(list(download_ids)), time.time())
+        )
+
+    def get_batch(self, batch_id):
+        row = self._db().execute('SELECT items FROM batches WHERE id = ?', (batch_id,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def delete_batch(self, batch_id):
+        db = self._db()
+        with transaction(db):
+            row = db.execute('SELECT items FROM batches WHERE id = ?', (batch_id,)).fetchone()
+            db.execute('DELETE FROM batches WHERE id = ?', (batch_id,))
+        return json.loads(row[0]) if row is not None else None
+
+    def expire_batches(self, ttl):
+        self._db().execute('DELETE FROM batches WHERE created < ?', (time.time() - ttl,))
+
+    def set_cookies(self, token, path):
+        self._db().execute('INSERT OR REPLACE INTO cookies (token, path) VALUES (?, ?)', (token, path))
+
+    def get_cookies(self, token):
+        row = self._db().execute('SELECT path FROM cookies WHERE token = ?', (token,)).fetchone()
+        return row[0] if row is not None else None
+
+    def pop_cookies(self, token):
+        db = self._db()
+        with transaction(db):
+            row = db.execute('SELECT path FROM cookies WHERE token = ?', (token,)).fetchone()
+            if row is None:
+                return None
+            db.execute('DELETE FROM cookies WHERE token = ?', (token,))
+            in_use = db.execute('SELECT 1 FROM cookies WHERE path = ? LIMIT 1', (row[0],)).fetchone()
+        return row[0] if in_use is None else None
+
+    def drop_cookies(self, path):
+        self._db().execute('DELETE FROM cookies WHERE path = ?', (path,))
+
+    def claim_media(self, key, download_id, estimate=0):
+        db = self._db()
+        with transaction(db):
+            row = db.execute(
+                'SELECT path, title, generation, leader, followers FROM media WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                db.execute(
+                    'INSERT INTO media (key, leader, size, accessed) VALUES (?, ?, ?, ?)',
+                    (key, download_id, estimate, time.time())
+                )
+                return 'lead', None
+            path, title, generation, leader, followers = row
+            if path is not None:
+                db.execute('UPDATE media SET refs = refs + 1, accessed = ? WHERE key = ?', (time.time(), key))
+                return 'ready', {'path': path, 'title': title, 'generation': generation}
+            if leader == download_id:
+                return 'lead', None
+            followers = json.loads(followers)
+            if download_id not in followers:
+                followers.append(download_id)
+                db.execute('UPDATE media SET followers = ? WHERE key = ?', (json.dumps(followers), key))
+            return 'follow', leader
+
+    def publish_media(self, key, path, title, size):
+        generation = time.time_ns()
+        db = self._db()
+        with transaction(db):
+            row = db.execute('SELECT path, followers FROM media WHERE key = ?', (key,)).fetchone()
+            followers = json.loads(row[1]) if row is not None and row[0] is None else []
+            db.execute(
+                "INSERT OR REPLACE INTO media (key, path, title, generation, leader, followers, refs, size, accessed) "
+                "VALUES (?, ?, ?, ?, NULL, '[]', ?, ?, ?)",
+                (key, path, title, generation, 1 + len(followers), size, time.time())
+            )
+        return followers, generation
+
+    def promote_media(self, key, download_id):
+        db = self._db()
+        with transaction(db):
+            row = db.execute('SELECT leader, followers FROM media WHERE key = ?', (key,)).fetchone()
+            if row is None or row[0] != download_id:
+                return None, []
+            followers = json.loads(row[1])
+            if not followers:
+                db.execute('DELETE FROM media WHERE key = ?', (key,))
+                return None, []
+            leader = followers.pop(0)
+            db.execute(
+                'UPDATE media SET leader = ?, followers = ? WHERE key = ?', (leader, json.dumps(followers), key)
+            )
+        return leader, followers
+
+    def drop_media(self, key, download_id):
+        db = self._db()
+        with transaction(db):
+            row = db.execute('SELECT leader, followers FROM media WHERE key = ?', (key,)).fetchone()
+            if row is None or row[0] != download_id:
+                return []
+            db.execute('DELETE FROM media WHERE key = ?', (key,))
+        return json.loads(row[1])
+
+    def release_media(self, key, generation):
+        db = self._db()
+        with transaction(db):
+            # IS compares NULL with None too: entries from before generations existed
+            row = db.execute(
+                'SELECT path, refs FROM media WHERE key = ? AND generation IS ?', (key, generation)
+            ).fetchone()
+            if row is None or row[0] is None:
+                return None
+            if row[1] > 1:
+                db.execute('UPDATE media SET refs = refs - 1 WHERE key = ?', (key,))
+                return None
+            db.execute('DELETE FROM media WHERE key = ?', (key,))
+        return row[0]
+
+    def forget_media(self, key, generation=None):
+        db = self._db()
+        with transaction(db):
+            row = db.execute(
+                'SELECT path, generation FROM media WHERE key = ? AND path IS NOT NULL', (key,)
+            ).fetchone()
+            if row is None or (generation is not None and row[1] != generation):
+                return None
+            db.execute('DELETE FROM media WHERE key = ?', (key,))
+        return row[0]
+
+    def has_media(self, key):
+        row = self._db().execute('SELECT 1 FROM media WHERE key = ? AND path IS NOT NULL', (key,)).fetchone()
+        return row is not None
+
+    def touch_media(self, key):
+        self._db().execute('UPDATE media SET accessed = ? WHERE key = ?', (time.time(), key))
+
+    def media_usage(self):
+        row = self._db().execute(
+            'SELECT COALESCE(SUM(CASE WHEN path IS NOT NULL THEN size END), 0), '
+            'COALESCE(SUM(CASE WHEN path IS NULL THEN size END), 0) FROM media'
+        ).fetchone()
+        return tuple(row)
+
+    def lru_media(self, limit=100):
+        rows = self._db().execute(
+            'SELECT key, COALESCE(size, 0) FROM media WHERE path IS NOT NULL ORDER BY accessed LIMIT ?', (limit,)
+        ).fetchall()
+        return [tuple(row) for row in rows]
+
+    def flush(self):
+        """Write all buffered progress updates"""
+        with self._write_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if pending:
+                self._write(pending, hot=True)
+
+    def _write(self, updates, hot=False):
+        """
+        Apply {download_id: fields} in one transaction. Returns the ids that were ignored.
+        hot=True (buffered progress) leaves finished downloads alone: their last progress
+        was written with the status, maybe by another process.
+        """
+        ignored = set()
+        db = self._db()
+        with transaction(db):
+            for download_id, fields in updates.items():
+                row = db.execute('SELECT data FROM jobs WHERE id = ?', (download_id,)).fetchone()
+                if row is None:
+                    ignored.add(download_id)
+                    continue
+                download = json.loads(row[0])
+                if download['status'] == 'cancelled':
+                    ignored.add(download_id)
+                    with self._lock:
+                        self._cancelled.add(download_id)
+                    continue
+                if hot and download['status'] in FINISHED_STATUSES:
+                    ignored.add(download_id)
+                    continue
+                download.update(fields)
+                self._save(db, download_id, download)
+        self._wake()
+        return ignored
+
+    def _save(self, db, download_id, download):
+        now = time.time()
+        finished = now if download['status'] in FINISHED_STATUSES else None
+        db.execute(
+            'UPDATE jobs SET data = ?, version = version + 1, updated = ?, '
+            'finished = COALESCE(finished, ?) WHERE id = ?',
+            (json.dumps(download), now, finished, download_id)
+        )
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except sqlite3.Error:
+                pass  # Try again next round
+
+    def _wake(self):
+        # Wake progress streams in this process without waiting for their next poll
+        with self._changed:
+            self._changed.notify_all()
+
+    def _db(self):
+        return self._connections.get()
+
+
+def open_job_store(kind, path=None):
+    """Create the job store selected by TUBEGRAB_JOB_STORE ('memory' or 'sqlite')"""
+    if kind == 'memory':
+        return MemoryJobStore()
+    if kind == 'sqlite':
+        return SQLiteJobStore(path)
+    raise ValueError(f'Unknown job store: {kind}')
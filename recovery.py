@@ -0,0 +1,164 @@
+"""
+TubeGrab - Crash recovery
+Every download works in its own staging directory, and a manifest there says
+which job it belongs to and how far it got. A restarted server reads those
+manifests to queue interrupted downloads again - yt-dlp continues from the
+.part files already on disk - and removes what no job will pick up again.
+
+A running job holds an exclusive lock on its staging directory, so a process
+sharing the download folder never takes over (or deletes) a job that is still
+alive in another one. Without fcntl (Windows) there are no locks, and only one
+server process should use a download folder.
+"""
+
+import json
+import os
+import re
+import signal
+import socket
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+MANIFEST = '.manifest.json'
+LOCK_FILE = '.lock'
+
+# Commands of the child processes a job runs, to tell them from unrelated processes reusing a PID
+JOB_COMMANDS = ('yt-dlp', 'yt_dlp', 'engine.py', 'ffmpeg')
+
+
+def is_intermediate(name):
+    """True for yt-dlp's partial and not yet merged files (.part, .part-FragN, .ytdl, .fNNN.)"""
+    return '.part' in name or name.endswith('.ytdl') or re.search(r'\.f\d+\.', name) is not None
+
+
+def partial_bytes(staging):
+    """Bytes of partial downloads in a staging directory - where a resumed download picks up"""
+    total = 0
+    try:
+        names = os.listdir(staging)
+    except OSError:
+        return 0
+    for name in names:
+        if not name.startswith('.') and is_intermediate(name):
+            try:
+                total += os.path.getsize(os.path.join(staging, name))
+            except OSError:
+                pass
+    return total
+
+
+def owner():
+    """This process, as recorded in the manifests it writes"""
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def read_manifest(staging):
+    try:
+        with open(os.path.join(staging, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_manifest(staging, manifest):
+    """Replace a staging directory's manifest in one step, so a crash never leaves half of one"""
+    path = os.path.join(staging, MANIFEST)
+    temp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(temp, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(temp, path)
+
+
+def update_manifest(staging, **fields):
+    """Change some fields of a manifest; does nothing if the job has none (or no staging directory)"""
+    manifest = read_manifest(staging)
+    if manifest is None:
+        return
+    manifest.update(fields, updated=round(time.time(), 3))
+    try:
+        write_manifest(staging, manifest)
+    except OSError:
+        pass  # Staging removed meanwhile
+
+
+def kill_orphan(manifest):
+    """
+    Kill the child process group a crashed server left running for a job, so it
+    doesn't keep writing into the files the resumed download continues. Children
+    run in their own session (pid == pgid).
+    """
+    pid = manifest.get('pid')
+    host = (manifest.get('owner') or '').rsplit(':', 1)[0]
+    if not pid or host != socket.gethostname() or not hasattr(os, 'killpg'):
+        return
+    try:
+        if os.getpgid(pid) != pid or not _runs_job_command(pid):
+            return  # The PID has been reused
+        os.killpg(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def _runs_job_command(pid):
+    if not os.path.isdir('/proc/self'):
+        return True  # No procfs to ask - go by the process group alone
+    try:
+        with open(f'/proc/{pid}/cmdline', 'rb') as f:
+            cmdline = f.read().decode(errors='replace')
+    except OSError:
+        return False
+    return any(command in cmdline for command in JOB_COMMANDS)
+
+
+class StagingLocks:
+    """
+    Exclusive locks on the staging directories this process works in. A lock is
+    held from a job's first step until its staging directory is removed, and
+    goes away with the process if it dies.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._held = {}  # staging path -> open lock file
+
+    def acquire(self, staging):
+        """Take the lock without waiting. True if this process holds it now (or already did)."""
+        with self._lock:
+            if staging in self._held:
+                return True
+            try:
+                f = open(os.path.join(staging, LOCK_FILE), 'a')
+            except OSError:
+                return False
+            if fcntl is not None:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    f.close()
+                    return False
+            self._held[staging] = f
+            return True
+
+    def release(self, staging):
+        with self._lock:
+            f = self._held.pop(staging, None)
+        if f is not None:
+            f.close()  # Closing the file drops the lock
+
+    def held(self, staging):
+        with self._lock:
+            return staging in self._held
+
+    def locked_elsewhere(self, staging):
+        """True if another process holds the lock on a staging directory"""
+        if self.held(staging):
+            return False
+        if not self.acquire(staging):
+            return True
+        self.release(staging)
+        return False
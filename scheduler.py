@@ -0,0 +1,139 @@
+"""
+TubeGrab - Download scheduler
+Runs download jobs through bounded worker pools instead of one thread per request
+"""
+
+import heapq
+import itertools
+import os
+import signal
+import threading
+
+
+def kill_process(process):
+    """Kill a child process and everything it spawned (e.g. yt-dlp's ffmpeg merger)"""
+    try:
+        if hasattr(os, 'killpg'):
+            # Children are started with start_new_session=True, so pid == pgid
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+class DownloadScheduler:
+    """
+    Priority FIFO scheduler with a separate worker pool per stage.
+
+    `limits` maps a stage name to its number of workers, e.g.
+    {'download': 3, 'convert': 1}. Jobs with a higher priority run first,
+    jobs with the same priority run in submission order.
+    """
+
+    def __init__(self, limits):
+        self._cond = threading.Condition()
+        self._queues = {stage: [] for stage in limits}
+        self._seq = itertools.count()
+        self._running = {}      # download_id -> stage
+        self._processes = {}    # download_id -> Popen
+        self._cancelled = set()
+        self.limits = dict(limits)
+
+        for stage, workers in limits.items():
+            for i in range(workers):
+                thread = threading.Thread(
+                    target=self._worker,
+                    args=(stage,),
+                    name=f'tubegrab-{stage}-{i}',
+                    daemon=True
+                )
+                thread.start()
+
+    def submit(self, download_id, stage, func, *args, priority=0):
+        """Queue func(*args) to run on the given stage's pool on behalf of download_id"""
+        with self._cond:
+            entry = (-priority, next(self._seq), download_id, func, args)
+            heapq.heappush(self._queues[stage], entry)
+            self._cond.notify_all()
+
+    def queue_position(self, download_id):
+        """Return (stage, 1-based position) of a queued job, or (None, None)"""
+        with self._cond:
+            for stage, queue in self._queues.items():
+                for position, entry in enumerate(sorted(queue), 1):
+                    if entry[2] == download_id:
+                        return stage, position
+        return None, None
+
+    def stats(self):
+        """Return queued and running job counts per stage"""
+        with self._cond:
+            running = list(self._running.values())
+            return {
+                stage: {
+                    'queued': len(queue),
+                    'running': running.count(stage),
+                    'workers': self.limits[stage],
+                }
+                for stage, queue in self._queues.items()
+            }
+
+    def process_count(self):
+        """Number of child processes running jobs right now"""
+        with self._cond:
+            return len(self._processes)
+
+    def register_process(self, download_id, process):
+        """Track a running job's child process so it can be killed on cancel"""
+        with self._cond:
+            self._processes[download_id] = process
+            cancelled = download_id in self._cancelled
+        if cancelled:
+            kill_process(process)
+
+    def unregister_process(self, download_id):
+        with self._cond:
+            self._processes.pop(download_id, None)
+
+    def cancel(self, download_id):
+        """
+        Cancel a queued or running job.
+        Queued jobs are dropped from their queue, running jobs get their child process killed.
+        Returns True if the job was queued or running.
+        """
+        with self._cond:
+            found = False
+            for stage, queue in self._queues.items():
+                remaining = [entry for entry in queue if entry[2] != download_id]
+                if len(remaining) != len(queue):
+                    heapq.heapify(remaining)
+                    self._queues[stage] = remaining
+                    found = True
+            if download_id in self._running:
+                self._cancelled.add(download_id)
+                found = True
+            process = self._processes.get(download_id)
+
+        if process is not None:
+            kill_process(process)
+        return found
+
+    def _worker(self, stage):
+        while True:
+            with self._cond:
+                while not self._queues[stage]:
+                    self._cond.wait()
+                _, _, download_id, func, args = heapq.heappop(self._queues[stage])
+                self._running[download_id] = stage
+
+            try:
+                func(*args)
+            except Exception:
+                # Jobs record their own errors; never let one kill the worker
+                pass
+            finally:
+                with self._cond:
+                    self._running.pop(download_id, None)
+                    self._processes.pop(download_id, None)
+                    self._cancelled.discard(download_id)
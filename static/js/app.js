@@ -7,8 +7,13 @@ class YouTubeDownloader {
     constructor() {
         this.currentDownloadId = null;
         this.progressInterval = null;
+        this.progressStream = null;
         this.cookiesToken = null;
         
+        // When the server is busy (429), how often and how long to wait before giving up
+        this.maxBusyRetries = 3;
+        this.maxBusyWait = 60;
+        
         // DOM Elements
         this.urlInput = document.getElementById('urlInput');
         this.fetchBtn = document.getElementById('fetchBtn');
@@ -18,6 +23,7 @@ class YouTubeDownloader {
         this.errorSection = document.getElementById('errorSection');
         this.downloadBtn = document.getElementById('downloadBtn');
         this.saveFileBtn = document.getElementById('saveFileBtn');
+        this.streamBtn = document.getElementById('streamBtn');
         this.newDownloadBtn = document.getElementById('newDownloadBtn');
         this.retryBtn = document.getElementById('retryBtn');
         this.cookiesFileInput = document.getElementById('cookiesFile');
@@ -31,6 +37,7 @@ class YouTubeDownloader {
         this.fetchBtn.addEventListener('click', () => this.fetchVideoInfo());
         this.downloadBtn.addEventListener('click', () => this.startDownload());
         this.saveFileBtn.addEventListener('click', () => this.saveFile());
+        this.streamBtn.addEventListener('click', () => this.saveFile(true));
         this.newDownloadBtn.addEventListener('click', () => this.reset());
         this.retryBtn.addEventListener('click', () => this.reset());
         if (this.cookiesFileInput) {
@@ -65,13 +72,15 @@ class YouTubeDownloader {
         this.hideAllSections();
         
         try {
-            const response = await fetch('/api/info', {
+            const response = await this.fetchWhenReady('/api/info', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify({ 
                     url,
                     cookies_token: this.cookiesToken || undefined
                 })
+            }, (seconds) => {
+                this.fetchBtn.querySelector('.btn-text').textContent = `Busy, retrying in ${seconds}s...`;
             });
             
             const data = await response.json();
@@ -89,6 +98,32 @@ class YouTubeDownloader {
         }
     }
     
+    async fetchWhenReady(url, options, onWait) {
+        // A busy server answers 429 with Retry-After - wait as long as it asks and try again
+        for (let attempt = 0; ; attempt++) {
+            const response = await fetch(url, options);
+            if (response.status !== 429 || attempt >= this.maxBusyRetries) {
+                return response;
+            }
+            const seconds = this.retryAfterSeconds(response);
+            if (seconds > this.maxBusyWait) {
+                return response;
+            }
+            if (onWait) onWait(seconds);
+            await new Promise(resolve => setTimeout(resolve, seconds * 1000));
+        }
+    }
+    
+    retryAfterSeconds(response) {
+        // Retry-After is either a number of seconds or an HTTP date
+        const value = response.headers.get('Retry-After');
+        if (!value) return 5;
+        const seconds = Number(value);
+        if (!Number.isNaN(seconds)) return Math.max(1, Math.ceil(seconds));
+        const date = Date.parse(value);
+        return Number.isNaN(date) ? 5 : Math.max(1, Math.ceil((date - Date.now()) / 1000));
+    }
+    
     isValidYouTubeUrl(url) {
         const patterns = [
             /^(https?:\/\/)?(www\.)?youtube\.com\/watch\?v=[\w-]+/,
@@ -180,13 +215,16 @@ class YouTubeDownloader {
         this.progressSection.classList.remove('hidden');
         
         try {
-            const response = await fetch('/api/download', {
+            const response = await this.fetchWhenReady('/api/download', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify({ 
                     url,
                     cookies_token: this.cookiesToken || undefined
                 })
+            }, (seconds) => {
+                document.getElementById('statusText').textContent =
+                    `Server is busy, retrying in ${seconds}s...`;
             });
             
             const data = await response.json();
@@ -205,10 +243,41 @@ class YouTubeDownloader {
     }
     
     startProgressPolling() {
-        this.progressInterval = setInterval(() => this.checkProgress(), 500);
+        // Prefer the server-sent event stream, polling is the fallback
+        if (window.EventSource) {
+            this.startProgressStream();
+        } else {
+            this.progressInterval = setInterval(() => this.checkProgress(), 500);
+        }
+    }
+    
+    startProgressStream() {
+        const state = {};
+        this.progressStream = new EventSource(`/api/progress/${this.currentDownloadId}/stream`);
+        
+        // Each event only carries the fields that changed
+        this.progressStream.onmessage = (event) => {
+            Object.assign(state, JSON.parse(event.data));
+            this.handleProgress(state);
+        };
+        
+        // The download was cleaned up or expired on the server - nothing more will come
+        this.progressStream.addEventListener('gone', () => this.handleGone());
+        
+        this.progressStream.onerror = () => {
+            // Stream unavailable (proxy, server restart...) - fall back to polling
+            this.stopProgressPolling();
+            if (this.currentDownloadId) {
+                this.progressInterval = setInterval(() => this.checkProgress(), 500);
+            }
+        };
     }
     
     stopProgressPolling() {
+        if (this.progressStream) {
+            this.progressStream.close();
+            this.progressStream = null;
+        }
         if (this.progressInterval) {
             clearInterval(this.progressInterval);
             this.progressInterval = null;
@@ -216,31 +285,50 @@ class YouTubeDownloader {
     }
     
     async checkProgress() {
-        if (!this.currentDownloadId) return;
+        const downloadId = this.currentDownloadId;
+        if (!downloadId) return;
         
         try {
-            const response = await fetch(`/api/progress/${this.currentDownloadId}`);
+            const response = await fetch(`/api/progress/${downloadId}`);
             const data = await response.json();
             
+            if (response.status === 404) {
+                // Unless the user moved on while this request was out
+                if (downloadId === this.currentDownloadId) this.handleGone();
+                return;
+            }
             if (!response.ok) {
                 throw new Error(data.error || 'Failed to check progress');
             }
             
-            this.updateProgress(data);
-            
-            if (data.status === 'completed') {
-                this.stopProgressPolling();
-                this.showCompleted(data);
-            } else if (data.status === 'error') {
-                this.stopProgressPolling();
-                this.showError(data.error || 'Download failed');
-            }
+            this.handleProgress(data);
             
         } catch (error) {
             console.error('Progress check error:', error);
         }
     }
     
+    handleGone() {
+        // Polling a download the server no longer knows would go on forever
+        this.stopProgressPolling();
+        this.showError('Download is no longer available');
+    }
+    
+    handleProgress(data) {
+        this.updateProgress(data);
+        
+        if (data.status === 'completed') {
+            this.stopProgressPolling();
+            this.showCompleted(data);
+        } else if (data.status === 'error') {
+            this.stopProgressPolling();
+            this.showError(data.error || 'Download failed');
+        } else if (data.status === 'cancelled') {
+            this.stopProgressPolling();
+            this.showError('Download cancelled');
+        }
+    }
+    
     updateProgress(data) {
         const progressBar = document.getElementById('progressBar');
         const progressPercent = document.getElementById('progressPercent');
@@ -252,6 +340,11 @@ class YouTubeDownloader {
         progressPercent.textContent = `${Math.round(data.progress || 0)}%`;
         
         switch (data.status) {
+            case 'queued':
+                statusText.textContent = data.queue_position
+                    ? `Waiting in queue (position ${data.queue_position})...`
+                    : 'Waiting in queue...';
+                break;
             case 'starting':
                 statusText.textContent = 'Preparing download...';
                 break;
@@ -270,6 +363,9 @@ class YouTubeDownloader {
         
         downloadSpeed.textContent = this.formatSpeed(data.speed);
         downloadETA.textContent = this.formatETA(data.eta);
+        
+        // Single-stream downloads can be saved while they are still downloading
+        this.streamBtn.classList.toggle('hidden', !(data.progressive && data.status === 'downloading'));
     }
     
     showCompleted(data) {
@@ -280,12 +376,14 @@ class YouTubeDownloader {
         document.getElementById('completedFilename').textContent = filename + '.mp4';
     }
     
-    saveFile() {
+    saveFile(streaming = false) {
         if (!this.currentDownloadId) return;
         
         // Create download link
         const link = document.createElement('a');
-        link.href = `/api/file/${this.currentDownloadId}`;
+        link.href = streaming
+            ? `/api/stream/${this.currentDownloadId}`
+            : `/api/file/${this.currentDownloadId}`;
         link.download = '';
         document.body.appendChild(link);
         link.click();
@@ -329,6 +427,7 @@ class YouTubeDownloader {
         document.getElementById('progressPercent').textContent = '0%';
         document.getElementById('downloadSpeed').textContent = '';
         document.getElementById('downloadETA').textContent = '';
+        this.streamBtn.classList.add('hidden');
         
         this.urlInput.focus();
     }
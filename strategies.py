@@ -0,0 +1,132 @@
+"""
+TubeGrab - Extraction strategy chain
+Tries alternative ways of doing the same thing (e.g. extracting with browser
+cookies, uploaded cookies or a plain user agent) in order of what has worked
+lately, keeping strategies that keep failing out of the way for a while.
+"""
+
+import threading
+import time
+
+
+class _Strategy:
+    __slots__ = ('attempts', 'successes', 'failures', 'inconclusive', 'consecutive', 'trips',
+                 'open_until', 'last_success', 'success_time')
+
+    def __init__(self):
+        self.attempts = 0
+        self.successes = 0
+        self.failures = 0
+        self.inconclusive = 0    # Failed along with every other strategy
+        self.consecutive = 0     # Failures since the last success
+        self.trips = 0           # Times the breaker opened in a row
+        self.open_until = 0.0
+        self.last_success = None
+        self.success_time = 0.0  # Total seconds spent in successful attempts
+
+
+class StrategyChain:
+    """
+    Runs the first strategy that succeeds, known-good ones first.
+
+    A strategy is only blamed for failing when a later one then succeeds - if
+    every strategy fails, the input was most likely bad (a private or removed
+    video), not the strategies. After `threshold` failures in a row a
+    strategy's circuit breaker opens and it is skipped for `cooldown` seconds
+    (unless no other strategy is left), doubling up to `max_cooldown` each time
+    it fails its trial run afterwards.
+    """
+
+    def __init__(self, threshold=3, cooldown=300, max_cooldown=3600):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self._lock = threading.Lock()
+        self._strategies = {}
+        self._preferred = None
+
+    def run(self, attempts):
+        """
+        Call each (name, func) in attempts, reordered by past results, until one
+        returns. Returns its result; if all of them raise, the last error is re-raised.
+        """
+        failed = []
+        error = None
+        for name, func in self._order(attempts):
+            started = time.monotonic()
+            try:
+                result = func()
+            except Exception as e:
+                error = e
+                failed.append(name)
+                continue
+            self._record(name, time.monotonic() - started, failed)
+            return result
+        with self._lock:
+            for name in failed:
+                strategy = self._get(name)
+                strategy.attempts += 1
+                strategy.inconclusive += 1
+        raise error
+
+    def stats(self):
+        now = time.time()
+        with self._lock:
+            return {
+                'preferred': self._preferred,
+                'strategies': {
+                    name: {
+                        'attempts': s.attempts,
+                        'successes': s.successes,
+                        'failures': s.failures,
+                        'inconclusive': s.inconclusive,
+                        'success_rate': (round(s.successes / (s.successes + s.failures), 3)
+                                         if s.successes + s.failures else None),
+                        'avg_success_seconds': round(s.success_time / s.successes, 3) if s.successes else None,
+                        'breaker': 'open' if s.open_until > now else 'closed',
+                        'retry_in': max(0, round(s.open_until - now)),
+                        'last_success': s.last_success,
+                    }
+                    for name, s in self._strategies.items()
+                },
+            }
+
+    def _order(self, attempts):
+        # The last strategy that worked goes first, then the rest in the caller's order.
+        # Strategies with an open breaker are skipped, unless that would leave none.
+        now = time.time()
+        with self._lock:
+            closed = [(name, func) for name, func in attempts if self._get(name).open_until <= now]
+            preferred = self._preferred
+        return sorted(closed or attempts, key=lambda attempt: attempt[0] != preferred)
+
+    def _get(self, name):
+        # Caller holds the lock
+        strategy = self._strategies.get(name)
+        if strategy is None:
+            strategy = self._strategies[name] = _Strategy()
+        return strategy
+
+    def _record(self, succeeded, elapsed, failed):
+        now = time.time()
+        with self._lock:
+            strategy = self._get(succeeded)
+            strategy.attempts += 1
+            strategy.successes += 1
+            strategy.consecutive = 0
+            strategy.trips = 0
+            strategy.open_until = 0.0
+            strategy.last_success = now
+            strategy.success_time += elapsed
+            self._preferred = succeeded
+
+            for name in failed:
+                strategy = self._get(name)
+                strategy.attempts += 1
+                strategy.failures += 1
+                strategy.consecutive += 1
+                if strategy.consecutive >= self.threshold:
+                    # Open (again) - a failed trial run after a cooldown doubles the next one
+                    cooldown = min(self.max_cooldown, self.cooldown * 2 ** strategy.trips)
+                    strategy.open_until = now + cooldown
+                    strategy.trips += 1
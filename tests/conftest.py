@@ -0,0 +1,49 @@
+"""
+TubeGrab - Test setup
+app.py reads its configuration when it is imported, so the environment is set
+here, before any test imports it: downloads and uploaded cookies go to
+temporary folders, jobs run in this process on the command-line engine, and
+yt-dlp, ffmpeg and ffprobe are the stand-ins in benchmarks/stubs. Media comes from a local origin (see the
+`origin` fixture), so nothing touches the network.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from helpers import STUBS, MediaOrigin
+
+DOWNLOAD_FOLDER = tempfile.mkdtemp(prefix='tubegrab-test-')
+COOKIES_FOLDER = tempfile.mkdtemp(prefix='tubegrab-test-cookies-')
+
+os.environ.update(
+    TUBEGRAB_DOWNLOAD_FOLDER=DOWNLOAD_FOLDER,
+    TUBEGRAB_COOKIES_FOLDER=COOKIES_FOLDER,
+    TUBEGRAB_EXECUTION='inline',
+    TUBEGRAB_JOB_STORE='memory',
+    TUBEGRAB_ENGINE='cli',
+    TUBEGRAB_MAX_DOWNLOADS='4',
+    TUBEGRAB_COOKIES_BROWSER='',
+    TUBEGRAB_CLIENT_RATE='0',
+    TUBEGRAB_MIN_FREE_DISK='0',
+    YTDLP_PATH=os.path.join(STUBS, 'yt-dlp'),
+    FFMPEG_PATH=os.path.join(STUBS, 'ffmpeg'),
+    FFPROBE_PATH=os.path.join(STUBS, 'ffprobe'),
+)
+
+
+@pytest.fixture
+def origin():
+    server = MediaOrigin()
+    yield server
+    server.close()
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(DOWNLOAD_FOLDER, ignore_errors=True)
+    shutil.rmtree(COOKIES_FOLDER, ignore_errors=True)
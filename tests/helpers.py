@@ -0,0 +1,147 @@
+"""
+TubeGrab - Test helpers
+A local media origin to download from, running the server and workers as
+separate processes, and waiting for things that happen in other threads or
+processes.
+"""
+
+import os
+import re
+import signal
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STUBS = os.path.join(ROOT, 'benchmarks', 'stubs')
+
+# Every file the origin serves repeats this; its length is prime, so bytes
+# stitched together at the wrong offset don't match
+PATTERN = bytes(range(251))
+
+
+def media_bytes(start, end):
+    """Bytes [start, end) of any file the origin serves"""
+    offset = start % len(PATTERN)
+    repeats = (end - start + offset) // len(PATTERN) + 1
+    return (PATTERN * repeats)[offset:offset + end - start]
+
+
+def wait_until(condition, timeout=15, interval=0.05, what='condition'):
+    """Poll condition() until it returns something true, and return that"""
+    deadline = time.monotonic() + timeout
+    while True:
+        value = condition()
+        if value:
+            return value
+        if time.monotonic() > deadline:
+            raise AssertionError(f'Timed out waiting for {what}')
+        time.sleep(interval)
+
+
+class _OriginHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.respond(body=True)
+
+    def do_HEAD(self):
+        self.respond(body=False)
+
+    def respond(self, body):
+        parts = urlsplit(self.path)
+        query = parse_qs(parts.query)
+        size = int(query.get('size', ['1048576'])[0])
+        rate = float(query.get('rate', ['0'])[0])
+        range_header = self.headers.get('Range')
+        self.server.requests.append((parts.path, range_header))
+
+        start, end = 0, size
+        match = re.fullmatch(r'bytes=(\d+)-(\d*)', range_header or '')
+        if match and int(match.group(1)) < size:
+            start = int(match.group(1))
+            end = min(size, int(match.group(2)) + 1) if match.group(2) else size
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end - 1}/{size}')
+        else:
+            self.send_response(200)
+        ext = os.path.splitext(parts.path)[1].lstrip('.') or 'mp4'
+        self.send_header('Content-Type', f'video/{ext}')
+        self.send_header('Content-Length', str(end - start))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+        if not body:
+            return
+
+        sent, started = start, time.monotonic()
+        try:
+            while sent < end:
+                chunk = media_bytes(sent, min(end, sent + 64 * 1024))
+                self.wfile.write(chunk)
+                sent += len(chunk)
+                if rate:
+                    time.sleep(max(0.0, started + (sent - start) / rate - time.monotonic()))
+        except OSError:
+            pass  # The downloader hung up
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MediaOrigin:
+    """
+    Local HTTP server answering /media/<name>.<ext>?size=<bytes>&rate=<bytes/s>
+    with that many bytes of media_bytes() at that speed (0 for unthrottled).
+    Range requests get 206. `requests` lists (path, Range header) of every request.
+    """
+
+    def __init__(self):
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), _OriginHandler)
+        self._server.daemon_threads = True
+        self._server.requests = []
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    @property
+    def requests(self):
+        return self._server.requests
+
+    def url(self, name, size, rate=0):
+        return f'http://127.0.0.1:{self._server.server_port}/media/{name}?size={size}&rate={rate}'
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def stub_command(url, output_template):
+    """Command line running the stub yt-dlp on its own"""
+    return [os.path.join(STUBS, 'yt-dlp'), '-o', output_template, url]
+
+
+
+def start_process(args, env, log):
+    """Run `python <args>` from the repo root in its own process group, output going to log"""
+    with open(log, 'ab') as f:
+        return subprocess.Popen([sys.executable] + args, cwd=ROOT, env=env, stdout=f, stderr=subprocess.STDOUT,
+                                start_new_session=True)
+
+
+def kill_process_group(process):
+    """SIGKILL a process started by start_process() and everything in its group, like a crash"""
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    process.wait()
+
+
+def process_alive(pid):
+    """True while pid runs (zombies waiting to be reaped don't count)"""
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            return f.read().rsplit(')', 1)[1].split()[0] != 'Z'
+    except (OSError, IndexError):
+        return False
@@ -0,0 +1,124 @@
+"""AdmissionController under synthetic load: saturation, in-flight lookups, low disk and client quotas"""
+
+import types
+from contextlib import ExitStack
+
+import pytest
+
+import admission
+from admission import AdmissionController
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A clock for the admission module that only moves when told to"""
+    now = [1000.0]
+    monkeypatch.setattr(admission, 'time', types.SimpleNamespace(monotonic=lambda: now[0]))
+
+    def advance(seconds):
+        now[0] += seconds
+    return advance
+
+
+@pytest.fixture
+def load():
+    """(queued, running, workers) the controller sees for the download stage"""
+    return {'queued': 0, 'running': 0, 'workers': 2}
+
+
+@pytest.fixture
+def make(load, tmp_path, clock):
+    def make(**options):
+        options = {'max_queued': 5, 'client_rate': 0, **options}
+        controller = AdmissionController(lambda: (load['queued'], load['running'], load['workers']),
+                                         str(tmp_path), **options)
+        controller.LOAD_INTERVAL = 0  # Every check sees the current load
+        return controller
+    return make
+
+
+def test_downloads_wait_only_when_workers_are_busy_and_the_queue_is_full(make, load):
+    controller = make()
+    load.update(queued=4, running=2)
+    assert controller.check('download', 'client') is None
+
+    load['queued'] = 5
+    # One job too many, two workers, a minute a download: a slot frees in half a minute
+    assert controller.check('download', 'client') == 30
+    # A batch of three goes over by three
+    assert controller.check('download', 'client', cost=3) == 90
+
+    load['running'] = 1  # A worker is idle - the queue drains right away
+    assert controller.check('download', 'client') is None
+    assert controller.stats()['rejected'] == {'overload': 2, 'disk': 0, 'quota': 0}
+
+
+def test_retry_after_follows_the_measured_download_time(make, load, clock):
+    controller = make()
+    for seconds in (10, 10, 20):
+        with controller.track('download'):
+            clock(seconds)
+    # 10, then 10, then 10 + 0.2 * (20 - 10)
+    assert controller.latency('download') == pytest.approx(12)
+
+    load.update(queued=9, running=2)
+    assert controller.check('download', 'client') == 30  # 5 over * 12 s / 2 workers
+    load['queued'] = 500
+    assert controller.check('download', 'client') == AdmissionController.MAX_RETRY_AFTER
+
+
+def test_info_lookups_wait_while_too_many_run(make, clock):
+    controller = make(max_info_inflight=2)
+    with ExitStack() as running:
+        running.enter_context(controller.track('info'))
+        assert controller.check('info', 'client') is None
+        running.enter_context(controller.track('info'))
+        # Nothing measured yet: the default lookup time
+        assert controller.check('info', 'client') == AdmissionController.DEFAULT_LATENCY['info']
+        clock(3)
+    assert controller.stats()['inflight'] == {'info': 0}
+    assert controller.check('info', 'client') is None
+    assert controller.latency('info') == 3
+
+
+def test_downloads_wait_for_free_disk(make, tmp_path):
+    controller = make(min_free_disk=1 << 62)
+    assert controller.check('download', 'client') == 60
+    assert controller.stats()['rejected']['disk'] == 1
+
+    # No reading of the disk doesn't block downloads
+    controller = make(min_free_disk=1 << 62)
+    controller.disk_path = str(tmp_path / 'missing')
+    assert controller.check('download', 'client') is None
+
+
+def test_each_client_gets_its_own_token_bucket(make, clock):
+    controller = make(client_rate=1, client_burst=3)
+    for _ in range(3):
+        assert controller.check('info', 'alice') is None
+    assert controller.check('info', 'alice') == 1
+    assert controller.check('info', 'bob') is None
+
+    clock(2)
+    assert controller.check('info', 'alice') is None
+    assert controller.check('info', 'alice') is None
+    assert controller.check('info', 'alice') == 1
+    assert controller.stats()['rejected']['quota'] == 2
+
+
+def test_batch_bigger_than_the_burst_gets_in_on_a_full_bucket(make, clock):
+    controller = make(client_rate=1, client_burst=3)
+    assert controller.check('download', 'alice', cost=50) is None
+    assert controller.check('download', 'alice', cost=50) == 3  # Until the bucket is full again
+    clock(3)
+    assert controller.check('download', 'alice', cost=50) is None
+
+
+def test_least_recently_seen_clients_are_forgotten(make):
+    controller = make(client_rate=1, client_burst=1, max_clients=2)
+    for client in ('alice', 'bob', 'carol'):
+        assert controller.check('info', client) is None
+    assert controller.stats()['clients'] == 2
+    # Alice's empty bucket went - she starts over with a full one
+    assert controller.check('info', 'alice') is None
+    assert controller.check('info', 'carol') == 1
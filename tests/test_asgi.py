@@ -0,0 +1,74 @@
+"""ASGI server: the progress poller keeps feeding streams through failed snapshots"""
+
+import asyncio
+
+import pytest
+
+pytest.importorskip('starlette')
+
+import asgi
+import app as tubegrab
+
+
+@pytest.fixture
+def snapshots(monkeypatch):
+    """progress_snapshot() failing like a locked SQLite database while `failing` is set"""
+    state = {'failing': True, 'calls': 0}
+
+    def snapshot(download_id):
+        state['calls'] += 1
+        if state['failing']:
+            raise RuntimeError('database is locked')
+        return 1, {'status': 'downloading', 'progress': 50}
+
+    monkeypatch.setattr(tubegrab, 'progress_snapshot', snapshot)
+    return state
+
+
+async def calls(snapshots, count):
+    """Wait until progress_snapshot() has been called count times"""
+    async def wait():
+        while snapshots['calls'] < count:
+            await asyncio.sleep(0.01)
+    await asyncio.wait_for(wait(), 2)
+
+
+def test_poller_survives_failed_ticks(snapshots):
+    async def scenario():
+        poller = asgi.ProgressPoller(0.01)
+        queue = poller.watch('locked1')
+        await calls(snapshots, 3)
+        assert queue.empty()
+        assert poller._task is not None and not poller._task.done()
+
+        snapshots['failing'] = False
+        assert await asyncio.wait_for(queue.get(), 2) == (1, {'status': 'downloading', 'progress': 50})
+
+        poller.unwatch('locked1', queue)
+        await asyncio.wait_for(poller._task, 2)
+        assert poller._task is None
+
+    asyncio.run(scenario())
+
+
+def test_poller_restarts_after_its_task_ends_abruptly(snapshots):
+    async def scenario():
+        poller = asgi.ProgressPoller(0.01)
+        queue = poller.watch('locked2')
+        task = poller._task
+        await calls(snapshots, 1)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert poller._task is None
+
+        # The next stream to open starts polling again, for everyone watching
+        snapshots['failing'] = False
+        other = poller.watch('locked3')
+        assert (await asyncio.wait_for(queue.get(), 2))[1]['progress'] == 50
+        assert (await asyncio.wait_for(other.get(), 2))[1]['progress'] == 50
+        poller.unwatch('locked2', queue)
+        poller.unwatch('locked3', other)
+        await asyncio.wait_for(poller._task, 2)
+
+    asyncio.run(scenario())
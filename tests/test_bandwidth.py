@@ -0,0 +1,63 @@
+"""BandwidthController: command-line jobs keep their starting rate, the others share what's left"""
+
+from bandwidth import BandwidthController
+
+MB = 1024 * 1024
+
+
+class Pooled:
+    """An in-process job that takes rate changes while it runs"""
+
+    def __init__(self, controller, download_id, weight=1.0):
+        self.rates = []
+        self.rate = controller.add(download_id, weight, on_change=self.on_change)[0]
+
+    def on_change(self, rate):
+        self.rate = rate
+        self.rates.append(rate)
+
+
+def in_use(controller, pooled, fixed):
+    """Bytes/s the jobs actually use: pooled ones at their latest rate, fixed ones at their first"""
+    return sum(job.rate for job in pooled) + sum(fixed.values())
+
+
+def test_pooled_jobs_share_what_fixed_jobs_leave():
+    controller = BandwidthController(8 * MB)
+    first = Pooled(controller, 'p1')
+    assert first.rate == 8 * MB
+
+    fixed = {'cli': controller.add('cli')[0]}
+    assert fixed['cli'] == 4 * MB
+    assert first.rates == [4 * MB]
+
+    second = Pooled(controller, 'p2')
+    assert (first.rate, second.rate) == (2 * MB, 2 * MB)
+    # The command-line job can't be told, so it isn't counted as slowed down either
+    assert controller.stats()['jobs']['cli']['rate'] == 4 * MB
+    assert in_use(controller, [first, second], fixed) == 8 * MB
+
+
+def test_fixed_job_leaving_frees_its_rate():
+    controller = BandwidthController(8 * MB)
+    fixed = {'cli': controller.add('cli')[0]}
+    pooled = Pooled(controller, 'p1')
+    assert in_use(controller, [pooled], fixed) <= 8 * MB + controller.min_rate
+
+    controller.remove('cli')
+    assert pooled.rate == 8 * MB
+
+
+def test_fixed_jobs_never_push_the_total_over_the_limit():
+    controller = BandwidthController(12 * MB)
+    fixed, pooled = {}, []
+    for i in range(3):
+        pooled.append(Pooled(controller, f'p{i}', weight=2.0 ** i))
+        fixed[f'cli{i}'] = controller.add(f'cli{i}')[0]
+        assert in_use(controller, pooled, fixed) <= 12 * MB + len(pooled) * controller.min_rate
+    for download_id in list(fixed):
+        controller.remove(download_id)
+    assert in_use(controller, pooled, {}) <= 12 * MB
+    # Split by weight, give or take the change a job's rate has to move by to be updated
+    for job, weight in zip(pooled, (1, 2, 4)):
+        assert abs(job.rate - 12 * MB * weight / 7) <= job.rate * controller.MIN_CHANGE
@@ -0,0 +1,82 @@
+"""Batches: aggregate progress over their items, and the finished files as one streamed ZIP"""
+
+import io
+import zipfile
+
+import pytest
+
+import app as tubegrab
+from helpers import media_bytes, wait_until
+
+SIZES = {'first.mp4': 96 * 1024, 'second.mp4': 160 * 1024, 'slow.mp4': 256 * 1024}
+
+
+@pytest.fixture
+def client():
+    return tubegrab.app.test_client()
+
+
+def batch(client, batch_id):
+    return client.get(f'/api/batch/{batch_id}').get_json()
+
+
+def finished(client, batch_id):
+    """The batch's progress once none of its items runs any more"""
+    def done():
+        progress = batch(client, batch_id)
+        return progress if progress['status'] != 'running' else None
+    return wait_until(done, what='the batch to finish')
+
+
+def test_batch_progress_and_zip(client, origin):
+    urls = [origin.url(name, size, rate=256 * 1024 if name == 'slow.mp4' else 0) for name, size in SIZES.items()]
+    # The first video twice: both items get the one file
+    urls.append(urls[0])
+    started = client.post('/api/batch', json={'urls': urls}).get_json()
+    batch_id = started['batch_id']
+    assert len(started['download_ids']) == 4
+
+    running = batch(client, batch_id)
+    assert running['status'] == 'running'
+    assert 0 <= running['progress'] < 100
+    assert [item['download_id'] for item in running['items']] == started['download_ids']
+    assert client.get(f'/api/batch/{batch_id}/zip').status_code == 409
+
+    done = finished(client, batch_id)
+    assert done['status'] == 'completed'
+    assert done['progress'] == 100
+    assert done['counts'] == {'completed': 4}
+
+    response = client.get(f'/api/batch/{batch_id}/zip')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/zip'
+    assert f'tubegrab-{batch_id}.zip' in response.headers['Content-Disposition']
+    with zipfile.ZipFile(io.BytesIO(response.data)) as zf:
+        entries = zf.infolist()
+        assert sorted(entry.filename for entry in entries) == [
+            'first (1).mp4', 'first.mp4', 'second.mp4', 'slow.mp4'
+        ]
+        for entry in entries:
+            assert entry.compress_type == zipfile.ZIP_STORED
+            size = SIZES[entry.filename.replace(' (1)', '')]
+            assert zf.read(entry) == media_bytes(0, size)
+
+
+def test_batch_with_a_failed_item_is_partial(client, origin):
+    urls = [origin.url('fine.mp4', 32 * 1024), 'http://127.0.0.1:9/media/unreachable.mp4']
+    batch_id = client.post('/api/batch', json={'urls': urls}).get_json()['batch_id']
+    done = finished(client, batch_id)
+    assert done['status'] == 'partial'
+    assert done['counts'] == {'completed': 1, 'error': 1}
+    assert done['items'][1]['error']
+
+    # Only what completed goes in the archive
+    with zipfile.ZipFile(io.BytesIO(client.get(f'/api/batch/{batch_id}/zip').data)) as zf:
+        assert zf.namelist() == ['fine.mp4']
+
+
+def test_bad_batches(client):
+    assert client.post('/api/batch', json={'urls': 'https://example.com/v'}).status_code == 400
+    assert client.post('/api/batch', json={'urls': []}).status_code == 400
+    assert client.get('/api/batch/missing').status_code == 404
+    assert client.get('/api/batch/missing/zip').status_code == 404
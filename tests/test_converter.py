@@ -0,0 +1,134 @@
+"""Conversion planner: which plan each pair of codecs gets, its ffmpeg command, and -progress parsing"""
+
+import os
+
+import pytest
+
+from converter import AUDIO, ENCODE, REMUX, ffmpeg_command, parse_progress, plan_conversion, probe_media
+from helpers import STUBS
+
+
+def media(video, audio, duration=10.0):
+    return {'duration': duration, 'video': video, 'audio': audio}
+
+
+@pytest.mark.parametrize('video, audio, plan', [
+    ('h264', 'aac', REMUX),
+    ('hevc', 'eac3', REMUX),
+    ('vp9', 'opus', REMUX),      # YouTube's WebM: the target players take both from MP4
+    ('av1', 'opus', REMUX),
+    ('h264', 'vorbis', AUDIO),
+    ('vp9', 'vorbis', AUDIO),
+    ('vp8', 'vorbis', ENCODE),
+    ('theora', 'vorbis', ENCODE),
+    ('vp8', 'aac', ENCODE),
+    (None, 'opus', REMUX),       # Audio only
+    (None, 'vorbis', AUDIO),
+    ('vp8', None, ENCODE),       # Video only
+])
+def test_plan_for_codecs(video, audio, plan):
+    assert plan_conversion(media(video, audio)) == plan
+
+
+def test_unprobed_media_tries_a_remux():
+    assert plan_conversion(None) == REMUX
+
+
+def options(cmd, name):
+    """Values given to an ffmpeg option, in order"""
+    return [cmd[i + 1] for i, arg in enumerate(cmd) if arg == name]
+
+
+@pytest.mark.parametrize('plan, video, audio', [
+    (REMUX, 'copy', 'copy'),
+    (AUDIO, 'copy', 'aac'),
+    (ENCODE, 'libx264', 'aac'),
+])
+def test_command_for_plan(plan, video, audio):
+    cmd = ffmpeg_command('ffmpeg', 'in.webm', 'out.mp4', plan, media('vp9', 'vorbis'), threads=3, preset='fast')
+    assert cmd[0] == 'ffmpeg' and cmd[-1] == 'out.mp4'
+    assert options(cmd, '-i') == ['in.webm']
+    assert options(cmd, '-progress') == ['pipe:1']
+    assert options(cmd, '-c:v') == [video]
+    assert options(cmd, '-c:a') == [audio]
+    assert options(cmd, '-movflags') == ['+faststart']
+    # Only an encode is CPU-bound enough for a preset and a share of the cores
+    if plan == ENCODE:
+        assert options(cmd, '-preset') == ['fast']
+        assert options(cmd, '-threads') == ['3']
+        assert options(cmd, '-pix_fmt') == ['yuv420p']
+    else:
+        assert options(cmd, '-preset') == options(cmd, '-threads') == []
+
+
+def test_encode_without_a_thread_count_leaves_it_to_ffmpeg():
+    cmd = ffmpeg_command('ffmpeg', 'in.webm', 'out.mp4', ENCODE, threads=0)
+    assert options(cmd, '-threads') == []
+    assert options(cmd, '-preset') == ['veryfast']
+
+
+def test_copied_hevc_gets_the_apple_tag():
+    assert options(ffmpeg_command('ffmpeg', 'in.mkv', 'out.mp4', REMUX, media('hevc', 'aac')), '-tag:v') == ['hvc1']
+    assert options(ffmpeg_command('ffmpeg', 'in.mkv', 'out.mp4', REMUX, media('h264', 'aac')), '-tag:v') == []
+
+
+def blocks(output):
+    """Split -progress output into its blocks, each ended by a progress= line, like app.py does"""
+    block = {}
+    for line in output.splitlines():
+        key, _, value = line.partition('=')
+        block[key] = value
+        if key == 'progress':
+            yield block
+            block = {}
+
+
+@pytest.mark.parametrize('output, duration, expected', [
+    ('out_time_us=2500000\nspeed=2.5x\nprogress=continue', 10.0, (25.0, 3.0)),
+    ('out_time_us=10000000\nspeed=4x\nprogress=end', 10.0, (100.0, 0.0)),
+    # Past the probed duration, the percentage stops at 100
+    ('out_time_us=12000000\nspeed=1x\nprogress=end', 10.0, (100.0, 0.0)),
+    # Older ffmpeg only has out_time_ms - in microseconds too
+    ('out_time_ms=5000000\nspeed=1x\nprogress=continue', 10.0, (50.0, 5.0)),
+    # Nothing written yet: the time and speed are N/A
+    ('out_time_us=N/A\nspeed=N/A\nprogress=continue', 10.0, (None, None)),
+    ('out_time_us=1000000\nspeed=N/A\nprogress=continue', 10.0, (10.0, None)),
+    # Without a duration there is no telling
+    ('out_time_us=1000000\nspeed=1x\nprogress=continue', None, (None, None)),
+])
+def test_parse_progress(output, duration, expected):
+    [block] = blocks(output)
+    assert parse_progress(block, duration) == expected
+
+
+def test_progress_of_a_whole_conversion():
+    output = ''.join(f'frame={i}\nout_time_us={i * 1_000_000}\nspeed=2x\nprogress=continue\n' for i in range(1, 4))
+    output += 'out_time_us=4000000\nspeed=2x\nprogress=end\n'
+    assert [parse_progress(block, 4.0)[0] for block in blocks(output)] == [25.0, 50.0, 75.0, 100.0]
+
+
+def test_probe_reads_the_first_stream_of_each_kind(monkeypatch):
+    monkeypatch.setenv('BENCH_VCODEC', 'vp9')
+    monkeypatch.setenv('BENCH_ACODEC', 'vorbis')
+    monkeypatch.setenv('BENCH_DURATION', '12.5')
+    assert probe_media(os.path.join(STUBS, 'ffprobe'), 'any.webm') == media('vp9', 'vorbis', 12.5)
+
+
+def test_failed_probe():
+    assert probe_media(os.path.join(STUBS, 'missing-ffprobe'), 'any.webm') is None
+
+
+@pytest.mark.parametrize('video, audio, plan', [
+    (None, None, AUDIO),  # The stub's defaults
+    ('h264', 'aac', REMUX),
+    ('h264', 'vorbis', AUDIO),
+    ('vp8', 'vorbis', ENCODE),
+])
+def test_stub_codecs_reach_each_plan(monkeypatch, video, audio, plan):
+    """The codecs benchmarks/pipeline.py --conversion has the stub ffprobe report"""
+    for name, codec in (('BENCH_VCODEC', video), ('BENCH_ACODEC', audio)):
+        if codec:
+            monkeypatch.setenv(name, codec)
+        else:
+            monkeypatch.delenv(name, raising=False)
+    assert plan_conversion(probe_media(os.path.join(STUBS, 'ffprobe'), 'any.webm')) == plan
@@ -0,0 +1,169 @@
+"""Cookies: uploads stored once per content, one browser export reused, shared uploads deleted last"""
+
+import hashlib
+import io
+import os
+import threading
+
+import pytest
+
+import app as tubegrab
+import cookieresolver
+from cookieresolver import CookieResolver
+from helpers import wait_until
+from jobstore import MemoryJobStore, SQLiteJobStore
+
+BROWSER_COOKIES = '# Netscape HTTP Cookie File\n.youtube.com\tTRUE\t/\tTRUE\t0\tSID\tbrowser\n'
+
+
+@pytest.fixture
+def folder(tmp_path):
+    path = tmp_path / 'cookies'
+    path.mkdir()
+    return str(path)
+
+
+@pytest.fixture
+def exports(monkeypatch):
+    """Calls of the browser export, which writes BROWSER_COOKIES - or raises while `failing` is set"""
+    state = {'calls': [], 'failing': False}
+
+    class Jar:
+        def save(self, path):
+            with open(path, 'w') as f:
+                f.write(BROWSER_COOKIES)
+
+    def extract(browser, profile):
+        state['calls'].append((browser, profile))
+        if state['failing']:
+            raise RuntimeError('could not find chrome cookies database')
+        return Jar()
+
+    monkeypatch.setattr(cookieresolver, 'extract_cookies_from_browser', extract)
+    return state
+
+
+def test_identical_uploads_share_one_file(folder):
+    resolver = CookieResolver(folder, browser='')
+    first = resolver.save_upload(b'# cookies of alice')
+    os.utime(first, (0, 0))
+    again = resolver.save_upload(b'# cookies of alice')
+    other = resolver.save_upload(b'# cookies of bob')
+
+    assert first == again != other
+    assert os.path.basename(first) == hashlib.sha256(b'# cookies of alice').hexdigest() + '.txt'
+    # Uploading it again restarts its time to live
+    assert os.path.getmtime(again) > 0
+    assert sorted(os.listdir(folder)) == sorted(os.path.basename(path) for path in (first, other))
+
+
+def test_each_run_gets_a_private_copy(folder):
+    resolver = CookieResolver(folder, browser='')
+    upload = resolver.save_upload(b'# cookies of alice')
+    with resolver.for_job(upload) as one, resolver.for_job(upload) as two:
+        assert len({one, two, upload}) == 3
+        with open(one, 'rb') as f:
+            assert f.read() == b'# cookies of alice'
+        # yt-dlp writes the cookies back when it is done - that doesn't reach the upload
+        with open(one, 'w') as f:
+            f.write('# rewritten by yt-dlp')
+    assert not os.path.exists(one) and not os.path.exists(two)
+    with open(upload, 'rb') as f:
+        assert f.read() == b'# cookies of alice'
+
+    # Expired meanwhile: the run goes without cookies
+    os.remove(upload)
+    with resolver.for_job(upload) as missing:
+        assert missing is None
+    with resolver.for_job(None) as none:
+        assert none is None
+
+
+def test_browser_cookies_are_exported_once(folder, exports):
+    resolver = CookieResolver(folder, browser='firefox:work')
+    paths = []
+    threads = [threading.Thread(target=lambda: paths.append(resolver.browser_cookies())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert exports['calls'] == [('firefox', 'work')]
+    assert paths == [resolver.browser_path] * 8
+    # Uploaded cookies win; without them, runs get a copy of the export
+    assert resolver.resolve('/uploaded.txt') == '/uploaded.txt'
+    with resolver.for_job(None) as copy:
+        with open(copy) as f:
+            assert f.read() == BROWSER_COOKIES
+    with resolver.for_job(None, browser=False) as none:
+        assert none is None
+    assert exports['calls'] == [('firefox', 'work')]
+    assert resolver.stats()['exports'] == 1
+
+    # Once stale, the next run exports again
+    os.utime(resolver.browser_path, (0, 0))
+    assert resolver.browser_cookies() == resolver.browser_path
+    assert len(exports['calls']) == 2
+
+
+def test_failed_export_is_not_retried_at_once(folder, exports):
+    resolver = CookieResolver(folder, browser='chrome', retry=600)
+    exports['failing'] = True
+    assert resolver.browser_cookies() is None
+    assert resolver.browser_cookies() is None
+    assert len(exports['calls']) == 1
+    assert resolver.stats()['failing'] and resolver.stats()['failures'] == 1
+
+    # With an earlier export on disk, a failed refresh keeps using it
+    resolver = CookieResolver(folder, browser='chrome', retry=600)
+    exports['failing'] = False
+    resolver.browser_cookies()
+    os.utime(resolver.browser_path, (0, 0))
+    exports['failing'] = True
+    assert resolver.browser_cookies() == resolver.browser_path
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path):
+    if request.param == 'memory':
+        return MemoryJobStore()
+    return SQLiteJobStore(str(tmp_path / 'jobs.db'))
+
+
+def test_shared_upload_is_released_by_its_last_token(store):
+    store.set_cookies('token1', '/cookies/shared.txt')
+    store.set_cookies('token2', '/cookies/shared.txt')
+    store.set_cookies('token3', '/cookies/own.txt')
+    assert store.pop_cookies('token1') is None
+    assert store.get_cookies('token2') == '/cookies/shared.txt'
+    assert store.pop_cookies('token2') == '/cookies/shared.txt'
+    assert store.pop_cookies('token3') == '/cookies/own.txt'
+    assert store.pop_cookies('token3') is None
+
+
+def test_shared_upload_is_deleted_after_its_last_download(origin):
+    client = tubegrab.app.test_client()
+
+    def upload():
+        return client.post('/api/cookies', data={'cookies': (io.BytesIO(b'# shared cookies'), 'cookies.txt')},
+                           content_type='multipart/form-data').get_json()['cookies_token']
+
+    tokens = [upload(), upload()]
+    assert tokens[0] != tokens[1]
+    path = tubegrab.store.get_cookies(tokens[0])
+    assert tubegrab.store.get_cookies(tokens[1]) == path
+
+    download_ids = []
+    for i, token in enumerate(tokens):
+        url = origin.url(f'cookies{i}.mp4', 16 * 1024)
+        download_ids.append(client.post('/api/download', json={'url': url, 'cookies_token': token})
+                            .get_json()['download_id'])
+    for download_id in download_ids:
+        wait_until(lambda: tubegrab.store.get(download_id)['status'] in ('completed', 'error'),
+                   what='the download to finish')
+
+    client.delete(f'/api/cleanup/{download_ids[0]}')
+    assert os.path.exists(path)
+    assert tubegrab.store.get_cookies(tokens[1]) == path
+    client.delete(f'/api/cleanup/{download_ids[1]}')
+    assert not os.path.exists(path)
@@ -0,0 +1,174 @@
+"""
+DiskBudget over both job stores: under churn the media index matches the files
+on disk and stays within the quota, and a reference to an evicted file never
+counts against the copy stored again after it
+"""
+
+import os
+import random
+
+import pytest
+
+import app as tubegrab
+from diskbudget import DiskBudget
+from helpers import media_bytes, wait_until
+from jobstore import MemoryJobStore, SQLiteJobStore
+
+QUOTA = 1024 * 1024
+KEYS = [f'video{i}:best' for i in range(24)]
+STEPS = 400
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path):
+    if request.param == 'memory':
+        return MemoryJobStore()
+    return SQLiteJobStore(str(tmp_path / 'jobs.db'))
+
+
+class Library:
+    """Stored files in a folder, fetched and released through the store like app.py does"""
+
+    def __init__(self, store, folder):
+        self.store = store
+        self.folder = folder
+        os.makedirs(folder)
+        self.budget = DiskBudget(store, QUOTA, low_water=0.75)
+        self.held = []      # (key, generation) of every reference a download holds
+        self.jobs = 0
+
+    def path(self, key):
+        # publish_file() gives a re-fetched video the name the evicted copy had
+        return os.path.join(self.folder, f'{key}.mp4')
+
+    def fetch(self, key, size):
+        """A download of key: share the stored file, or make room and store it. Returns the state."""
+        if not self.budget.admit(size):
+            return 'rejected'
+        self.jobs += 1
+        state, media = self.store.claim_media(key, f'job{self.jobs}', size)
+        if state == 'ready':
+            self.held.append((key, media['generation']))
+            return state
+        with open(self.path(key), 'wb') as f:
+            f.write(b'\0' * size)
+        followers, generation = self.store.publish_media(key, self.path(key), key, size)
+        assert followers == []
+        self.held.append((key, generation))
+        self.budget.enforce()
+        return state
+
+    def release(self, reference):
+        """A download was removed. Returns whether its file was deleted."""
+        self.held.remove(reference)
+        path = self.store.release_media(*reference)
+        if path is None:
+            return False
+        os.remove(path)
+        return True
+
+    def files_on_disk(self):
+        return {name[:-len('.mp4')]: os.path.getsize(os.path.join(self.folder, name))
+                for name in os.listdir(self.folder)}
+
+    def check(self):
+        stored, reserved = self.store.media_usage()
+        on_disk = self.files_on_disk()
+        assert reserved == 0
+        assert stored == sum(on_disk.values())
+        assert stored <= QUOTA
+        assert dict(self.store.lru_media(limit=len(KEYS))) == on_disk
+
+
+def test_usage_matches_the_files_on_disk_under_churn(store, tmp_path):
+    library = Library(store, str(tmp_path / 'media'))
+    rng = random.Random(1234)
+    sizes = {key: rng.randrange(16 * 1024, 256 * 1024) for key in KEYS}
+    deleted = set()
+
+    for _ in range(STEPS):
+        action = rng.random()
+        if action < 0.5 or not library.held:
+            key = rng.choice(KEYS)
+            library.fetch(key, sizes[key])
+        elif action < 0.85:
+            reference = rng.choice(library.held)
+            if library.release(reference):
+                deleted.add(reference)
+                # Nobody else held that copy
+                assert reference not in library.held
+        else:
+            store.touch_media(rng.choice(KEYS))
+        library.check()
+
+    assert library.budget.evictions > 0, 'the quota was never reached'
+    assert deleted, 'no file was released by its last holder'
+
+
+def test_reference_to_an_evicted_copy_does_not_release_the_new_one(store, tmp_path):
+    library = Library(store, str(tmp_path / 'media'))
+    key = KEYS[0]
+
+    # A completes the video, then it is evicted while A still holds it
+    assert library.fetch(key, 64 * 1024) == 'lead'
+    a = library.held[-1]
+    assert store.forget_media(key) == library.path(key)
+    os.remove(library.path(key))
+
+    # B fetches it again - same file name - and C shares B's copy
+    assert library.fetch(key, 64 * 1024) == 'lead'
+    b = library.held[-1]
+    assert library.fetch(key, 64 * 1024) == 'ready'
+    c = library.held[-1]
+    assert a != b == c
+
+    # Cleaning up A and then C leaves B's file alone
+    assert not library.release(a)
+    assert not library.release(c)
+    assert os.path.exists(library.path(key))
+    library.check()
+    assert library.release(b)
+    assert not os.path.exists(library.path(key))
+    library.check()
+
+
+def test_forgetting_a_missing_copy_spares_a_newer_one(store, tmp_path):
+    library = Library(store, str(tmp_path / 'media'))
+    key = KEYS[1]
+    library.fetch(key, 32 * 1024)
+    old = library.held[-1]
+    store.forget_media(key)
+    library.fetch(key, 32 * 1024)
+
+    # A download that found the old copy missing drops only that entry
+    assert store.forget_media(key, old[1]) is None
+    assert store.has_media(key)
+
+
+def test_cleanup_of_downloads_of_an_evicted_copy_keeps_the_new_one(origin):
+    client = tubegrab.app.test_client()
+    url = origin.url('evicted.mp4', 128 * 1024)
+
+    def download():
+        download_id = client.post('/api/download', json={'url': url}).get_json()['download_id']
+        wait_until(lambda: tubegrab.store.get(download_id)['status'] in ('completed', 'error'),
+                   what='the download to finish')
+        assert tubegrab.store.get(download_id)['status'] == 'completed'
+        return download_id
+
+    a = download()
+    key = tubegrab.store.get(a)['media_key']
+    # The disk budget evicts A's file
+    os.remove(tubegrab.store.forget_media(key))
+
+    b = download()
+    c = download()
+    path = tubegrab.store.get(b)['filename']
+    assert tubegrab.store.get(c)['filename'] == path == tubegrab.store.get(a)['filename']
+
+    client.delete(f'/api/cleanup/{a}')
+    client.delete(f'/api/cleanup/{c}')
+    with open(path, 'rb') as f:
+        assert f.read() == media_bytes(0, 128 * 1024)
+    client.delete(f'/api/cleanup/{b}')
+    assert not os.path.exists(path)
@@ -0,0 +1,114 @@
+"""Clip and format options: parsing, yt-dlp's format and section arguments, and the size estimate"""
+
+import pytest
+
+import app as tubegrab
+
+
+@pytest.mark.parametrize('data, options', [
+    ({}, {}),
+    ({'start': '', 'end': None}, {}),
+    ({'start': 90, 'end': '2:30'}, {'start': 90.0, 'end': 150.0}),
+    ({'start': '1:00:00.125'}, {'start': 3600.125}),
+    ({'start': 0, 'end': 5.5}, {'end': 5.5}),  # Starting at 0 is no clip start
+    ({'audio_only': True, 'max_height': 720}, {'audio_only': True}),
+    ({'max_height': '720'}, {'max_height': 720}),
+])
+def test_parse_download_options(data, options):
+    assert tubegrab.parse_download_options(data) == options
+
+
+@pytest.mark.parametrize('data, message', [
+    ({'start': 'soon'}, 'Invalid start time'),
+    ({'end': -3}, 'Invalid end time'),
+    ({'start': True}, 'Invalid start time'),
+    ({'end': 'inf'}, 'Invalid end time'),
+    ({'start': 60, 'end': 60}, 'end must be after start'),
+    ({'start': '2:00', 'end': 90}, 'end must be after start'),
+    ({'max_height': 'hd'}, 'Invalid max_height'),
+    ({'max_height': 0}, 'Invalid max_height'),
+])
+def test_invalid_download_options(data, message):
+    with pytest.raises(ValueError, match=message):
+        tubegrab.parse_download_options(data)
+
+
+@pytest.mark.parametrize('options, selector', [
+    (None, 'bv*+ba/b'),
+    ({'start': 10}, 'bv*+ba/b'),
+    ({'audio_only': True}, 'ba[ext=m4a]/ba/b'),
+    ({'max_height': 480}, 'bv*[height<=480]+ba/b[height<=480]/wv*+ba/w'),
+])
+def test_format_selector(options, selector):
+    assert tubegrab.format_selector(options) == selector
+
+
+@pytest.mark.parametrize('options, label, section', [
+    ({}, '', None),
+    ({'start': 90.0, 'end': 150.0}, '90-150', '*90-150'),
+    ({'start': 90.0}, '90-end', '*90-inf'),
+    ({'end': 5.5}, '0-5.5', '*0-5.5'),
+    # :g would have made these 3600.12 and 1e+06
+    ({'start': 3600.125, 'end': 3725.5}, '3600.125-3725.5', '*3600.125-3725.5'),
+    ({'start': 1000000.0}, '1000000-end', '*1000000-inf'),
+])
+def test_clip_bounds_keep_their_precision(options, label, section):
+    assert tubegrab.clip_label(options) == label
+    cmd = tubegrab.build_ytdlp_command('https://example.com/v', 'out', 'record', options=options)
+    sections = [cmd[i + 1] for i, arg in enumerate(cmd) if arg == '--download-sections']
+    assert sections == ([section] if section else [])
+
+
+def test_clips_a_fraction_of_a_second_apart_are_different_media():
+    url = 'https://www.youtube.com/watch?v=clips1'
+    keys = {tubegrab.media_key(url, {'start': start}) for start in (3600.12, 3600.125, 3600.13)}
+    assert len(keys) == 3
+
+
+INFO = {
+    'duration': 200,
+    'formats': [
+        {'format_id': 'a-low', 'vcodec': 'none', 'acodec': 'opus', 'abr': 64, 'filesize': 1_000},
+        {'format_id': 'a-high', 'vcodec': 'none', 'acodec': 'opus', 'abr': 160, 'filesize': 2_000},
+        {'format_id': 'v360', 'vcodec': 'vp9', 'acodec': 'none', 'height': 360, 'filesize': 10_000},
+        {'format_id': 'v720', 'vcodec': 'vp9', 'acodec': 'none', 'height': 720, 'tbr': 1000},
+        {'format_id': 'v1080', 'vcodec': 'vp9', 'acodec': 'none', 'height': 1080, 'filesize': 90_000},
+    ],
+    'requested_formats': [
+        {'format_id': 'v1080', 'filesize': 90_000},
+        {'format_id': 'a-high', 'filesize': 2_000},
+    ],
+}
+
+
+@pytest.mark.parametrize('options, formats', [
+    (None, ['v1080', 'a-high']),
+    ({'audio_only': True}, ['a-high']),
+    ({'max_height': 720}, ['v720', 'a-high']),
+    ({'max_height': 400}, ['v360', 'a-high']),
+    ({'max_height': 100}, []),
+])
+def test_selected_formats(options, formats):
+    assert [fmt['format_id'] for fmt in tubegrab.selected_formats(INFO, options)] == formats
+
+
+@pytest.mark.parametrize('options, duration, size', [
+    (None, 200, 92_000),
+    ({'audio_only': True}, 200, 2_000),
+    ({'max_height': 720}, 200, 1000 * 125 * 200 + 2_000),  # v720 only has a bitrate
+    # A clip is its share of the whole
+    ({'start': 50.0, 'end': 100.0}, 50, 23_000),
+    ({'start': 150.0}, 50, 23_000),
+    ({'audio_only': True, 'end': 20.0}, 20, 200),
+    # Past the end of the video, the clip stops at the end
+    ({'start': 100.0, 'end': 900.0}, 100, 46_000),
+])
+def test_clip_estimates(options, duration, size):
+    assert tubegrab.clip_duration(INFO, options) == duration
+    assert tubegrab.estimate_filesize(INFO, options) == size
+
+
+def test_estimates_without_info():
+    assert tubegrab.estimate_filesize(None, {'start': 10.0}) == 0
+    assert tubegrab.clip_duration(None, {'start': 10.0, 'end': 25.0}) == 15
+    assert tubegrab.clip_duration(None, {'start': 10.0}) is None
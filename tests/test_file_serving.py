@@ -0,0 +1,80 @@
+"""/api/file: byte ranges, 416 for ranges past the end, and ETag / If-Range revalidation"""
+
+import os
+
+import pytest
+
+import app as tubegrab
+from helpers import media_bytes
+
+SIZE = 1000
+
+
+@pytest.fixture
+def served():
+    """(client, URL) of a completed download of SIZE bytes"""
+    path = os.path.join(tubegrab.DOWNLOAD_FOLDER, 'served.mp4')
+    with open(path, 'wb') as f:
+        f.write(media_bytes(0, SIZE))
+    tubegrab.store.create('served1', {'status': 'completed', 'progress': 100, 'url': 'https://example.com/v',
+                                      'error': None, 'filename': path, 'cookies_token': None})
+    yield tubegrab.app.test_client(), '/api/file/served1'
+    tubegrab.store.delete('served1')
+    os.remove(path)
+
+
+def test_whole_file(served):
+    client, url = served
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.headers['Accept-Ranges'] == 'bytes'
+    assert response.headers['Content-Length'] == str(SIZE)
+    assert 'served.mp4' in response.headers['Content-Disposition']
+    assert response.data == media_bytes(0, SIZE)
+
+
+@pytest.mark.parametrize('header, start, stop', [
+    ('bytes=0-99', 0, 100),
+    ('bytes=-100', SIZE - 100, SIZE),
+    ('bytes=500-', 500, SIZE),
+    ('bytes=990-5000', 990, SIZE),  # Clipped to the file
+])
+def test_ranges(served, header, start, stop):
+    client, url = served
+    response = client.get(url, headers={'Range': header})
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == f'bytes {start}-{stop - 1}/{SIZE}'
+    assert response.headers['Content-Length'] == str(stop - start)
+    assert response.data == media_bytes(start, stop)
+
+
+def test_unsatisfiable_range(served):
+    client, url = served
+    response = client.get(url, headers={'Range': f'bytes={SIZE}-'})
+    assert response.status_code == 416
+    assert response.headers['Content-Range'] == f'bytes */{SIZE}'
+    assert response.data == b''
+
+
+def test_matching_etag_gets_304(served):
+    client, url = served
+    etag = client.get(url).headers['ETag']
+    response = client.get(url, headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+    # A file that changed since gets sent again
+    assert client.get(url, headers={'If-None-Match': '"outdated"'}).status_code == 200
+
+
+def test_if_range(served):
+    client, url = served
+    etag = client.get(url).headers['ETag']
+    # The client's partial copy is of this file: only the rest is sent
+    response = client.get(url, headers={'Range': 'bytes=600-', 'If-Range': etag})
+    assert response.status_code == 206
+    assert response.data == media_bytes(600, SIZE)
+    # It's of an older version: the whole file instead
+    response = client.get(url, headers={'Range': 'bytes=600-', 'If-Range': '"outdated"'})
+    assert response.status_code == 200
+    assert response.headers['Content-Length'] == str(SIZE)
+    assert response.data == media_bytes(0, SIZE)
@@ -0,0 +1,82 @@
+"""Serverless info functions: only api/info.py takes URLs of sites other than YouTube"""
+
+import importlib.util
+import json
+import os
+import threading
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+API = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'api')
+VIMEO = 'https://vimeo.com/76979871'
+
+
+def load(name):
+    """The handler of api/<name>.py - loaded by path, as info-simple isn't a module name"""
+    spec = importlib.util.spec_from_file_location(name.replace('-', '_'), os.path.join(API, f'{name}.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.handler
+
+
+@pytest.fixture
+def extractions(monkeypatch):
+    """URLs given to the full yt-dlp extraction, which answers without the network"""
+    load('info')  # Puts api/ on sys.path
+    import _core
+
+    calls = []
+
+    def extract(url):
+        calls.append(url)
+        return {'title': 'from yt-dlp', 'thumbnail': '', 'duration': 60, 'channel': 'someone',
+                'views': 1, 'description': ''}
+
+    monkeypatch.setattr(_core, '_extract', extract)
+    monkeypatch.setattr(_core.importlib.util, 'find_spec', lambda name: object())
+    _core._cache.clear()
+    return calls
+
+
+def post(name, url):
+    """(status, body) of a POST of url to the api/<name>.py function"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), load(name))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    request = urllib.request.Request(
+        f'http://127.0.0.1:{server.server_port}/', data=json.dumps({'url': url}).encode(),
+        headers={'Content-Type': 'application/json'}
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as e:
+        return e.code, json.load(e)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_info_simple_turns_away_other_sites(extractions):
+    status, body = post('info-simple', VIMEO)
+    assert status == 400
+    assert 'Invalid YouTube URL' in json.dumps(body)
+    assert extractions == []
+
+
+def test_info_looks_up_other_sites_with_ytdlp(extractions):
+    status, body = post('info', VIMEO)
+    assert status == 200
+    assert 'from yt-dlp' in json.dumps(body)
+    assert extractions == [VIMEO]
+
+
+def test_lookup_needs_other_sites_to_leave_youtube(extractions):
+    import _core
+
+    with pytest.raises(_core.LookupFailed) as failed:
+        _core.lookup(VIMEO)
+    assert failed.value.status == 400
+    assert _core.lookup(VIMEO, other_sites=True)['title'] == 'from yt-dlp'
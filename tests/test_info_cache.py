@@ -0,0 +1,207 @@
+"""Info lookups are cached (TTL, LRU, memory bound) and merged, per video and per uploaded cookies"""
+
+import threading
+import types
+
+import pytest
+
+import app as tubegrab
+import cache
+from cache import InfoCache
+from helpers import wait_until
+
+ALICE = '/cookies/' + 'a' * 64 + '.txt'
+BOB = '/cookies/' + 'b' * 64 + '.txt'
+
+
+@pytest.fixture
+def extractions(monkeypatch):
+    """Calls of extract_video_info, which answers with the cookies it was given"""
+    calls = []
+
+    def extract(url, cookies_path=None):
+        calls.append(cookies_path)
+        if cookies_path == BOB:
+            raise RuntimeError('Sign in to confirm your age')
+        return {'title': f'seen with {cookies_path}'}
+
+    monkeypatch.setattr(tubegrab, 'extract_video_info', extract)
+    return calls
+
+
+def test_key_includes_cookies_identity():
+    url = 'https://www.youtube.com/watch?v=abc123'
+    assert tubegrab.info_cache_key(url) == ('abc123', None)
+    assert tubegrab.info_cache_key('https://youtu.be/abc123', ALICE) == ('abc123', 'a' * 64)
+    assert tubegrab.info_cache_key(url, ALICE) != tubegrab.info_cache_key(url, BOB)
+
+
+def test_results_are_not_shared_between_cookies(extractions):
+    url = 'https://www.youtube.com/watch?v=shared1'
+    assert tubegrab.get_video_info(url, ALICE)['title'] == f'seen with {ALICE}'
+    assert tubegrab.get_video_info(url)['title'] == 'seen with None'
+    assert tubegrab.get_video_info(url, ALICE)['title'] == f'seen with {ALICE}'
+    assert extractions == [ALICE, None]
+
+
+def test_errors_are_not_shared_between_cookies(extractions):
+    url = 'https://www.youtube.com/watch?v=shared2'
+    with pytest.raises(RuntimeError):
+        tubegrab.get_video_info(url, BOB)
+    assert tubegrab.get_video_info(url)['title'] == 'seen with None'
+
+
+def test_concurrent_lookups_merge_only_with_the_same_cookies(monkeypatch):
+    url = 'https://www.youtube.com/watch?v=shared3'
+    release = threading.Event()
+    calls = []
+
+    def extract(url, cookies_path=None):
+        calls.append(cookies_path)
+        release.wait(5)
+        return {'title': f'seen with {cookies_path}'}
+
+    monkeypatch.setattr(tubegrab, 'extract_video_info', extract)
+    results = {}
+
+    def lookup(name, cookies_path):
+        results[name] = tubegrab.get_video_info(url, cookies_path)['title']
+
+    threads = [threading.Thread(target=lookup, args=(name, cookies_path))
+               for name, cookies_path in (('alice', ALICE), ('alice again', ALICE), ('anonymous', None))]
+    for thread in threads:
+        thread.start()
+    wait_until(lambda: len(calls) == 2, what='one extraction per cookies identity')
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert sorted(calls, key=str) == sorted([ALICE, None], key=str)
+    assert results == {
+        'alice': f'seen with {ALICE}',
+        'alice again': f'seen with {ALICE}',
+        'anonymous': 'seen with None',
+    }
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A clock for the cache module that only moves when told to"""
+    now = [1000.0]
+    monkeypatch.setattr(cache, 'time', types.SimpleNamespace(time=lambda: now[0]))
+
+    def advance(seconds):
+        now[0] += seconds
+    return advance
+
+
+def test_entries_expire_after_the_ttl(clock):
+    info = InfoCache(ttl=60)
+    loads = []
+
+    def load():
+        loads.append(1)
+        return {'title': f'load {len(loads)}'}
+
+    assert info.get_or_load('v', load)['title'] == 'load 1'
+    clock(59)
+    assert info.get_or_load('v', load)['title'] == 'load 1'
+    # Reuse by a download can ask for younger info than the TTL allows
+    assert info.get('v', max_age=30) is None
+    assert info.get('v')['title'] == 'load 1'
+    clock(1)
+    assert info.get('v') is None
+    assert info.get_or_load('v', load)['title'] == 'load 2'
+    assert info.stats()['entries'] == 1
+
+
+def test_least_recently_used_entry_goes_first():
+    info = InfoCache(max_entries=2)
+    info.put('a', 1)
+    info.put('b', 2)
+    assert info.get('a') == 1  # Now b is the oldest
+    info.put('c', 3)
+    assert (info.get('a'), info.get('b'), info.get('c')) == (1, None, 3)
+    assert info.stats()['evictions'] == 1
+
+
+def test_memory_bound():
+    info = InfoCache(max_bytes=10, sizeof=len)
+    info.put('a', 'aaaa')
+    info.put('b', 'bbbb')
+    info.put('c', 'cccc')
+    assert info.get('a') is None
+    assert info.stats()['bytes'] == 8
+    # A value bigger than the whole bound isn't stored, and doesn't push anything out
+    info.put('huge', 'x' * 11)
+    assert info.get('huge') is None
+    assert (info.get('b'), info.get('c')) == ('bbbb', 'cccc')
+    # Replacing a value counts only its new size
+    info.put('b', 'bb')
+    assert info.stats()['bytes'] == 6
+    assert info.stats()['evictions'] == 1
+
+
+def test_concurrent_loads_are_merged_and_counted():
+    info = InfoCache()
+    release = threading.Event()
+    calls = []
+
+    def load():
+        calls.append(1)
+        release.wait(5)
+        return {'title': 'shared'}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(info.get_or_load('v', load))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    wait_until(lambda: info.stats()['merged'] == 3, what='the other lookups to wait on the first')
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert results == [{'title': 'shared'}] * 4
+    info.get_or_load('v', load)
+    stats = info.stats()
+    assert (stats['hits'], stats['misses'], stats['merged'], stats['entries']) == (1, 1, 3, 1)
+    assert stats['hit_rate'] == 0.8  # Merged lookups didn't extract either
+
+
+def test_errors_reach_the_merged_lookups_and_are_not_cached():
+    info = InfoCache()
+    release = threading.Event()
+
+    def load():
+        release.wait(5)
+        raise RuntimeError('Video unavailable')
+
+    errors = []
+
+    def lookup():
+        try:
+            info.get_or_load('v', load)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=lookup) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    wait_until(lambda: info.stats()['merged'] == 2, what='the other lookups to wait on the first')
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert errors == ['Video unavailable'] * 3
+    assert info.get_or_load('v', lambda: 'works now') == 'works now'
+    assert info.stats()['misses'] == 2
+
+
+def test_cache_stats_endpoint(extractions):
+    url = 'https://www.youtube.com/watch?v=stats1'
+    before = tubegrab.app.test_client().get('/api/cache/stats').get_json()
+    tubegrab.get_video_info(url)
+    tubegrab.get_video_info(url)
+    after = tubegrab.app.test_client().get('/api/cache/stats').get_json()
+    assert (after['misses'] - before['misses'], after['hits'] - before['hits']) == (1, 1)
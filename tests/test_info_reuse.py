@@ -0,0 +1,94 @@
+"""Downloads reuse /api/info's extraction only with the same cookies, and never its session cookies"""
+
+import json
+
+import pytest
+
+import app as tubegrab
+from helpers import wait_until
+
+ALICE_HASH = 'a' * 64
+
+
+@pytest.fixture
+def client():
+    return tubegrab.app.test_client()
+
+
+@pytest.fixture
+def alice(tmp_path):
+    """Alice's uploaded cookies: (token, path)"""
+    path = tmp_path / f'{ALICE_HASH}.txt'
+    path.write_text('# Netscape HTTP Cookie File\n')
+    tubegrab.store.set_cookies('alice-token', str(path))
+    return 'alice-token', str(path)
+
+
+@pytest.fixture
+def loaded_info(monkeypatch):
+    """The info JSON each yt-dlp run was given with --load-info-json (None if it got the URL)"""
+    loaded = []
+    run_ytdlp = tubegrab.run_ytdlp
+
+    def record(cmd, *args, **kwargs):
+        if '--load-info-json' in cmd:
+            with open(cmd[cmd.index('--load-info-json') + 1]) as f:
+                loaded.append(json.load(f))
+        else:
+            loaded.append(None)
+        return run_ytdlp(cmd, *args, **kwargs)
+
+    monkeypatch.setattr(tubegrab, 'run_ytdlp', record)
+    return loaded
+
+
+def extracted(url):
+    """Info as yt-dlp extracts it with cookies: the session cookies are in it and in every format"""
+    return {
+        'title': 'video',
+        'webpage_url': url,
+        'cookies': 'SID=alice-session; Domain=127.0.0.1',
+        'formats': [{'format_id': '18', 'url': url, 'cookies': 'SID=alice-session; Domain=127.0.0.1'}],
+        'requested_formats': [{'format_id': '18', 'url': url, 'cookies': 'SID=alice-session'}],
+    }
+
+
+def download(client, url, cookies_token=None):
+    response = client.post('/api/download', json={'url': url, 'cookies_token': cookies_token})
+    download_id = response.get_json()['download_id']
+    wait_until(lambda: tubegrab.store.get(download_id)['status'] in ('completed', 'error'),
+               what='the download to finish')
+    return tubegrab.store.get(download_id)
+
+
+def test_reusable_only_with_the_same_cookies(alice):
+    url = 'https://www.youtube.com/watch?v=reuse1'
+    tubegrab.info_cache.put(tubegrab.info_cache_key(url, alice[1]), extracted(url))
+    assert tubegrab.reusable_info(url, alice[1]) is not None
+    assert tubegrab.reusable_info(url) is None
+    assert tubegrab.reusable_info(url, '/cookies/' + 'b' * 64 + '.txt') is None
+
+
+def test_without_cookies_strips_every_level():
+    info = tubegrab.without_cookies(extracted('https://example.com/v.mp4'))
+    assert 'cookies' not in info
+    assert all('cookies' not in fmt for fmt in info['formats'] + info['requested_formats'])
+    assert info['formats'][0]['url'] == 'https://example.com/v.mp4'
+
+
+def test_download_without_cookies_does_not_reuse_an_accounts_info(client, origin, alice, loaded_info):
+    url = origin.url('private.mp4', 256 * 1024)
+    tubegrab.info_cache.put(tubegrab.info_cache_key(url, alice[1]), extracted(url))
+
+    assert download(client, url)['status'] == 'completed'
+    assert loaded_info == [None]
+
+
+def test_download_reuses_its_own_info_without_the_session_cookies(client, origin, alice, loaded_info):
+    url = origin.url('members.mp4', 256 * 1024)
+    tubegrab.info_cache.put(tubegrab.info_cache_key(url, alice[1]), extracted(url))
+
+    assert download(client, url, cookies_token=alice[0])['status'] == 'completed'
+    [info] = loaded_info
+    assert info is not None and info['webpage_url'] == url
+    assert 'SID=alice-session' not in json.dumps(info)
@@ -0,0 +1,132 @@
+"""
+Job records keep their fields, and SQLiteJobStore's buffered progress never
+overwrites a finished record and is seen from every process
+"""
+
+import json
+import subprocess
+import sys
+import threading
+
+from helpers import ROOT
+from jobstore import JobRecord, SQLiteJobStore
+
+READERS = 4
+
+# Another worker process: writes progress through its own store, then completes the job
+WRITER = """
+import sys, time
+from jobstore import SQLiteJobStore
+store = SQLiteJobStore(sys.argv[1], flush_interval=0.2)
+for progress in range(3, 100, 3):
+    store.update('job', progress=progress, downloaded_bytes=progress * 1000)
+    time.sleep(0.1)
+store.update('job', status='completed', progress=100)
+"""
+
+# A process answering /api/progress: records every progress it sees until the job completes
+READER = """
+import json, sys, time
+from jobstore import SQLiteJobStore
+store = SQLiteJobStore(sys.argv[1])
+seen, deadline = [], time.monotonic() + 30
+while time.monotonic() < deadline:
+    version, download = store.snapshot('job')
+    if not seen or seen[-1] != download['progress']:
+        seen.append(download['progress'])
+    if download['status'] == 'completed':
+        break
+    store.wait_for_change('job', version, 1)
+print(json.dumps({'seen': seen, 'status': download['status']}))
+"""
+
+
+def test_record_fields_read_back_as_they_were_set():
+    record = JobRecord({'status': 'queued', 'progress': 0, 'url': 'u', 'priority': 0, 'options': None})
+    assert record.to_dict() == {
+        'status': 'queued', 'progress': 0, 'url': 'u', 'error': None, 'filename': None, 'cookies_token': None,
+        'priority': 0, 'options': None,
+    }
+    record.update({'title': None, 'attached_to': None, 'speed': 1.5, 'recovered': True})
+    download = record.to_dict()
+    assert 'title' not in download  # Optional fields only show once they have a value
+    assert download['attached_to'] is None and download['speed'] == 1.5
+    assert download['recovered'] is True and record.extra == {'recovered': True}
+
+
+def new_job(store):
+    store.create('job', {'status': 'downloading', 'progress': 0, 'url': 'https://example.com/v'})
+
+
+def test_flush_does_not_overwrite_a_completion_written_meanwhile(tmp_path):
+    store = SQLiteJobStore(str(tmp_path / 'jobs.db'), flush_interval=3600)
+    new_job(store)
+    store.update('job', progress=40)
+
+    # Hold the flush between taking the buffered progress and writing it
+    writing, go = threading.Event(), threading.Event()
+    write = store._write
+
+    def paused_write(updates, hot=False):
+        if hot:
+            writing.set()
+            go.wait(5)
+        return write(updates, hot)
+
+    store._write = paused_write
+    flusher = threading.Thread(target=store.flush)
+    flusher.start()
+    assert writing.wait(5)
+
+    completer = threading.Thread(target=store.update, args=('job',), kwargs={'status': 'completed', 'progress': 100})
+    completer.start()
+    completer.join(0.5)  # Finishes here if nothing holds it back
+    go.set()
+    flusher.join(5)
+    completer.join(5)
+
+    download = store.get('job')
+    assert (download['status'], download['progress']) == ('completed', 100)
+
+
+def test_progress_buffered_in_another_process_does_not_reopen_a_finished_job(tmp_path):
+    path = str(tmp_path / 'jobs.db')
+    web, worker = SQLiteJobStore(path, flush_interval=3600), SQLiteJobStore(path, flush_interval=3600)
+    new_job(web)
+    web.update('job', progress=60)
+    worker.update('job', status='completed', progress=100)
+
+    web.flush()
+    download = worker.get('job')
+    assert (download['status'], download['progress']) == ('completed', 100)
+
+
+def test_progress_lookups_work_from_every_process(tmp_path):
+    path = str(tmp_path / 'jobs.db')
+    new_job(SQLiteJobStore(path, flush_interval=3600))
+
+    readers = [subprocess.Popen([sys.executable, '-c', READER, path], cwd=ROOT, stdout=subprocess.PIPE, text=True)
+               for _ in range(READERS)]
+    writer = subprocess.Popen([sys.executable, '-c', WRITER, path], cwd=ROOT)
+    try:
+        assert writer.wait(30) == 0
+        results = [json.loads(reader.communicate(timeout=30)[0]) for reader in readers]
+    finally:
+        for process in readers + [writer]:
+            process.kill()
+
+    for result in results:
+        assert result['status'] == 'completed'
+        assert result['seen'][-1] == 100
+        assert any(0 < progress < 100 for progress in result['seen']), result  # Saw it move, not just the end
+        assert result['seen'] == sorted(result['seen'])
+
+
+def test_reads_in_the_same_process_see_buffered_progress(tmp_path):
+    store = SQLiteJobStore(str(tmp_path / 'jobs.db'), flush_interval=3600)
+    new_job(store)
+    store.update('job', progress=25)
+    assert store.get('job')['progress'] == 25
+    assert SQLiteJobStore(store.path, flush_interval=3600).get('job')['progress'] == 0  # Not written yet
+    store.flush()
+    assert SQLiteJobStore(store.path, flush_interval=3600).get('job')['progress'] == 25
@@ -0,0 +1,50 @@
+"""Downloads of the same media share one file: who shares with whom, and who takes over when the fetching one goes"""
+
+import io
+
+import app as tubegrab
+from helpers import wait_until
+
+
+def test_follower_takes_over_with_its_priority(monkeypatch):
+    submitted = []
+    monkeypatch.setattr(tubegrab.scheduler, 'submit',
+                        lambda download_id, stage, func, *args, priority=0: submitted.append((download_id, priority)))
+    key = 'handover1|best'
+    for download_id, priority in (('lead1', 0), ('urgent1', 7), ('later1', None)):
+        tubegrab.store.create(download_id, {'status': 'queued', 'progress': 0, 'url': 'https://example.com/v',
+                                            'priority': priority})
+    assert tubegrab.store.claim_media(key, 'lead1')[0] == 'lead'
+    assert tubegrab.store.claim_media(key, 'urgent1') == ('follow', 'lead1')
+    assert tubegrab.store.claim_media(key, 'later1') == ('follow', 'lead1')
+
+    tubegrab.hand_over_media('lead1', key)
+    assert submitted == [('urgent1', 7)]
+    assert tubegrab.store.get('later1')['attached_to'] == 'urgent1'
+
+    tubegrab.hand_over_media('urgent1', key)
+    assert submitted[-1] == ('later1', 0)  # Records without a priority run at the default
+
+
+def test_downloads_with_uploaded_cookies_do_not_share_files_with_anonymous_ones(origin):
+    client = tubegrab.app.test_client()
+    url = origin.url('members.mp4', 64 * 1024)
+    token = client.post('/api/cookies', data={'cookies': (io.BytesIO(b'# member cookies'), 'cookies.txt')},
+                        content_type='multipart/form-data').get_json()['cookies_token']
+
+    def download(**data):
+        download_id = client.post('/api/download', json={'url': url, **data}).get_json()['download_id']
+        wait_until(lambda: tubegrab.store.get(download_id)['status'] in ('completed', 'error'),
+                   what='the download to finish')
+        return tubegrab.store.get(download_id)
+
+    member = download(cookies_token=token)
+    anonymous = download()
+    again = download(cookies_token=token)
+
+    # What the member's cookies fetched isn't handed to anyone else, and the other way round
+    assert member['media_key'] != anonymous['media_key'] == tubegrab.media_key(url)
+    assert member['filename'] != anonymous['filename']
+    assert [path for path, _ in origin.requests].count('/media/members.mp4') == 2
+    # The same cookies share as before
+    assert again['filename'] == member['filename']
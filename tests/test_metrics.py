@@ -0,0 +1,118 @@
+"""Prometheus text output of the metrics registry, /metrics, and the per-job timeline in /api/progress"""
+
+import re
+
+import app as tubegrab
+from helpers import wait_until
+from metrics import CONTENT_TYPE, Registry
+
+
+def test_counters_and_gauges():
+    registry = Registry()
+    jobs = registry.counter('jobs_total', 'Jobs by status', ['status'])
+    running = registry.gauge('running', 'Jobs running now')
+    jobs.inc(status='completed')
+    jobs.inc(2, status='completed')
+    jobs.inc(status='error')
+    running.set(5)
+    running.dec(2)
+    running.inc(0.5)
+
+    assert registry.render() == (
+        '# HELP jobs_total Jobs by status\n'
+        '# TYPE jobs_total counter\n'
+        'jobs_total{status="completed"} 3\n'
+        'jobs_total{status="error"} 1\n'
+        '# HELP running Jobs running now\n'
+        '# TYPE running gauge\n'
+        'running 3.5\n'
+    )
+
+
+def test_label_values_and_help_are_escaped():
+    registry = Registry()
+    errors = registry.counter('errors_total', 'Errors by message\nand a \\ backslash', ['message'])
+    errors.inc(message='say "hi"\\n\n')
+    assert registry.render().splitlines() == [
+        '# HELP errors_total Errors by message\\nand a \\\\ backslash',
+        '# TYPE errors_total counter',
+        'errors_total{message="say \\"hi\\"\\\\n\\n"} 1',
+    ]
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    seconds = registry.histogram('stage_seconds', 'Time per stage', ['stage'], buckets=(1, 0.1, 10))
+    for value in (0.05, 0.1, 0.5, 3, 60):
+        seconds.observe(value, stage='download')
+
+    assert registry.render().splitlines() == [
+        '# HELP stage_seconds Time per stage',
+        '# TYPE stage_seconds histogram',
+        'stage_seconds_bucket{stage="download",le="0.1"} 2',  # Bounds are inclusive
+        'stage_seconds_bucket{stage="download",le="1"} 3',
+        'stage_seconds_bucket{stage="download",le="10"} 4',
+        'stage_seconds_bucket{stage="download",le="+Inf"} 5',
+        'stage_seconds_sum{stage="download"} 63.65',
+        'stage_seconds_count{stage="download"} 5',
+    ]
+
+
+def test_callbacks_are_read_at_scrape_time():
+    registry = Registry()
+    depth = [1]
+    registry.callback('queue_depth', 'Waiting jobs', lambda: [({'stage': 'download'}, depth[0])])
+    registry.callback('broken', 'Fails to read', lambda: 1 / 0, kind='counter')
+    depth[0] = 7
+    # A reading that fails leaves out its samples, not the whole scrape
+    assert registry.render().splitlines() == [
+        '# HELP queue_depth Waiting jobs',
+        '# TYPE queue_depth gauge',
+        'queue_depth{stage="download"} 7',
+        '# HELP broken Fails to read',
+        '# TYPE broken counter',
+    ]
+
+
+def scrape(client):
+    """{sample line without its value: value} of /metrics"""
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.headers['Content-Type'] == CONTENT_TYPE
+    text = response.data.decode()
+    # Every metric is documented before its samples
+    names = re.findall(r'^# TYPE (\S+) (\w+)$', text, re.M)
+    assert len(names) == len(re.findall(r'^# HELP ', text, re.M))
+    samples = {}
+    for line in text.splitlines():
+        if not line.startswith('#'):
+            sample, value = line.rsplit(' ', 1)
+            samples[sample] = float(value)
+    return samples
+
+
+def test_metrics_and_timeline_of_a_converted_download(origin):
+    client = tubegrab.app.test_client()
+    before = scrape(client)
+    download_id = client.post('/api/download', json={'url': origin.url('timeline.webm', 64 * 1024)}).get_json()['download_id']
+    wait_until(lambda: tubegrab.store.get(download_id)['status'] in ('completed', 'error'), what='the download to finish')
+
+    download = client.get(f'/api/progress/{download_id}').get_json()
+    assert download['status'] == 'completed'
+    timeline = download['timeline']
+    assert [stage['stage'] for stage in timeline] == ['queued', 'extract', 'download', 'convert_queued', 'convert']
+    # Back to back, and all ended once the job is over
+    for stage, following in zip(timeline, timeline[1:]):
+        assert stage['start'] <= stage['end'] == following['start']
+    assert timeline[-1]['end'] >= timeline[-1]['start']
+
+    after = scrape(client)
+
+    def added(sample):
+        return after.get(sample, 0) - before.get(sample, 0)
+
+    assert added('tubegrab_jobs_finished_total{status="completed"}') == 1
+    for stage in ('queued', 'extract', 'download', 'convert_queued', 'convert'):
+        assert added(f'tubegrab_stage_seconds_count{{stage="{stage}"}}') == 1
+        assert added(f'tubegrab_stage_seconds_bucket{{stage="{stage}",le="+Inf"}}') == 1
+    assert after['tubegrab_jobs{stage="download",state="running"}'] >= 0
@@ -0,0 +1,41 @@
+"""Concurrent downloads each end up with their own file, even when they all have the same title"""
+
+import os
+
+import app as tubegrab
+from helpers import media_bytes, wait_until
+
+JOBS = 16
+
+
+def test_concurrent_jobs_never_pick_up_each_others_files(origin):
+    client = tubegrab.app.test_client()
+    # Same title for every job, so yt-dlp would write the same name; a distinct size tells
+    # the files apart. The rates differ so the jobs finish close together, in no set order.
+    sizes = {}
+    for i in range(JOBS):
+        size = 96 * 1024 + i * 7919
+        url = origin.url('clip.mp4', size, rate=(1 + i % 4) * 512 * 1024)
+        download_id = client.post('/api/download', json={'url': url}).get_json()['download_id']
+        sizes[download_id] = size
+
+    def finished():
+        downloads = {download_id: tubegrab.store.get(download_id) for download_id in sizes}
+        if all(download['status'] in ('completed', 'error') for download in downloads.values()):
+            return downloads
+
+    downloads = wait_until(finished, timeout=60, what='every download to finish')
+
+    filenames = set()
+    for download_id, download in downloads.items():
+        assert download['status'] == 'completed', download.get('error')
+        filename = download['filename']
+        assert os.path.dirname(filename) == tubegrab.DOWNLOAD_FOLDER
+        with open(filename, 'rb') as f:
+            assert f.read() == media_bytes(0, sizes[download_id]), f'{download_id} got another job\'s file'
+        filenames.add(filename)
+    assert len(filenames) == JOBS
+
+    # Nothing is left behind in the staging directories
+    wait_until(lambda: not any(os.path.exists(tubegrab.staging_dir(download_id)) for download_id in sizes),
+               what='staging directories to be removed')
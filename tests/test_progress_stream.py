@@ -0,0 +1,38 @@
+"""Progress stream: only changed fields per event, and a 'gone' event when the download is removed"""
+
+import json
+
+import app as tubegrab
+
+
+def events(response):
+    """The stream's messages, one per chunk the view yields"""
+    for chunk in response.response:
+        yield chunk.decode() if isinstance(chunk, bytes) else chunk
+
+
+def test_stream_sends_changes_then_gone():
+    tubegrab.store.create('stream1', {'status': 'downloading', 'progress': 10, 'url': 'https://example.com/v',
+                                      'error': None, 'filename': None, 'cookies_token': None})
+    client = tubegrab.app.test_client()
+    response = client.get('/api/progress/stream1/stream', buffered=False)
+    assert response.mimetype == 'text/event-stream'
+    stream = events(response)
+
+    first = next(stream)
+    assert first.startswith('data: ')
+    assert json.loads(first[len('data: '):])['progress'] == 10
+
+    tubegrab.update_download('stream1', progress=55)
+    assert json.loads(next(stream)[len('data: '):]) == {'progress': 55}
+
+    # Cleaned up (or expired) while someone watches: the page stops listening and polling
+    client.delete('/api/cleanup/stream1')
+    assert next(stream) == 'event: gone\ndata: {}\n\n'
+    assert list(stream) == []
+    assert client.get('/api/progress/stream1').status_code == 404
+    response.close()
+
+
+def test_stream_of_an_unknown_download():
+    assert tubegrab.app.test_client().get('/api/progress/missing/stream').status_code == 404
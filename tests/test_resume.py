@@ -0,0 +1,86 @@
+"""A download cut off by a server crash resumes from its .part file after a restart"""
+
+import json
+import os
+import socket
+import urllib.request
+
+import pytest
+
+from helpers import kill_process_group, media_bytes, start_process, wait_until
+
+SIZE = 3 * 1024 * 1024
+RATE = 512 * 1024  # Six seconds a download: plenty of time to kill the server halfway
+
+
+@pytest.fixture
+def server(tmp_path):
+    """Starts gunicorn on app.py over a download folder of its own; returns (start, base URL, folder)"""
+    folder = tmp_path / 'downloads'
+    folder.mkdir()
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    env = dict(os.environ, TUBEGRAB_DOWNLOAD_FOLDER=str(folder))
+    processes = []
+
+    def start():
+        process = start_process(['-m', 'gunicorn', '-w', '1', '--threads', '8', '-b', f'127.0.0.1:{port}', 'app:app'],
+                                env, tmp_path / 'server.log')
+        processes.append(process)
+        wait_until(lambda: stats(f'http://127.0.0.1:{port}'), timeout=30, what='the server to start')
+        return process
+
+    yield start, f'http://127.0.0.1:{port}', folder
+    for process in processes:
+        kill_process_group(process)
+
+
+def stats(base):
+    try:
+        with urllib.request.urlopen(f'{base}/api/disk/stats', timeout=2):
+            return True
+    except OSError:
+        return False
+
+
+def call(base, path, data=None):
+    request = urllib.request.Request(f'{base}{path}', data=data and json.dumps(data).encode(),
+                                     headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return json.load(response)
+
+
+def partial_size(staging):
+    """Bytes in the .part file of a staging directory, 0 until there is one"""
+    try:
+        return sum(os.path.getsize(os.path.join(staging, name)) for name in os.listdir(staging)
+                   if name.endswith('.part'))
+    except OSError:
+        return 0
+
+
+def test_killed_servers_download_resumes_from_its_partial_file(origin, server, tmp_path):
+    start, base, folder = server
+    first = start()
+    download_id = call(base, '/api/download', {'url': origin.url('resume.mp4', SIZE, RATE)})['download_id']
+    staging = folder / '.staging' / download_id
+    wait_until(lambda: partial_size(staging) >= SIZE // 4, timeout=30, what='part of the video on disk')
+    # A crash: the server and its yt-dlp go down together
+    kill_process_group(first)
+    offset = partial_size(staging)
+    assert 0 < offset < SIZE
+
+    start()
+    wait_until(lambda: call(base, f'/api/progress/{download_id}')['status'] in ('completed', 'error'),
+               timeout=60, what='the resumed download to finish')
+
+    download = call(base, f'/api/progress/{download_id}')
+    assert download['status'] == 'completed', (download.get('error'), (tmp_path / 'server.log').read_text())
+    assert download['recovered'] is True
+    assert download['resumed_bytes'] == offset
+    # The restarted download asked only for what was missing
+    ranges = [header for path, header in origin.requests if path == '/media/resume.mp4']
+    assert ranges == [None, f'bytes={offset}-']
+    with open(os.path.join(folder, os.path.basename(download['filename'])), 'rb') as f:
+        assert f.read() == media_bytes(0, SIZE)
@@ -0,0 +1,135 @@
+"""DownloadScheduler: stage limits, priority order, queue positions and cancellation"""
+
+import subprocess
+import threading
+
+from helpers import stub_command, wait_until
+from scheduler import DownloadScheduler
+
+
+class Jobs:
+    """Jobs that block until released, recording their start order and peak concurrency per stage"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.release = threading.Event()
+        self.started = []
+        self.running = {}
+        self.peak = {}
+
+    def job(self, stage, name):
+        def run():
+            with self.lock:
+                self.started.append(name)
+                self.running[stage] = self.running.get(stage, 0) + 1
+                self.peak[stage] = max(self.peak.get(stage, 0), self.running[stage])
+            self.release.wait(10)
+            with self.lock:
+                self.running[stage] -= 1
+        return run
+
+
+def test_stages_have_separate_limits():
+    scheduler = DownloadScheduler({'download': 2, 'convert': 1})
+    jobs = Jobs()
+    for i in range(5):
+        scheduler.submit(f'd{i}', 'download', jobs.job('download', f'd{i}'))
+    for i in range(3):
+        scheduler.submit(f'c{i}', 'convert', jobs.job('convert', f'c{i}'))
+
+    wait_until(lambda: len(jobs.started) == 3, what='both pools to fill')
+    stats = scheduler.stats()
+    assert stats['download'] == {'queued': 3, 'running': 2, 'workers': 2}
+    assert stats['convert'] == {'queued': 2, 'running': 1, 'workers': 1}
+
+    jobs.release.set()
+    wait_until(lambda: len(jobs.started) == 8, what='every job to run')
+    assert jobs.peak == {'download': 2, 'convert': 1}
+
+
+def test_higher_priority_first_then_submission_order():
+    scheduler = DownloadScheduler({'download': 1})
+    jobs = Jobs()
+    scheduler.submit('busy', 'download', jobs.job('download', 'busy'))
+    wait_until(lambda: jobs.started == ['busy'], what='the first job to start')
+
+    for name, priority in (('a', 0), ('b', 0), ('urgent1', 5), ('later', -1), ('urgent2', 5), ('c', 0)):
+        scheduler.submit(name, 'download', jobs.job('download', name), priority=priority)
+
+    expected = ['urgent1', 'urgent2', 'a', 'b', 'c', 'later']
+    assert [scheduler.queue_position(name) for name in expected] == [
+        ('download', position) for position in range(1, 7)
+    ]
+    assert scheduler.queue_position('busy') == (None, None)  # Running, not queued
+
+    jobs.release.set()
+    wait_until(lambda: len(jobs.started) == 7, what='every job to run')
+    assert jobs.started == ['busy'] + expected
+
+
+def test_cancel_queued_job():
+    scheduler = DownloadScheduler({'download': 1})
+    jobs = Jobs()
+    scheduler.submit('busy', 'download', jobs.job('download', 'busy'))
+    scheduler.submit('dropped', 'download', jobs.job('download', 'dropped'))
+    scheduler.submit('kept', 'download', jobs.job('download', 'kept'))
+    wait_until(lambda: jobs.started == ['busy'], what='the first job to start')
+
+    assert scheduler.cancel('dropped')
+    assert scheduler.queue_position('dropped') == (None, None)
+    assert scheduler.queue_position('kept') == ('download', 1)
+
+    jobs.release.set()
+    wait_until(lambda: 'kept' in jobs.started, what='the remaining job to run')
+    assert jobs.started == ['busy', 'kept']
+    assert not scheduler.cancel('unknown')
+
+
+def test_cancel_running_job_kills_its_process(origin, tmp_path):
+    scheduler = DownloadScheduler({'download': 1})
+    finished = {}
+
+    def download():
+        # A slow download: 4 MB at 256 KB/s
+        process = subprocess.Popen(
+            stub_command(origin.url('slow.mp4', 4 * 1024 * 1024, 256 * 1024), str(tmp_path / '%(title)s.%(ext)s')),
+            stdout=subprocess.DEVNULL, start_new_session=True
+        )
+        scheduler.register_process('job', process)
+        finished['returncode'] = process.wait()
+
+    scheduler.submit('job', 'download', download)
+    wait_until(lambda: scheduler.process_count() == 1, what='the download to start')
+    wait_until(lambda: (tmp_path / 'slow.mp4.part').exists(), what='the download to write')
+
+    assert scheduler.cancel('job')
+    wait_until(lambda: 'returncode' in finished, timeout=5, what='the process to die')
+    assert finished['returncode'] < 0  # Killed by a signal, not finished
+    assert not (tmp_path / 'slow.mp4').exists()
+    wait_until(lambda: scheduler.stats()['download']['running'] == 0, what='the worker to come free')
+    assert scheduler.process_count() == 0
+
+
+def test_process_registered_after_cancel_is_killed(origin, tmp_path):
+    """A cancel that lands between the job starting and its process starting still stops it"""
+    scheduler = DownloadScheduler({'download': 1})
+    started = threading.Event()
+    go = threading.Event()
+    finished = {}
+
+    def download():
+        started.set()
+        go.wait(10)
+        process = subprocess.Popen(
+            stub_command(origin.url('late.mp4', 4 * 1024 * 1024, 256 * 1024), str(tmp_path / '%(title)s.%(ext)s')),
+            stdout=subprocess.DEVNULL, start_new_session=True
+        )
+        scheduler.register_process('job', process)
+        finished['returncode'] = process.wait()
+
+    scheduler.submit('job', 'download', download)
+    assert started.wait(5)
+    assert scheduler.cancel('job')
+    go.set()
+    wait_until(lambda: 'returncode' in finished, timeout=5, what='the process to die')
+    assert finished['returncode'] < 0
@@ -0,0 +1,73 @@
+"""Info extraction: uploaded and browser cookies are separate strategies with their own breakers"""
+
+import pytest
+
+import app as tubegrab
+from strategies import StrategyChain
+
+
+@pytest.fixture
+def cookies(monkeypatch, tmp_path):
+    """An uploaded cookies file that has expired and a browser export that works"""
+    uploaded = tmp_path / 'uploaded.txt'
+    uploaded.write_text('expired upload')
+    browser = tmp_path / 'browser.txt'
+    browser.write_text('logged-in browser')
+    monkeypatch.setattr(tubegrab.cookie_resolver, 'browser_cookies', lambda: str(browser))
+    return str(uploaded)
+
+
+@pytest.fixture
+def chain(monkeypatch):
+    chain = StrategyChain(threshold=2)
+    monkeypatch.setattr(tubegrab, 'extraction_strategies', chain)
+    return chain
+
+
+@pytest.fixture
+def youtube(monkeypatch):
+    """
+    Turns away the expired upload and requests without cookies; the desktop user
+    agent gets through with any cookies
+    """
+
+    class YoutubeDL:
+        def __init__(self, opts):
+            self.opts = opts
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def extract_info(self, url, download=False):
+            if 'cookiefile' not in self.opts:
+                raise RuntimeError('Sign in to confirm you are not a bot')
+            if 'user_agent' in self.opts:
+                return {'title': 'desktop'}
+            with open(self.opts['cookiefile']) as f:
+                if f.read() == 'expired upload':
+                    raise RuntimeError('Cookies are no longer valid')
+            return {'title': 'browser'}
+
+        def sanitize_info(self, info):
+            return info
+
+    monkeypatch.setattr(tubegrab.yt_dlp, 'YoutubeDL', YoutubeDL)
+
+
+def test_failing_upload_does_not_trip_browser_cookies(cookies, chain, youtube):
+    url = 'https://www.youtube.com/watch?v=strategy1'
+    # One user's expired upload keeps failing while everyone else's lookups go through
+    for _ in range(2):
+        assert tubegrab.extract_video_info(url, cookies)['title'] == 'desktop'
+        assert tubegrab.extract_video_info(url)['title'] == 'browser'
+
+    strategies = chain.stats()['strategies']
+    assert strategies['uploaded_cookies']['breaker'] == 'open'
+    assert strategies['browser_cookies']['breaker'] == 'closed'
+    assert strategies['browser_cookies']['successes'] == 2
+
+    # The open breaker of the upload doesn't keep the others from the browser cookies
+    assert tubegrab.extract_video_info(url)['title'] == 'browser'
@@ -0,0 +1,39 @@
+"""/api/stream: a progressive download's bytes as they arrive, without its staging path leaking out"""
+
+import app as tubegrab
+from helpers import media_bytes, wait_until
+
+SIZE = 1024 * 1024
+RATE = 256 * 1024  # Four seconds: the stream catches up with the writer and waits for more
+
+
+def test_stream_while_downloading(origin):
+    client = tubegrab.app.test_client()
+    download_id = client.post('/api/download', json={'url': origin.url('stream.mp4', SIZE, RATE)}).get_json()['download_id']
+    wait_until(lambda: tubegrab.store.get(download_id).get('progressive'), what='the download to be streamable')
+
+    progress = client.get(f'/api/progress/{download_id}').get_json()
+    assert progress['status'] == 'downloading' and progress['progressive'] is True
+    assert 'stream_file' not in progress
+
+    response = client.get(f'/api/stream/{download_id}', buffered=False)
+    assert response.status_code == 200
+    assert 'stream.mp4' in response.headers['Content-Disposition']
+    received = b''.join(response.response)
+    response.close()
+    assert received == media_bytes(0, SIZE)
+
+    wait_until(lambda: tubegrab.store.get(download_id)['status'] == 'completed', what='the download to complete')
+    download = tubegrab.store.get(download_id)
+    # The staging file is gone; the finished file is /api/file's
+    assert download.get('stream_file') is None and download.get('progressive') is None
+    assert 'stream_file' not in client.get(f'/api/progress/{download_id}').get_json()
+    assert client.get(f'/api/stream/{download_id}').data == media_bytes(0, SIZE)
+
+
+def test_stream_of_a_queued_download():
+    tubegrab.store.create('notyet1', {'status': 'queued', 'progress': 0, 'url': 'https://example.com/v',
+                                      'error': None, 'filename': None, 'cookies_token': None})
+    response = tubegrab.app.test_client().get('/api/stream/notyet1')
+    assert response.status_code == 409
+    assert response.get_json()['progressive'] is False
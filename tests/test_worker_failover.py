@@ -0,0 +1,80 @@
+"""A download whose worker is killed mid-job is taken over and finished by another worker"""
+
+import os
+
+import pytest
+
+from helpers import kill_process_group, media_bytes, process_alive, start_process, wait_until
+from jobqueue import SQLiteJobQueue
+from jobstore import SQLiteJobStore
+
+SIZE = 3 * 1024 * 1024
+RATE = 384 * 1024  # Eight seconds a download: the orphan is still at it when its lease runs out
+LEASE_SECONDS = 3
+
+ENQUEUE = 'import sys, app; print(app.queue_download(sys.argv[1], None, None))'
+
+
+@pytest.fixture
+def queue_env(tmp_path):
+    folder = tmp_path / 'downloads'
+    folder.mkdir()
+    return dict(
+        os.environ,
+        TUBEGRAB_EXECUTION='queue',
+        TUBEGRAB_JOB_STORE='sqlite',
+        TUBEGRAB_DOWNLOAD_FOLDER=str(folder),
+        TUBEGRAB_LEASE_SECONDS=str(LEASE_SECONDS),
+    )
+
+
+def queued_entry(db_path, download_id):
+    """(worker, child pid) of the download's queue entry, or None once it is done"""
+    queue = SQLiteJobQueue(db_path)
+    return queue._connections.get().execute(
+        'SELECT worker, pid FROM queue WHERE id = ?', (download_id,)
+    ).fetchone()
+
+
+def running_child(db_path, download_id):
+    """pid of the yt-dlp the download's worker runs, once it has recorded one"""
+    entry = queued_entry(db_path, download_id)
+    return entry[1] if entry else None
+
+
+def test_killed_workers_job_is_taken_over(origin, queue_env, tmp_path):
+    db_path = os.path.join(queue_env['TUBEGRAB_DOWNLOAD_FOLDER'], '.tubegrab.db')
+    log = tmp_path / 'workers.log'
+    url = origin.url('failover.mp4', SIZE, RATE)
+
+    enqueue = start_process(['-c', ENQUEUE, url], queue_env, log)
+    assert enqueue.wait(30) == 0, log.read_text()
+    download_id = log.read_text().split()[-1]
+    store = SQLiteJobStore(db_path)
+
+    first = start_process(['worker.py'], queue_env, log)
+    try:
+        wait_until(lambda: store.get(download_id)['progress'] > 0, timeout=30, what='the first worker to download')
+        orphan = wait_until(lambda: running_child(db_path, download_id), what='the yt-dlp pid')
+    finally:
+        kill_process_group(first)
+    # yt-dlp runs in its own session, so it outlives its worker
+    assert process_alive(orphan)
+
+    second = start_process(['worker.py'], queue_env, log)
+    try:
+        wait_until(lambda: not process_alive(orphan), timeout=LEASE_SECONDS * 4,
+                   what='the new worker to kill the orphaned yt-dlp')
+        wait_until(lambda: store.get(download_id)['status'] in ('completed', 'error'), timeout=60,
+                   what='the download to finish')
+        # The worker records the job's status before it takes the entry off the queue
+        wait_until(lambda: queued_entry(db_path, download_id) is None, what='the queue entry to be removed')
+    finally:
+        kill_process_group(second)
+
+    download = store.get(download_id)
+    assert download['status'] == 'completed', (download.get('error'), log.read_text())
+    with open(download['filename'], 'rb') as f:
+        assert f.read() == media_bytes(0, SIZE)
+    # Both workers fetched the video, the second after the first was killed
+    assert [path for path, _ in origin.requests].count('/media/failover.mp4') >= 2
@@ -0,0 +1,98 @@
+"""
+TubeGrab - Download worker
+Runs downloads and MP4 conversions claimed from the shared SQLite queue, so they
+can be spread over more processes (and machines sharing the download folder)
+than the web server runs on. Start the web tier with TUBEGRAB_EXECUTION=queue,
+then any number of workers:
+
+    python worker.py
+
+A worker holds a lease on each job it runs and renews it with heartbeats.
+If a worker dies its leases run out and another worker takes the jobs over;
+yt-dlp picks up the .part files left in the job's staging directory.
+"""
+
+import os
+import signal
+import threading
+import time
+
+os.environ.setdefault('TUBEGRAB_EXECUTION', 'queue')
+
+import app as tubegrab
+from jobqueue import kill_orphan
+
+LEASE_SECONDS = int(os.environ.get('TUBEGRAB_LEASE_SECONDS', 30))
+POLL_SECONDS = 1.0
+MAX_ATTEMPTS = int(os.environ.get('TUBEGRAB_MAX_ATTEMPTS', 3))
+
+
+def run_stage(scheduler, stage):
+    """Claim and run jobs of one stage, forever"""
+    queue = scheduler.queue
+    while True:
+        claimed = queue.claim(scheduler.worker, stage, LEASE_SECONDS)
+        if claimed is None:
+            time.sleep(POLL_SECONDS)
+            continue
+
+        download_id, args, attempts, previous_owner = claimed
+        try:
+            if previous_owner:
+                # Taken over from a worker that stopped heartbeating - make sure its
+                # yt-dlp/ffmpeg isn't still writing into the same staging directory
+                kill_orphan(previous_owner)
+
+            if attempts > MAX_ATTEMPTS:
+                tubegrab.fail_download(
+                    download_id, f'Gave up after {MAX_ATTEMPTS} attempts (worker crashed or was killed)'
+                )
+            else:
+                tubegrab.STAGE_HANDLERS[stage](*args)
+        except Exception:
+            pass  # Handlers record their own errors
+        finally:
+            queue.complete(download_id, stage, scheduler.worker)
+
+
+def heartbeat(scheduler):
+    while True:
+        time.sleep(LEASE_SECONDS / 3)
+        try:
+            scheduler.queue.heartbeat(scheduler.worker, LEASE_SECONDS)
+        except Exception:
+            pass  # Database busy - the next beat still comes well before the lease runs out
+
+
+def main():
+    scheduler = tubegrab.scheduler
+    if tubegrab.EXECUTION_MODE != 'queue':
+        raise SystemExit('worker.py needs TUBEGRAB_EXECUTION=queue')
+
+    limits = {'download': tubegrab.MAX_DOWNLOADS, 'convert': tubegrab.MAX_CONVERSIONS}
+    for stage, workers in limits.items():
+        for i in range(workers):
+            threading.Thread(
+                target=run_stage, args=(scheduler, stage), name=f'tubegrab-{stage}-{i}', daemon=True
+            ).start()
+    threading.Thread(target=heartbeat, args=(scheduler,), name='tubegrab-heartbeat', daemon=True).start()
+    if tubegrab.ytdlp_pool is not None:
+        tubegrab.ytdlp_pool.prewarm()
+
+    print(f'TubeGrab worker {scheduler.worker} running '
+          f'{limits["download"]} download / {limits["convert"]} conversion slots')
+    # Stop the same way on Ctrl+C and on SIGTERM from a process manager
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        # Hand our jobs straight back instead of making others wait for the leases to expire,
+        # and exit before the job threads can record the killed children as failures
+        scheduler.queue.release(scheduler.worker)
+        scheduler.kill_all()
+        os._exit(0)
+
+
+if __name__ == '__main__':
+    main()